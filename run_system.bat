@@ -21,7 +21,7 @@ if errorlevel 1 (
 )
 
 echo [3/4] Building indexes...
-python src/build_index_fixed.py
+python src/build_index_fixed.py --incremental
 if errorlevel 1 (
     echo WARNING: Failed to build indexes. Continuing anyway...
 )
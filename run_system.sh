@@ -21,7 +21,7 @@ if [ $? -ne 0 ]; then
 fi
 
 echo "[3/4] Building indexes..."
-python src/build_index_fixed.py
+python src/build_index_fixed.py --incremental
 if [ $? -ne 0 ]; then
     echo "WARNING: Failed to build indexes. Continuing anyway..."
 fi
@@ -1,20 +1,55 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from .runtime_config import configure_runtime, get_stats as runtime_stats
+# Chia core giữa các uvicorn worker và đặt số thread torch/FAISS/OpenMP/BLAS trước khi numpy/faiss được import
+RUNTIME = configure_runtime()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List
+from contextlib import asynccontextmanager
 from .faiss_pipeline import FaissMultiModalSearch
-from .text_pipeline import preprocess, get_embedding as get_text_emb
-from .image_pipeline import get_image_embedding, clip_processor, clip_model
+from .meta_store import meta_store_path
+from .snapshot import current_path
+from .sharded_search import ShardedSearch, SHARD_TIMEOUT_MS
+from .image_pipeline import embed_text_batch, preprocess_image, embed_pixel_values, decode_image_bytes, load_encoder, is_clip_loaded, CLIP_BACKEND, MAX_IMAGE_PIXELS, CLIP_EMBED_DIM, CLIP_MODEL_NAME, TEXT_PREPROCESS_VERSION, IMAGE_PREPROCESS_VERSION
+from .embedding_cache import EmbeddingCache, DEFAULT_CACHE_DIR, content_key, text_hash, bytes_hash
+from .query_cache import LRUCache, normalize_query
+from .micro_batcher import MicroBatcher
+from .bounded_executor import BoundedExecutor, ExecutorSaturated
+from .multi_search import MultiIndexSearch
+from .thumbnail_store import ThumbnailStore, THUMBNAILS_PATH, thumbnail_index_path, thumbnail_manifest_path, thumbnail_files, thumbnail_media_type
+from .media import RESPONSE_MODES, image_url, frame_url, resolve_media_file, file_response, bytes_response
+import hmac
 import os
 import logging
+import threading
+import time
 from fastapi.middleware.cors import CORSMiddleware
 import base64
-import torch
+import numpy as np
+from PIL import Image
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Challenge HCM API", version="1.0.0")
+# Model CLIP và FAISS index được load lazy (request đầu tiên) hoặc bởi warm-up lúc startup:
+# API_WARMUP=background (mặc định): warm-up ở thread riêng, server nhận request ngay và /ready báo khi xong
+# API_WARMUP=block: startup chờ warm-up xong mới nhận request; API_WARMUP=0: không warm-up
+API_WARMUP = os.environ.get("API_WARMUP", "background")
+
+@asynccontextmanager
+async def lifespan(app):
+    if API_WARMUP == "block":
+        await run_in_threadpool(warmup)
+    elif API_WARMUP not in ("", "0"):
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    if INDEX_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_indexes, args=(INDEX_WATCH_INTERVAL,), name="index-watcher", daemon=True).start()
+    yield
+
+app = FastAPI(title="AI Challenge HCM API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -25,34 +60,353 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Khởi tạo searcher cho từng modal
-try:
-    text_searcher = FaissMultiModalSearch(dim=768, index_path="data/faiss_text.bin", meta_path="data/faiss_text.pkl")
-    text_searcher.load()
-    logger.info("✅ Text searcher loaded successfully")
-except Exception as e:
-    logger.error(f"❌ Error loading text searcher: {e}")
-    text_searcher = None
-
-try:
-    image_searcher = FaissMultiModalSearch(dim=512, index_path="data/faiss_image.bin", meta_path="data/faiss_image.pkl")
-    image_searcher.load()
-    logger.info("✅ Image searcher (video frames) loaded successfully")
-except Exception as e:
-    logger.error(f"❌ Error loading image searcher (video frames): {e}")
-    image_searcher = None
-
-try:
-    static_image_searcher = FaissMultiModalSearch(dim=512, index_path="data/faiss_image_img.bin", meta_path="data/faiss_image_img.pkl")
-    static_image_searcher.load()
-    logger.info("✅ Static image searcher loaded successfully")
-except Exception as e:
-    logger.error(f"❌ Error loading static image searcher: {e}")
-    static_image_searcher = None
+# nprobe (IVF) / efSearch (HNSW) lưu sẵn trong file index, env chỉ dùng để ghi đè khi cần đổi recall/latency
+# INDEX_LOAD_MODE=mmap (mặc định): index được memory-map read-only, nhiều uvicorn worker dùng chung page cache thay vì mỗi worker một bản trong RAM
+SEARCH_PARAMS = dict(nprobe=int(os.environ.get("FAISS_NPROBE", "0")) or None, ef_search=int(os.environ.get("FAISS_EF_SEARCH", "0")) or None,
+                     load_mode=os.environ.get("INDEX_LOAD_MODE", "mmap"),
+                     # Index nén (sq8/opq_pq) build với --store-vectors: lấy top_k * RERANK_FACTOR candidate rồi re-rank exact
+                     rerank_factor=int(os.environ.get("RERANK_FACTOR", "0")))
+
+# IMAGE_SHARDS=data/faiss_image.shards.json: image index (video frames) chia shard bằng sharded_search.py, search scatter-gather
+# trên các shard local hoặc shard_server ở node khác; shard chậm hơn SHARD_TIMEOUT_MS bị bỏ qua (kết quả partial)
+IMAGE_SHARDS = os.environ.get("IMAGE_SHARDS", "")
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT_MS", str(SHARD_TIMEOUT_MS)))
+
+# (index_path, meta_path) của từng modal
+INDEX_FILES = {
+    "text": ("data/faiss_text.bin", "data/faiss_text.pkl"),
+    "image": ("data/faiss_image.bin", "data/faiss_image.pkl"),
+    "static_image": ("data/faiss_image_img.bin", "data/faiss_image_img.pkl")
+}
+
+# Hot reload: POST /admin/reload (header X-Admin-Token, endpoint bị tắt khi chưa đặt ADMIN_TOKEN) hoặc INDEX_WATCH_INTERVAL > 0
+# để tự reload khi file index thay đổi (poll mỗi INDEX_WATCH_INTERVAL giây)
+INDEX_WATCH_INTERVAL = float(os.environ.get("INDEX_WATCH_INTERVAL", "0"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Searcher cho từng modal + thumbnail store, load ở lần đầu cần (load_indexes), thay thế bởi reload_indexes
+text_searcher = None
+image_searcher = None
+static_image_searcher = None
+thumbnail_store = None
+_indexes_loaded = False
+_indexes_lock = threading.Lock()
+# Tăng mỗi lần các index được (re)load; là một phần key của response cache nên kết quả của index cũ không được trả lại
+index_generation = 0
+_index_signature = None
+_reload_lock = threading.Lock()
+_reload_state = {"reloads": 0, "in_progress": False, "last_reload_at": None, "last_seconds": None, "last_error": None}
+_warmup_state = {"done": False, "seconds": None, "error": None}
+
+def _load_searcher(name, index_path, meta_path):
+    try:
+        # Text index cũng được build bằng CLIP (build_index_fixed.py) nên cùng dim với image index
+        # Snapshot build bằng model CLIP khác (hoặc không khớp manifest) bị từ chối thay vì trả kết quả sai
+        searcher = FaissMultiModalSearch(dim=CLIP_EMBED_DIM, index_path=index_path, meta_path=meta_path, model_name=CLIP_MODEL_NAME, **SEARCH_PARAMS)
+        searcher.load()
+        logger.info(f"✅ {name} loaded successfully")
+        return searcher
+    except Exception as e:
+        logger.error(f"❌ Error loading {name.lower()}: {e}")
+        return None
+
+def _load_sharded_searcher(name, manifest_path):
+    try:
+        searcher = ShardedSearch.from_manifest(manifest_path, dim=CLIP_EMBED_DIM, timeout_ms=SHARD_TIMEOUT, **SEARCH_PARAMS)
+        logger.info(f"✅ {name} loaded successfully ({len(searcher.shards)} shards)")
+        return searcher
+    except Exception as e:
+        logger.error(f"❌ Error loading {name.lower()}: {e}")
+        return None
+
+def _load_thumbnail_store(version=None):
+    # Thumbnail frame video build sẵn theo vector ID (build_index_fixed.py --thumbnail-size), cùng snapshot version với image index
+    try:
+        files = thumbnail_files(THUMBNAILS_PATH, version)
+        store = ThumbnailStore(*files) if files and os.path.exists(files[1]) else None
+        if store:
+            logger.info(f"✅ Thumbnail store loaded ({len(store)} frames)")
+        return store
+    except Exception as e:
+        logger.error(f"❌ Error loading thumbnail store: {e}")
+        return None
+
+def _load_index_set():
+    """Load một bộ (text, image, static_image, thumbnail_store) mới, không đụng tới bộ đang phục vụ request"""
+    text = _load_searcher("Text searcher", *INDEX_FILES["text"])
+    if IMAGE_SHARDS:
+        image = _load_sharded_searcher("Image searcher (video frames, sharded)", IMAGE_SHARDS)
+    else:
+        image = _load_searcher("Image searcher (video frames)", *INDEX_FILES["image"])
+    static_image = _load_searcher("Static image searcher", *INDEX_FILES["static_image"])
+    return text, image, static_image, _load_thumbnail_store(getattr(image, "snapshot_version", None))
+
+def index_files_signature():
+    """(path, mtime_ns, size) của các file index/metadata/CURRENT snapshot/thumbnail/manifest shard, dùng để phát hiện index được build lại"""
+    paths = [path for index_path, meta_path in INDEX_FILES.values() for path in (index_path, meta_store_path(meta_path), current_path(index_path))]
+    paths.extend([thumbnail_index_path(THUMBNAILS_PATH), thumbnail_manifest_path(THUMBNAILS_PATH)])
+    if IMAGE_SHARDS:
+        paths.append(IMAGE_SHARDS)
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+def load_indexes():
+    """Load các FAISS index và thumbnail store một lần (thread-safe)"""
+    global text_searcher, image_searcher, static_image_searcher, thumbnail_store, _indexes_loaded, _index_signature
+    if _indexes_loaded:
+        return
+    with _indexes_lock:
+        if _indexes_loaded:
+            return
+        _index_signature = index_files_signature()
+        text_searcher, image_searcher, static_image_searcher, thumbnail_store = _load_index_set()
+        bump_index_generation()
+        _indexes_loaded = True
+
+def reload_indexes():
+    """
+    Hot reload: load bộ index mới ở thread hiện tại (request vẫn được phục vụ bằng bộ cũ), warm-up rồi swap reference.
+    Request đang chạy giữ reference tới searcher cũ nên hoàn thành trên phiên bản cũ; CLIP không bị load lại.
+    Index nào load lỗi thì giữ bản đang chạy. Trả về False nếu đang có một lần reload khác.
+    """
+    global text_searcher, image_searcher, static_image_searcher, thumbnail_store, _indexes_loaded, _index_signature
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    _reload_state["in_progress"] = True
+    start_time = time.time()
+    try:
+        signature = index_files_signature()
+        text, image, static_image, thumbs = _load_index_set()
+        # Chạm vào index mới một lần để trang mmap nóng trước khi nhận traffic
+        query = np.ones((1, CLIP_EMBED_DIM), dtype=np.float32)
+        for searcher in (text, image, static_image):
+            if searcher is not None and searcher.ntotal > 0:
+                searcher.search_batch(query, top_k=1)
+        with _indexes_lock:
+            if text is not None:
+                text_searcher = text
+            if image is not None:
+                # Thumbnail đi cùng image index: snapshot mới chưa có thumbnail thì dùng fallback decode video thay vì thumbnail cũ
+                image_searcher = image
+                thumbnail_store = thumbs
+            if static_image is not None:
+                static_image_searcher = static_image
+            _index_signature = signature
+            _indexes_loaded = True
+            bump_index_generation()
+        failed = [name for name, searcher in (("text", text), ("image", image), ("static_image", static_image)) if searcher is None]
+        _reload_state["reloads"] += 1
+        _reload_state["last_error"] = f"Failed to load {', '.join(failed)}, kept previous version" if failed else None
+        logger.info(f"🔄 Indexes reloaded in {time.time() - start_time:.2f}s (generation {index_generation})")
+    except Exception as e:
+        _reload_state["last_error"] = str(e)
+        logger.error(f"❌ Index reload failed: {e}")
+    finally:
+        _reload_state["last_reload_at"] = time.time()
+        _reload_state["last_seconds"] = round(time.time() - start_time, 2)
+        _reload_state["in_progress"] = False
+        _reload_lock.release()
+    return True
+
+def watch_indexes(interval):
+    """Poll mtime/size của file index mỗi interval giây, reload khi file đã đổi và không còn thay đổi giữa hai lần poll (build đã ghi xong)"""
+    last = None
+    while True:
+        time.sleep(interval)
+        if not _indexes_loaded:
+            continue
+        signature = index_files_signature()
+        if signature != _index_signature and signature == last:
+            logger.info("🔄 Index files changed, reloading...")
+            reload_indexes()
+        last = signature
+
+async def ensure_indexes():
+    # Load lần đầu chạy trên threadpool để không block event loop
+    if not _indexes_loaded:
+        await run_in_threadpool(load_indexes)
+
+def warmup():
+    """Load index + CLIP và chạy thử một lần forward/search để request đầu tiên không phải chịu cold start"""
+    start_time = time.time()
+    try:
+        load_indexes()
+        load_encoder()
+        get_embedding_cache()
+        emb = embed_text_batch(["warmup"])
+        embed_pixel_values([preprocess_image(np.zeros((224, 224, 3), dtype=np.uint8))])
+        for searcher in (text_searcher, image_searcher, static_image_searcher):
+            if searcher is not None and searcher.ntotal > 0:
+                searcher.search_batch(emb, top_k=1)
+        _warmup_state["seconds"] = round(time.time() - start_time, 2)
+        logger.info(f"🔥 Warm-up done in {_warmup_state['seconds']}s")
+    except Exception as e:
+        _warmup_state["error"] = str(e)
+        logger.error(f"❌ Warm-up failed: {e}")
+    finally:
+        _warmup_state["done"] = True
+
+# /media/*: ảnh tĩnh và thumbnail frame phục vụ qua HTTP (ETag/Range/Cache-Control) thay vì base64 trong JSON
+MEDIA_IMAGE_DIRS = ("data/images", "data/vid")
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", "3600"))
+
+# Ảnh upload được decode trong memory, từ chối ảnh vượt số pixel này trước khi decode
+UPLOAD_MAX_PIXELS = int(os.environ.get("UPLOAD_MAX_PIXELS", str(MAX_IMAGE_PIXELS)))
+
+# Embedding cache dùng chung với build_index_fixed.py (chỉ đọc để không tranh chấp ghi với build),
+# mở ở lần đầu cần (query cache miss hoặc warm-up) thay vì lúc import
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", DEFAULT_CACHE_DIR)
+embedding_cache = None
+_embedding_cache_opened = False
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """EmbeddingCache chỉ đọc, mở một lần (thread-safe); None nếu không mở được"""
+    global embedding_cache, _embedding_cache_opened
+    if not _embedding_cache_opened:
+        with _embedding_cache_lock:
+            if not _embedding_cache_opened:
+                try:
+                    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, dim=512, readonly=True)
+                    logger.info(f"✅ Embedding cache loaded ({len(embedding_cache)} entries)")
+                except Exception as e:
+                    logger.error(f"❌ Error loading embedding cache: {e}")
+                _embedding_cache_opened = True
+    return embedding_cache
+
+# LRU cache cho query đã chuẩn hóa: embedding và kết quả search theo từng index
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "0")) or None
+query_embedding_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+search_hit_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+# Cache toàn bộ response của /search_text và /search_image theo fingerprint request (query chuẩn hóa hoặc hash ảnh upload,
+# top_k, response_mode) + index_generation: request lặp lại không phải embed, search và encode base64 lại
+# Response base64 có thể vài MB: ngoài số entry còn giới hạn tổng kích thước (RESPONSE_CACHE_MAX_MB mỗi worker)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_MAX_MB = float(os.environ.get("RESPONSE_CACHE_MAX_MB", "64"))
+response_cache = LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=QUERY_CACHE_TTL, maxbytes=int(RESPONSE_CACHE_MAX_MB * 1024 * 1024))
+
+def bump_index_generation():
+    """Index đã thay đổi: đổi generation và bỏ các kết quả search/response đã cache của index cũ"""
+    global index_generation
+    index_generation += 1
+    search_hit_cache.clear()
+    response_cache.clear()
+
+async def cached_response(cache_key, fn, *args):
+    """Trả response đã cache nếu có, ngược lại chạy fn trên search_executor và cache kết quả (lỗi không được cache)"""
+    result = response_cache.get(cache_key)
+    if result is None:
+        result = await search_executor.run(fn, *args)
+        response_cache.put(cache_key, result)
+    return result
+
+# Executor riêng cho inference + search (có giới hạn), request vượt giới hạn bị trả 503 ngay
+SEARCH_MAX_CONCURRENCY = int(os.environ.get("SEARCH_MAX_CONCURRENCY", "8"))
+SEARCH_MAX_QUEUE = int(os.environ.get("SEARCH_MAX_QUEUE", "32"))
+search_executor = BoundedExecutor(SEARCH_MAX_CONCURRENCY, SEARCH_MAX_QUEUE, name="search")
+
+# Micro-batching: các request đồng thời được gom thành một lần forward CLIP.
+# Mỗi request chờ CLIP batcher trên một thread của search_executor, nên một batch CLIP không bao giờ lớn hơn SEARCH_MAX_CONCURRENCY:
+# batch size mặc định bằng số thread đó, giá trị lớn hơn bị cắt (muốn batch lớn hơn thì tăng SEARCH_MAX_CONCURRENCY)
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", str(SEARCH_MAX_CONCURRENCY)))
+if MICROBATCH_MAX_SIZE > SEARCH_MAX_CONCURRENCY:
+    logger.warning(f"⚠️ MICROBATCH_MAX_SIZE={MICROBATCH_MAX_SIZE} can never fill with SEARCH_MAX_CONCURRENCY={SEARCH_MAX_CONCURRENCY}, capping to {SEARCH_MAX_CONCURRENCY}")
+    MICROBATCH_MAX_SIZE = SEARCH_MAX_CONCURRENCY
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "5"))
+text_batcher = MicroBatcher(embed_text_batch, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS, name="clip-text-batcher")
+image_batcher = MicroBatcher(embed_pixel_values, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS, name="clip-image-batcher")
+
+# Search nhiều index cho một request chạy song song (multi_searcher); pool riêng cho các nhóm searcher trong một
+# micro-batch (search_group_pool) để thread đang chờ batcher không chiếm chỗ của batcher
+MULTI_SEARCH_WORKERS = int(os.environ.get("MULTI_SEARCH_WORKERS", "8"))
+multi_searcher = MultiIndexSearch(MULTI_SEARCH_WORKERS, name="multi-search")
+search_group_pool = MultiIndexSearch(MULTI_SEARCH_WORKERS, name="faiss-group")
+
+def run_search_batch(payloads):
+    """
+    payload = (searcher, emb, top_k): gom theo searcher, mỗi searcher chỉ gọi một lần search_batch, các searcher chạy song song.
+    Searcher lỗi chỉ làm lỗi các request của nhóm đó (trả Exception ở vị trí tương ứng), các index khác vẫn trả kết quả.
+    """
+    results = [None] * len(payloads)
+    groups = {}
+    for i, (searcher, _, _) in enumerate(payloads):
+        groups.setdefault(id(searcher), []).append(i)
+
+    def search_group(positions):
+        searcher = payloads[positions[0]][0]
+        top_k = max(payloads[i][2] for i in positions)
+        try:
+            batch = searcher.search_batch(np.stack([payloads[i][1] for i in positions]), top_k=top_k)
+            group_results = [batch.to_dicts(q)[:payloads[i][2]] for q, i in enumerate(positions)]
+        except Exception as e:
+            logger.error(f"❌ Batched search failed for {len(positions)} queries: {e}")
+            group_results = [e] * len(positions)
+        for i, result in zip(positions, group_results):
+            results[i] = result
+
+    search_group_pool.run_parallel([lambda positions=positions: search_group(positions) for positions in groups.values()])
+    return results
+
+# Các query FAISS đồng thời cũng được gom batch (một lần index.search cho cả ma trận query)
+search_batcher = MicroBatcher(run_search_batch, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS, name="faiss-search-batcher")
+
+def batched_search(searcher, emb, top_k):
+    return search_batcher((searcher, emb, top_k))
+
+def get_clip_text_embedding(query):
+    query_key = normalize_query(query)
+    emb = query_embedding_cache.get(query_key)
+    if emb is not None:
+        return emb
+    key = content_key(CLIP_MODEL_NAME, TEXT_PREPROCESS_VERSION, text_hash(query.strip()))
+    cache = get_embedding_cache()
+    emb = cache.get(key) if cache else None
+    if emb is None:
+        # CLIP tokenizer lowercase + tách theo khoảng trắng nên query chuẩn hóa cho cùng embedding
+        emb = text_batcher(query_key)
+    query_embedding_cache.put(query_key, emb)
+    return emb
+
+def cached_search(index_name, searcher, query, emb, top_k):
+    """
+    Search có cache theo (index, query chuẩn hóa). Cache giữ kết quả của top_k lớn nhất đã search,
+    nên top_k nhỏ hơn (vd. image_top_k so với top_k của text) dùng lại prefix thay vì search lại.
+    Key gồm index_generation và searcher đã dùng: search đang chạy trên index cũ lúc reload ghi vào key cũ,
+    không bao giờ được trả cho request trên index mới.
+    """
+    if top_k <= 0:
+        return []
+    cache_key = (index_name, index_generation, id(searcher), normalize_query(query))
+    entry = search_hit_cache.get(cache_key)
+    if entry is None or entry[0] < top_k:
+        entry = (top_k, batched_search(searcher, emb, top_k))
+        search_hit_cache.put(cache_key, entry)
+    return [dict(r) for r in entry[1][:top_k]]
+
+def text_search_fetch(index_name, searcher, query, emb):
+    """Nguồn cho multi_searcher: search có cache theo query, None nếu index chưa load được"""
+    if searcher is None:
+        return None
+    return lambda k: cached_search(index_name, searcher, query, emb, k)
+
+def image_search_fetch(searcher, emb):
+    if searcher is None:
+        return None
+    return lambda k: batched_search(searcher, emb, k)
 
 class TextQuery(BaseModel):
     query: str
     top_k: int = 5
+    # "url": trả image_url (/media/...) thay vì nhúng image_base64
+    response_mode: str = "base64"
 
     class Config:
         schema_extra = {
@@ -62,8 +416,15 @@ class TextQuery(BaseModel):
             }
         }
 
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    # Từ chối sớm khi quá tải thay vì để request chờ đến timeout
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
+
 @app.post("/search_text")
-def search_text(req: TextQuery):
+async def search_text(req: TextQuery):
+    await ensure_indexes()
     if text_searcher is None:
         raise HTTPException(status_code=503, detail="Text searcher not available")
     
@@ -72,56 +433,36 @@ def search_text(req: TextQuery):
     
     if req.top_k < 1 or req.top_k > 50:
         raise HTTPException(status_code=400, detail="top_k must be between 1 and 50")
+
+    if req.response_mode not in RESPONSE_MODES:
+        raise HTTPException(status_code=400, detail=f"response_mode must be one of {RESPONSE_MODES}")
     
+    cache_key = ("search_text", index_generation, normalize_query(req.query), req.top_k, req.response_mode)
+    return await cached_response(cache_key, _search_text_sync, req)
+
+def _search_text_sync(req):
     try:
         logger.info(f"Processing cross-modal search: '{req.query}' with top_k={req.top_k}")
         
         # Sử dụng CLIP cho cả text search và cross-modal để đảm bảo tính nhất quán
-        clip_text_inputs = clip_processor(text=[req.query], return_tensors="pt", padding=True, truncation=True, max_length=77)
-        with torch.no_grad():
-            clip_text_emb = clip_model.get_text_features(**clip_text_inputs)
-        clip_text_emb = clip_text_emb[0].cpu().numpy()
+        clip_text_emb = get_clip_text_embedding(req.query)
         
         logger.info(f"CLIP text embedding shape: {clip_text_emb.shape}")
         
-        # 1. Text search với CLIP (thay vì SimCSE)
-        text_results = text_searcher.search(clip_text_emb, top_k=req.top_k)
-        logger.info(f"Found {len(text_results)} text results")
+        # Text index và static image index (cross-modal) được search song song với cùng CLIP embedding,
+        # kết quả gộp theo distance với quota riêng cho mỗi loại
+        image_top_k = min(req.top_k // 2, 5)  # Lấy ít hơn text results
+        merged = multi_searcher.search([
+            ("text", text_search_fetch("text", text_searcher, req.query, clip_text_emb), req.top_k),
+            ("static_image", text_search_fetch("static_image", static_image_searcher, req.query, clip_text_emb), image_top_k)
+        ])
         
-        # 2. Cross-modal: Tìm ảnh liên quan bằng cách sử dụng cùng CLIP embedding
-        image_results = []
-        if static_image_searcher:
-            try:
-                logger.info(f"Starting cross-modal search for query: '{req.query}'")
-                
-                # Sử dụng cùng CLIP embedding đã tạo ở trên
-                image_top_k = min(req.top_k // 2, 5)  # Lấy ít hơn text results
-                logger.info(f"Searching for {image_top_k} image results")
-                
-                image_results = static_image_searcher.search(clip_text_emb, top_k=image_top_k)
-                logger.info(f"Found {len(image_results)} cross-modal image results using CLIP")
-                
-                # Log chi tiết từng kết quả
-                for i, result in enumerate(image_results):
-                    logger.info(f"Image result {i+1}: {result.get('file', 'N/A')} - distance: {result.get('distance', 'N/A')}")
-                    
-                # Log cross-modal results
-                logger.info(f"Cross-modal image results found: {len(image_results)}")
-                for i, result in enumerate(image_results):
-                    distance = result.get('distance', 0)
-                    logger.info(f"Cross-modal distance for {result.get('file', 'N/A')}: {distance:.2f}")
-                    
-            except Exception as e:
-                logger.error(f"Cross-modal image search error: {e}")
-                logger.error(f"Error details: {str(e)}")
-                import traceback
-                logger.error(f"Full traceback: {traceback.format_exc()}")
-        
-        # 3. Kết hợp và xử lý kết quả
+        # Kết hợp và xử lý kết quả (đã sắp theo distance, càng nhỏ càng tốt)
         all_results = []
-        
-        # Xử lý text results
-        for idx, r in enumerate(text_results):
+        positions = {"text": 0, "static_image": 0}
+        for name, r in merged:
+            idx = positions[name]
+            positions[name] += 1
             distance = r.get('distance', None)
             if distance is not None:
                 # Sử dụng distance trực tiếp thay vì score
@@ -129,73 +470,46 @@ def search_text(req: TextQuery):
             else:
                 distance_display = req.top_k - idx
             
+            if name == "text":
+                all_results.append({
+                    "file": r.get('file', 'N/A'),
+                    "line": r.get('line', 'N/A'),
+                    "text": r.get('text', 'N/A'),
+                    "description": r.get('text', 'N/A'),
+                    "distance": distance_display,
+                    "type": "text",
+                    "source": "text_search"
+                })
+                continue
+            
+            # Image results (cross-modal)
+            file_name = r.get('file', '')
             detailed_result = {
-                "file": r.get('file', 'N/A'),
-                "line": r.get('line', 'N/A'),
-                "text": r.get('text', 'N/A'),
-                "description": r.get('text', 'N/A'),
+                "file": file_name,
+                "description": f"Ảnh {file_name}",
                 "distance": distance_display,
-                "type": "text",
-                "source": "text_search"
+                "type": "static_image",
+                "source": "cross_modal"
             }
-            all_results.append(detailed_result)
-        
-        # Xử lý image results (cross-modal)
-        for idx, r in enumerate(image_results):
-            distance = r.get('distance', None)
-            if distance is not None:
-                # Sử dụng distance trực tiếp thay vì score
-                distance_display = round(distance, 4)
-            else:
-                distance_display = req.top_k - idx
-            
-            # Thêm image_base64 cho image results
-            file_name = r.get('file', '')
-            image_base64 = None
             if file_name and not r.get('is_upload'):
                 try:
                     img_path = os.path.join("data", "images", file_name)
-                    if os.path.exists(img_path):
-                        with open(img_path, "rb") as img_file:
-                            image_base64 = base64.b64encode(img_file.read()).decode('utf-8')
-                            logger.info(f"✅ Generated image_base64 for {file_name}")
-                        detailed_result = {
-                            "file": file_name,
-                            "description": f"Ảnh {file_name}",
-                            "distance": distance_display,
-                            "type": "static_image",
-                            "source": "cross_modal",
-                            "image_base64": image_base64
-                        }
-                        all_results.append(detailed_result)
-                        logger.info(f"✅ Added cross-modal result: {file_name} | Distance: {distance_display}")
-                    else:
+                    if not os.path.exists(img_path):
                         logger.warning(f"⚠️ Image file not found: {img_path}")
+                        continue
+                    if req.response_mode == "url":
+                        detailed_result["image_url"] = image_url(file_name)
+                    else:
+                        with open(img_path, "rb") as img_file:
+                            detailed_result["image_base64"] = base64.b64encode(img_file.read()).decode('utf-8')
                 except Exception as e:
                     logger.error(f"❌ Error processing image {file_name}: {e}")
-            else:
-                # Nếu không có image_base64, vẫn thêm vào kết quả
-                detailed_result = {
-                    "file": file_name,
-                    "description": f"Ảnh {file_name}",
-                    "distance": distance_display,
-                    "type": "static_image",
-                    "source": "cross_modal"
-                }
-                all_results.append(detailed_result)
-                logger.info(f"✅ Added cross-modal result: {file_name} | Distance: {distance_display}")
-        
-        # Sắp xếp kết quả theo distance (càng nhỏ càng tốt)
-        all_results.sort(key=lambda x: x.get('distance', float('inf')))
-        
-        # Log final results
-        text_count = len([r for r in all_results if r.get('type') == 'text'])
-        image_count = len([r for r in all_results if r.get('type') == 'static_image'])
-        logger.info(f"Final results - Text: {text_count}, Image: {image_count}")
-        
-        for i, result in enumerate(all_results[:10]):  # Log 10 kết quả đầu
-            logger.info(f"Final result {i+1}: {result.get('file', 'N/A')} | Type: {result.get('type', 'N/A')} | Distance: {result.get('distance', 'N/A')}")
+                    continue
+            all_results.append(detailed_result)
+            logger.info(f"✅ Added cross-modal result: {file_name} | Distance: {distance_display}")
         
+        text_count = positions["text"]
+        image_count = len(all_results) - text_count
         logger.info(f"Cross-modal search completed, found {len(all_results)} total results")
         logger.info(f"Text results: {text_count}")
         logger.info(f"Image results: {image_count}")
@@ -205,8 +519,60 @@ def search_text(req: TextQuery):
         logger.error(f"Cross-modal search failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+def decode_video_frame(vid_path, r):
+    """Fallback khi frame chưa có thumbnail: mở video, seek tới frame theo metadata và encode JPEG"""
+    import cv2
+    cap = cv2.VideoCapture(vid_path)
+
+    # Lấy thông tin frame từ metadata
+    frame_info = r.get('description', '')
+    frame_number = r.get('frame', 0)
+
+    # Tìm frame number từ description hoặc sử dụng frame từ metadata
+    if 'Frame' in frame_info:
+        try:
+            # Extract frame number từ description "Frame X tại Ys"
+            frame_match = frame_info.split('Frame ')[1].split(' ')[0]
+            frame_number = int(frame_match)
+            logger.info(f"Extracted frame number: {frame_number} from description: {frame_info}")
+        except Exception as e:
+            logger.warning(f"Failed to extract frame number from description: {frame_info}, error: {e}")
+            frame_number = r.get('frame', 0)
+
+    logger.info(f"Attempting to extract frame {frame_number} from video: {vid_path}")
+
+    # Thử nhiều frame khác nhau nếu frame cụ thể không đọc được
+    frame_candidates = [frame_number]
+    if frame_number > 0:
+        frame_candidates.append(frame_number - 1)  # Frame trước
+    frame_candidates.append(0)  # Frame đầu tiên
+    frame_candidates.append(min(10, frame_number + 2))  # Frame sau
+
+    ret = False
+    frame = None
+
+    for candidate_frame in frame_candidates:
+        if candidate_frame < 0:
+            continue
+        cap.set(cv2.CAP_PROP_POS_FRAMES, candidate_frame)
+        ret, frame = cap.read()
+        if ret:
+            logger.info(f"Successfully read frame {candidate_frame} from {vid_path}")
+            break
+        else:
+            logger.warning(f"Failed to read frame {candidate_frame}")
+
+    cap.release()
+
+    if not ret or frame is None:
+        return None
+    # Encode thẳng trong memory thay vì ghi file JPEG tạm
+    ok, buf = cv2.imencode('.jpg', frame)
+    return buf.tobytes() if ok else None
+
 @app.post("/search_image")
-def search_image(file: UploadFile = File(...), top_k: int = 5):
+async def search_image(file: UploadFile = File(...), top_k: int = 5, response_mode: str = Query("base64")):
+    await ensure_indexes()
     if image_searcher is None:
         raise HTTPException(status_code=503, detail="Image searcher not available")
     
@@ -219,118 +585,70 @@ def search_image(file: UploadFile = File(...), top_k: int = 5):
     
     if top_k < 1 or top_k > 50:
         raise HTTPException(status_code=400, detail="top_k must be between 1 and 50")
+
+    if response_mode not in RESPONSE_MODES:
+        raise HTTPException(status_code=400, detail=f"response_mode must be one of {RESPONSE_MODES}")
     
     # Kiểm tra kích thước file (max 10MB)
     file_size = 0
-    content = file.file.read()
+    content = await file.read()
     file_size = len(content)
     if file_size > 10 * 1024 * 1024:  # 10MB
         raise HTTPException(status_code=400, detail="File size too large (max 10MB)")
     
+    # Tên file có trong kết quả (ảnh upload đứng đầu) nên cũng là một phần của key
+    cache_key = ("search_image", index_generation, bytes_hash(content), file.filename, top_k, response_mode)
+    return await cached_response(cache_key, _search_image_sync, file, content, top_k, response_mode)
+
+def _search_image_sync(file, content, top_k, response_mode="base64"):
+    file_size = len(content)
     try:
         logger.info(f"Processing image search: {file.filename} ({file_size} bytes) with top_k={top_k}")
-        temp_path = f"temp_{file.filename}"
-        with open(temp_path, "wb") as f:
-            f.write(content)
-        
-        emb = get_image_embedding(temp_path)
-        all_results = []
         
-        # Search trong static images trước (ưu tiên khi search static image)
-        static_results = []
-        if static_image_searcher:
+        key = content_key(CLIP_MODEL_NAME, IMAGE_PREPROCESS_VERSION, bytes_hash(content))
+        cache = get_embedding_cache()
+        emb = cache.get(key) if cache else None
+        if emb is None:
+            # Decode thẳng từ bytes upload, không ghi file tạm
             try:
-                static_results = static_image_searcher.search(emb, top_k=top_k)
-                logger.info(f"Found {len(static_results)} static image results")
-                
-                # Thêm file upload vào kết quả với distance = 0 (perfect match)
-                upload_filename = file.filename
-                if upload_filename:
-                    # Tạo kết quả cho file upload
-                    upload_result = {
-                        'file': upload_filename,
-                        'description': f'Ảnh {upload_filename} (uploaded)',
-                        'distance': 0.0,  # Perfect similarity
-                        'type': 'uploaded_image',
-                        'is_upload': True
-                    }
-                    static_results.insert(0, upload_result)  # Thêm vào đầu
-                    logger.info(f"Added upload file {upload_filename} with distance 0.0")
-                    
-                    # Loại bỏ file trùng trong database (nếu có)
-                    static_results = [r for r in static_results if not (r.get('file') == upload_filename and not r.get('is_upload'))]
-                    logger.info(f"Filtered duplicates, total: {len(static_results)} results")
-                    
-            except Exception as e:
-                logger.error(f"Static image search error: {e}")
-        
-        # Search trong video frames
-        video_results = []
-        if image_searcher:
-            try:
-                video_results = image_searcher.search(emb, top_k=top_k)
-                logger.info(f"Found {len(video_results)} video frame results")
-            except Exception as e:
-                logger.error(f"Video frame search error: {e}")
+                image = decode_image_bytes(content, UPLOAD_MAX_PIXELS)
+            except (ValueError, OSError, Image.DecompressionBombError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+            emb = image_batcher(preprocess_image(image))
         
-        # Kết hợp kết quả với ưu tiên static images và loại bỏ trùng lặp
-        all_results = []
-        seen_files = set()  # Để track files đã thêm
+        # File upload đứng đầu với distance = 0 (perfect match), đi kèm kết quả static images
+        upload_results = []
+        if static_image_searcher and file.filename:
+            upload_results = [{
+                'file': file.filename,
+                'description': f'Ảnh {file.filename} (uploaded)',
+                'distance': 0.0,  # Perfect similarity
+                'type': 'uploaded_image',
+                'is_upload': True
+            }]
         
-        if static_results:
-            # Thêm static images trước với score cao hơn
-            for i, result in enumerate(static_results):
-                result = dict(result)
-                file_name = result.get('file', '')
-                
-                # Kiểm tra trùng lặp
-                if file_name not in seen_files:
-                    # Sử dụng distance thực tế từ FAISS
-                    distance = result.get('distance', None)
-                    if result.get('is_upload'):
-                        result['type'] = 'uploaded_image'
-                        logger.info(f"Added uploaded image: {file_name} with distance {distance}")
-                    else:
-                        result['type'] = 'static_image'
-                        logger.info(f"Added static image: {file_name} with distance {distance}")
-                    
-                    all_results.append(result)
-                    seen_files.add(file_name)
-                else:
-                    logger.info(f"Skipped duplicate static image: {file_name}")
+        # Static images và video frames được search song song, gộp theo distance trong một lượt:
+        # upload xếp trước khi bằng distance, file trùng (vd. chính file upload trong database) bị bỏ
+        merged = multi_searcher.search([
+            ("upload", lambda k: upload_results, len(upload_results)),
+            ("static_image", image_search_fetch(static_image_searcher, emb), top_k),
+            ("video_frame", image_search_fetch(image_searcher, emb), top_k)
+        ], dedup_key=lambda name, r: f"{r.get('file', '')}_{r.get('description', '')}" if name == "video_frame" else r.get('file', ''))
         
-        if video_results:
-            # Thêm video frames sau với score thấp hơn
-            for i, result in enumerate(video_results):
-                result = dict(result)
-                file_name = result.get('file', '')
-                frame_info = result.get('description', '')
-                
-                # Tạo unique key cho video frames
-                unique_key = f"{file_name}_{frame_info}"
-                
-                # Kiểm tra trùng lặp
-                if unique_key not in seen_files:
-                    # Sử dụng distance thực tế từ FAISS
-                    distance = result.get('distance', None)
-                    result['type'] = 'video_frame'
-                    all_results.append(result)
-                    seen_files.add(unique_key)
-                    logger.info(f"Added video frame: {file_name} with distance {distance}")
-                else:
-                    logger.info(f"Skipped duplicate video frame: {unique_key}")
+        all_results = []
+        for name, result in merged:
+            result['type'] = 'uploaded_image' if name == "upload" else name
+            all_results.append(result)
+        logger.info(f"Found {len(all_results)} merged results")
         
         if not all_results:
             logger.warning("No results found from either searcher")
             return {"matched_files": []}
-        
-        # Sắp xếp theo distance (distance càng nhỏ càng tốt)
-        all_results.sort(key=lambda x: x.get('distance', float('inf')))
 
         # Bổ sung trường image_base64 cho mỗi kết quả
         new_results = []
         for idx, r in enumerate(all_results):
-            r = dict(r)  # copy để không ảnh hưởng meta gốc
+            # r đã là dict riêng của request (to_dicts copy metadata), sửa trực tiếp
             file_name = r.get('file')
             image_base64 = None
             
@@ -348,61 +666,17 @@ def search_image(file: UploadFile = File(...), top_k: int = 5):
                 # Ưu tiên tìm trong thư mục video
                 vid_path = os.path.join("data/vid", file_name)
                 img_path = None
-                if os.path.exists(vid_path) and file_name.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-                    # Nếu là video, lấy frame cụ thể dựa trên metadata
-                    import cv2
-                    cap = cv2.VideoCapture(vid_path)
-                    
-                    # Lấy thông tin frame từ metadata
-                    frame_info = r.get('description', '')
-                    frame_number = r.get('frame', 0)
-                    
-                    # Tìm frame number từ description hoặc sử dụng frame từ metadata
-                    if 'Frame' in frame_info:
-                        try:
-                            # Extract frame number từ description "Frame X tại Ys"
-                            frame_match = frame_info.split('Frame ')[1].split(' ')[0]
-                            frame_number = int(frame_match)
-                            logger.info(f"Extracted frame number: {frame_number} from description: {frame_info}")
-                        except Exception as e:
-                            logger.warning(f"Failed to extract frame number from description: {frame_info}, error: {e}")
-                            frame_number = r.get('frame', 0)
-                    
-                    logger.info(f"Attempting to extract frame {frame_number} from video: {vid_path}")
-                    
-                    # Thử nhiều frame khác nhau nếu frame cụ thể không đọc được
-                    frame_candidates = [frame_number]
-                    if frame_number > 0:
-                        frame_candidates.append(frame_number - 1)  # Frame trước
-                    frame_candidates.append(0)  # Frame đầu tiên
-                    frame_candidates.append(min(10, frame_number + 2))  # Frame sau
-                    
-                    ret = False
-                    frame = None
-                    
-                    for candidate_frame in frame_candidates:
-                        if candidate_frame < 0:
-                            continue
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, candidate_frame)
-                        ret, frame = cap.read()
-                        if ret:
-                            logger.info(f"Successfully read frame {candidate_frame} from {file_name}")
-                            break
-                        else:
-                            logger.warning(f"Failed to read frame {candidate_frame}")
-                    
-                    cap.release()
-                    
-                    if ret and frame is not None:
-                        logger.info(f"Successfully read frame from {file_name}")
-                        import tempfile
-                        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_img:
-                            cv2.imwrite(tmp_img.name, frame)
-                            tmp_img.flush()
-                            with open(tmp_img.name, 'rb') as imgf:
-                                image_base64 = base64.b64encode(imgf.read()).decode('utf-8')
-                            logger.info(f"Generated base64 image, length: {len(image_base64)}")
-                        os.remove(tmp_img.name)
+                if os.path.exists(vid_path) and file_name.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')) and response_mode == "url":
+                    # Frame phục vụ qua /media/frame/{id} (thumbnail hoặc decode video khi client thật sự tải)
+                    r['image_url'] = frame_url(r.get('id'))
+                elif os.path.exists(vid_path) and file_name.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+                    # Thumbnail đã lưu lúc build index (theo vector ID), chỉ decode video khi không có
+                    frame_bytes = thumbnail_store.get(r.get('id')) if thumbnail_store else None
+                    if frame_bytes is None:
+                        frame_bytes = decode_video_frame(vid_path, r)
+                    if frame_bytes is not None:
+                        image_base64 = base64.b64encode(frame_bytes).decode('utf-8')
+                        logger.info(f"Generated base64 image, length: {len(image_base64)}")
                     else:
                         logger.error(f"Failed to read any frame from {file_name}")
                 elif os.path.exists(vid_path) and file_name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
@@ -417,9 +691,12 @@ def search_image(file: UploadFile = File(...), top_k: int = 5):
                     else:
                         # Kiểm tra nếu là file upload
                         if r.get('is_upload'):
-                            # Sử dụng file upload đã được lưu tạm
-                            img_path = temp_path
-                            logger.info(f"Using uploaded file for display: {img_path}")
+                            # Ảnh upload đã có sẵn trong memory
+                            image_base64 = base64.b64encode(content).decode('utf-8')
+                            logger.info(f"Using uploaded file for display: {file_name}")
+                if img_path and response_mode == "url":
+                    r['image_url'] = image_url(file_name)
+                    img_path = None
                 if img_path:
                     try:
                         with open(img_path, 'rb') as imgf:
@@ -437,7 +714,8 @@ def search_image(file: UploadFile = File(...), top_k: int = 5):
             if 'type' not in r:
                 r['type'] = 'image'
             
-            r['image_base64'] = image_base64
+            if 'image_url' not in r:
+                r['image_base64'] = image_base64
             
             # Log thông tin chi tiết về distance
             file_type = r.get('type', 'unknown')
@@ -446,19 +724,58 @@ def search_image(file: UploadFile = File(...), top_k: int = 5):
             new_results.append(r)
             
             logger.info(f"Result {idx+1}: file={file_name}, type=image, has_image={'yes' if image_base64 else 'no'}")
-        # Cleanup
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         
         logger.info(f"Image search completed, found {len(new_results)} results")
         return {"matched_files": new_results}
+    except HTTPException:
+        raise
     except Exception as e:
-        # Cleanup on error
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
         logger.error(f"Image search failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Image search failed: {str(e)}")
 
+@app.get("/media/image/{name}")
+def media_image(name: str, request: Request):
+    """Ảnh tĩnh theo tên file (data/images, data/vid), hỗ trợ ETag/Last-Modified/Range"""
+    path = resolve_media_file(name, MEDIA_IMAGE_DIRS)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return file_response(request.headers, path, MEDIA_MAX_AGE)
+
+@app.get("/media/frame/{vector_id}")
+def media_frame(vector_id: int, request: Request):
+    """Thumbnail frame video theo vector ID của image index, decode từ video nếu chưa có thumbnail"""
+    load_indexes()
+    data = thumbnail_store.get(vector_id) if thumbnail_store else None
+    if data is not None:
+        return bytes_response(request.headers, data, thumbnail_media_type(data), os.path.getmtime(thumbnail_store.path), MEDIA_MAX_AGE)
+    meta = None
+    if image_searcher is not None and 0 <= vector_id < len(image_searcher.meta):
+        meta = image_searcher.meta[vector_id]
+    vid_path = os.path.join("data/vid", os.path.basename(meta.get('file', ''))) if meta else None
+    if not vid_path or not os.path.isfile(vid_path):
+        raise HTTPException(status_code=404, detail="Frame not found")
+    data = decode_video_frame(vid_path, meta)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Frame not found")
+    return bytes_response(request.headers, data, "image/jpeg", os.path.getmtime(vid_path), MEDIA_MAX_AGE)
+
+@app.post("/admin/reload")
+def admin_reload(request: Request, wait: bool = False):
+    """Hot reload index (không restart, không load lại CLIP); wait=true chờ reload xong mới trả về"""
+    # Không có ADMIN_TOKEN thì ai truy cập được API cũng reload được: từ chối thay vì mở endpoint
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled, set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if _reload_state["in_progress"]:
+        return JSONResponse(status_code=409, content={"detail": "Reload already in progress", "reload": _reload_state})
+    if wait:
+        if not reload_indexes():
+            return JSONResponse(status_code=409, content={"detail": "Reload already in progress", "reload": _reload_state})
+        return {"status": "reloaded", "index_generation": index_generation, "reload": _reload_state}
+    threading.Thread(target=reload_indexes, name="index-reload", daemon=True).start()
+    return JSONResponse(status_code=202, content={"status": "reloading", "index_generation": index_generation})
+
 @app.get("/")
 def root():
     return {
@@ -475,6 +792,10 @@ def root():
             "image_search": "/search_image",
             "cross_modal_search": "/search_text (now includes image results)",
             "health": "/health",
+            "ready": "/ready",
+            "admin_reload": "/admin/reload",
+            "media_image": "/media/image/{name}",
+            "media_frame": "/media/frame/{vector_id}",
             "debug_videos": "/debug/videos",
             "debug_images": "/debug/static-images"
         }
@@ -482,13 +803,46 @@ def root():
 
 @app.get("/health")
 def health_check():
+    # Liveness: không trigger load model/index, searcher chưa load được báo là False
     return {
         "status": "healthy",
+        "indexes_loaded": _indexes_loaded,
+        "clip_loaded": is_clip_loaded(),
+        "text_searcher": text_searcher is not None,
+        "image_searcher": image_searcher is not None,
+        "text_index_size": text_searcher.ntotal if text_searcher else 0,
+        "image_index_size": image_searcher.ntotal if image_searcher else 0,
+        "image_shards": image_searcher.get_stats() if isinstance(image_searcher, ShardedSearch) else None,
+        "embedding_cache": embedding_cache.get_stats() if embedding_cache else None,
+        "query_embedding_cache": query_embedding_cache.get_stats(),
+        "search_hit_cache": search_hit_cache.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "index_generation": index_generation,
+        "reload": _reload_state,
+        "text_batcher": text_batcher.get_stats(),
+        "image_batcher": image_batcher.get_stats(),
+        "search_batcher": search_batcher.get_stats(),
+        "search_executor": search_executor.get_stats(),
+        "multi_searcher": multi_searcher.get_stats(),
+        "thumbnail_store": thumbnail_store.get_stats() if thumbnail_store else None,
+        "runtime": runtime_stats()
+    }
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness: 200 khi index và CLIP đã load (warm-up xong hoặc đã có request đầu tiên), ngược lại 503"""
+    ready = _indexes_loaded and is_clip_loaded()
+    content = {
+        "ready": ready,
+        "indexes_loaded": _indexes_loaded,
+        "clip_loaded": is_clip_loaded(),
+        "clip_backend": CLIP_BACKEND,
         "text_searcher": text_searcher is not None,
         "image_searcher": image_searcher is not None,
-        "text_index_size": text_searcher.index.ntotal if text_searcher else 0,
-        "image_index_size": image_searcher.index.ntotal if image_searcher else 0
+        "static_image_searcher": static_image_searcher is not None,
+        "warmup": _warmup_state
     }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
 
 @app.get("/debug/videos")
 def debug_videos():
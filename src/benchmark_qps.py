@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Đo QPS của API /search_text với các cách chia workers x threads trên cùng host")
+    parser.add_argument("--layouts", default="", help="Danh sách workersxthreads, vd: 1x8,2x4,4x2,8x1 (mặc định chia đều số core)")
+    parser.add_argument("--pin", action="store_true", help="Pin mỗi worker vào dải CPU riêng (PIN_WORKERS=1)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Số client gửi request đồng thời")
+    parser.add_argument("--duration", type=float, default=20.0, help="Thời gian đo mỗi layout (giây)")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="Thời gian tối đa chờ server warm-up")
+    return parser.parse_args()
+
+def default_layouts():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    layouts = []
+    workers = 1
+    while workers <= cpus:
+        layouts.append((workers, cpus // workers))
+        workers *= 2
+    return layouts
+
+def parse_layouts(value):
+    if not value:
+        return default_layouts()
+    return [tuple(int(x) for x in item.split("x")) for item in value.split(",") if item]
+
+def wait_ready(base_url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=5) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.5)
+    return False
+
+def load_test(base_url, concurrency, duration, top_k):
+    """concurrency client gửi /search_text liên tục trong duration giây, mỗi query khác nhau để không trúng cache"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client(client_id):
+        n = 0
+        while time.time() < deadline:
+            body = json.dumps({"query": f"benchmark query {client_id} {n}", "top_k": top_k}).encode("utf-8")
+            request = urllib.request.Request(f"{base_url}/search_text", data=body, headers={"Content-Type": "application/json"})
+            start_time = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as resp:
+                    resp.read()
+                elapsed = time.perf_counter() - start_time
+                with lock:
+                    latencies.append(elapsed)
+            except (urllib.error.URLError, ConnectionError, OSError):
+                with lock:
+                    errors[0] += 1
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    start_time = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start_time
+    latencies = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95), errors[0]
+
+def run_layout(workers, threads, args):
+    """Khởi động uvicorn với layout workers x threads, chờ warm-up rồi đo QPS"""
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), THREADS_PER_WORKER=str(threads),
+               PIN_WORKERS="1" if args.pin else "0", API_WARMUP="block")
+    cmd = [sys.executable, "-m", "uvicorn", "src.api:app", "--host", "127.0.0.1", "--port", str(args.port),
+           "--workers", str(workers), "--log-level", "warning"]
+    base_url = f"http://127.0.0.1:{args.port}"
+    proc = subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        if not wait_ready(base_url, args.ready_timeout):
+            print(f"❌ {workers}x{threads}: server not ready after {args.ready_timeout}s")
+            return None
+        # Warm-up từng worker trước khi đo
+        load_test(base_url, args.concurrency, 2.0, args.top_k)
+        return load_test(base_url, args.concurrency, args.duration, args.top_k)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def main():
+    args = parse_args()
+    layouts = parse_layouts(args.layouts)
+    print(f"📊 /search_text QPS, concurrency={args.concurrency}, duration={args.duration}s, pin={args.pin}")
+    for workers, threads in layouts:
+        result = run_layout(workers, threads, args)
+        if result is None:
+            continue
+        qps, p50, p95, errors = result
+        print(f"   {workers:>2} workers x {threads:>2} threads: {qps:8.1f} QPS  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  errors {errors}")
+
+if __name__ == "__main__":
+    main()
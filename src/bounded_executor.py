@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class ExecutorSaturated(Exception):
+    """Executor đã đủ số request đang chạy + đang chờ, request mới bị từ chối ngay"""
+
+class BoundedExecutor:
+    """
+    Thread pool riêng cho inference + FAISS search + file I/O với giới hạn:
+    tối đa max_workers job chạy đồng thời và max_queue job chờ. Vượt giới hạn thì raise ExecutorSaturated
+    thay vì xếp hàng vô hạn trong threadpool mặc định.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, name="search"):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"Too many concurrent requests ({self._pending} in flight)")
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Chạy fn trên pool và await kết quả; slot chỉ được trả khi job thật sự xong (kể cả khi client hủy)"""
+        self._acquire()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def get_stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
@@ -1,184 +1,285 @@
 import os
-from image_pipeline import clip_processor, clip_model, get_image_embedding
-from faiss_pipeline import FaissMultiModalSearch
-import torch
-
-print("🚀 Building indexes for AI Challenge HCM...")
-
-# Build index cho text (sử dụng CLIP thay vì SimCSE để đảm bảo tính nhất quán)
-print("📝 Building text index with CLIP...")
-texts = []
-metas = []
-
-# Tự động scan tất cả text files trong data/text/
-text_dir = "data/text"
-if os.path.exists(text_dir):
-    text_files = [f for f in os.listdir(text_dir) if f.lower().endswith('.txt')]
-    
-    if not text_files:
-        print("⚠️ No text files found in data/text/")
-    else:
-        print(f"📁 Found {len(text_files)} text files: {text_files}")
-        
-        for fname in text_files:
-            fpath = os.path.join(text_dir, fname)
-            print(f"📖 Processing file: {fname}")
-            
-            with open(fpath, encoding="utf-8") as f:
-                for i, line in enumerate(f):
-                    text = line.strip()
-                    if text:
-                        texts.append(text)
-                        metas.append({"file": fname, "line": i+1, "text": text})
-else:
-    print("⚠️ Text directory data/text/ not found")
-
-# Xử lý text với CLIP (thay vì SimCSE)
-if texts:
-    print(f"📊 Processing {len(texts)} text entries with CLIP...")
-    embs = []
-    for text in texts:
-        # Tạo CLIP text embedding với truncation
-        inputs = clip_processor(text=[text], return_tensors="pt", padding=True, truncation=True, max_length=77)
-        with torch.no_grad():
-            emb = clip_model.get_text_features(**inputs)
-        embs.append(emb[0].cpu().numpy())
-    
-    # Sử dụng FlatL2 cho dữ liệu nhỏ, IVF+PQ cho dữ liệu lớn
-    use_ivfpq = len(embs) >= 256  # Chỉ dùng IVF+PQ khi có >= 256 samples
-    nlist = min(16, len(embs) // 2) if len(embs) > 1 else 1
-    
-    # CLIP có dimension 512
-    text_searcher = FaissMultiModalSearch(dim=512, index_path="data/faiss_text.bin", meta_path="data/faiss_text.pkl", nlist=nlist, use_ivfpq=use_ivfpq, use_cosine=True)
-    if use_ivfpq:
-        text_searcher.train(embs)
-    text_searcher.add_batch(embs, metas)
-    text_searcher.save()
-    print(f"✅ Text index built successfully with CLIP + Cosine. Samples: {len(embs)}, nlist: {nlist}, use_ivfpq: {use_ivfpq}")
-else:
-    print("⚠️ No text files found in data/text/")
-
-# Build index cho video (nhiều frames)
-print("🖼️ Building image index from video frames...")
+import argparse
+import numpy as np
+from image_pipeline import encode_texts, encode_images, DEFAULT_BATCH_SIZE, DEFAULT_PREFETCH, CLIP_MODEL_NAME, TEXT_PREPROCESS_VERSION, IMAGE_PREPROCESS_VERSION
+from faiss_pipeline import FaissMultiModalSearch, INDEX_TYPES, STORAGE_MODES, check_storage, choose_index_type, default_nlist
+from snapshot import DEFAULT_KEEP_SNAPSHOTS, list_versions
+from index_state import STATE_PATH, load_state, save_state, diff_sources
+from thumbnail_store import THUMBNAILS_PATH, DEFAULT_THUMBNAIL_SIZE, THUMBNAIL_FORMATS, ThumbnailWriter
+from embedding_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_MB, EmbeddingCache, content_key, text_hash, encode_with_cache
+
 try:
-    import cv2
-    vid_dir = "data/vid"
-    vid_embs = []
-    vid_metas = []
-    
-    if os.path.exists(vid_dir):
-        video_files = [f for f in os.listdir(vid_dir) if f.lower().endswith(('.mp4', '.avi', '.mov', '.mkv'))]
-        
-        if not video_files:
-            print("⚠️ No video files found in data/vid/")
-        else:
-            for fname in video_files:
-                vid_path = os.path.join(vid_dir, fname)
-                vidcap = cv2.VideoCapture(vid_path)
-                
-                if not vidcap.isOpened():
-                    print(f"❌ Cannot open video: {fname}")
-                    continue
-                
-                # Lấy thông tin video
-                total_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
-                fps = vidcap.get(cv2.CAP_PROP_FPS)
-                duration = total_frames / fps if fps > 0 else 0
-                
-                print(f"📹 Processing video: {fname} ({total_frames} frames, {duration:.1f}s)")
-                
-                # Extract nhiều frames (mỗi 2 giây 1 frame)
-                frame_interval = max(1, int(fps * 2))  # 1 frame mỗi 2 giây
-                frame_count = 0
-                
-                for frame_idx in range(0, total_frames, frame_interval):
-                    vidcap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                    success, image = vidcap.read()
-                    
-                    if success:
-                        # Lưu frame tạm thời
-                        frame_path = os.path.join(vid_dir, f"{fname}_frame_{frame_count}.jpg")
-                        cv2.imwrite(frame_path, image)
-                        
-                        # Tạo embedding cho frame
-                        emb = get_image_embedding(frame_path)
-                        vid_embs.append(emb)
-                        
-                        # Metadata cho frame
-                        frame_time = frame_idx / fps if fps > 0 else 0
-                        vid_metas.append({
-                            "file": fname,
-                            "description": f"Frame {frame_count} tại {frame_time:.1f}s của video {fname}",
-                            "frame_number": frame_count,
-                            "frame_time": frame_time
-                        })
-                        
-                        frame_count += 1
-                        
-                        # Xóa file tạm
-                        os.remove(frame_path)
-                
-                vidcap.release()
-                print(f"✅ Extracted {frame_count} frames from {fname}")
-            
-            if vid_embs:
-                # Sử dụng FlatIP cho video frames với cosine similarity
-                video_searcher = FaissMultiModalSearch(dim=512, index_path="data/faiss_image.bin", meta_path="data/faiss_image.pkl", use_ivfpq=False, use_cosine=True)
-                video_searcher.add_batch(vid_embs, vid_metas)
-                video_searcher.save()
-                print(f"✅ Video frames index built successfully with Cosine. Samples: {len(vid_embs)}")
-            else:
-                print("⚠️ No video frames extracted")
-    else:
-        print("⚠️ Video directory data/vid/ not found")
-        
+    from video_pipeline import VIDEO_EXTENSIONS, iter_videos
 except ImportError:
-    print("⚠️ OpenCV not available, skipping video processing")
-except Exception as e:
-    print(f"❌ Error processing videos: {e}")
+    # OpenCV chưa được cài, bỏ qua video
+    VIDEO_EXTENSIONS = None
 
-# Build index cho static images
-print("🖼️ Building static image index...")
-try:
-    img_dir = "data/images"
-    img_embs = []
-    img_metas = []
-    
-    if os.path.exists(img_dir):
-        image_files = [f for f in os.listdir(img_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
-        
-        if not image_files:
-            print("⚠️ No image files found in data/images/")
-        else:
-            print(f"📁 Found {len(image_files)} image files: {image_files}")
-            
-            for fname in image_files:
-                img_path = os.path.join(img_dir, fname)
-                print(f"🖼️ Processing image: {fname}")
-                
-                # Tạo embedding cho image
-                emb = get_image_embedding(img_path)
-                img_embs.append(emb)
-                
-                # Metadata cho image
-                img_metas.append({
+TEXT_DIR = "data/text"
+VID_DIR = "data/vid"
+IMG_DIR = "data/images"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build FAISS indexes cho text, video frames và static images")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Số item mỗi lần forward CLIP")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_PREFETCH, help="Số batch được decode/preprocess trước trong queue")
+    parser.add_argument("--frame-interval", type=float, default=2.0, help="Khoảng cách (giây) giữa 2 frame được sample từ video")
+    parser.add_argument("--max-frames-per-video", type=int, default=0, help="Số frame tối đa mỗi video (0 = không giới hạn)")
+    parser.add_argument("--frame-short-side", type=int, default=224, help="Thu nhỏ frame về cạnh ngắn này trước khi encode (0 = giữ nguyên)")
+    parser.add_argument("--video-workers", type=int, default=0, help="Số process decode video song song (0 = decode tuần tự trong process chính)")
+    parser.add_argument("--thumbnail-size", type=int, default=DEFAULT_THUMBNAIL_SIZE, help="Cạnh dài tối đa của thumbnail lưu cho mỗi frame video (0 = không lưu thumbnail)")
+    parser.add_argument("--thumbnail-format", default="jpg", choices=THUMBNAIL_FORMATS, help="Định dạng thumbnail frame video")
+    parser.add_argument("--incremental", action="store_true", help="Chỉ embed file mới/thay đổi và cập nhật index hiện có thay vì build lại từ đầu")
+    parser.add_argument("--state-path", default=STATE_PATH, help="File lưu fingerprints của các file nguồn đã index")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Thư mục embedding cache (dùng chung với API)")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_MB, help="Dung lượng tối đa của embedding cache, LRU eviction khi đầy (0 = tắt cache)")
+    parser.add_argument("--cache-dtype", default="float16", choices=["float16", "float32"], help="Kiểu dữ liệu lưu vector trong cache")
+    parser.add_argument("--index-type", default="auto", choices=("auto",) + INDEX_TYPES, help="Loại FAISS index (auto = chọn theo số vector)")
+    parser.add_argument("--nlist", type=int, default=0, help="Số cluster IVF (0 = tự tính theo số vector)")
+    parser.add_argument("--nprobe", type=int, default=0, help="Số cluster IVF được quét mỗi query, lưu cùng index (0 = mặc định)")
+    parser.add_argument("--ef-search", type=int, default=0, help="efSearch của HNSW, lưu cùng index (0 = mặc định)")
+    parser.add_argument("--storage", default="float32", choices=STORAGE_MODES, help="Cách lưu vector trong index: float32, sq_fp16, sq8 (scalar quantizer), pq hoặc opq_pq (auto chọn loại index hợp với storage)")
+    parser.add_argument("--store-vectors", action="store_true", help="Lưu vector float32 gốc ra file .vecs.npy để API re-rank exact (RERANK_FACTOR)")
+    parser.add_argument("--ivf-on-disk", action="store_true", help="Lưu inverted lists của index IVF ra file .ivfdata riêng (OnDiskInvertedLists)")
+    parser.add_argument("--snapshots", action="store_true", help="Ghi index thành snapshot có phiên bản (<index>.snapshots/vNNNNNN + CURRENT, manifest + checksum)")
+    parser.add_argument("--keep-snapshots", type=int, default=DEFAULT_KEEP_SNAPSHOTS, help="Số snapshot cũ giữ lại để rollback")
+    args = parser.parse_args()
+    try:
+        # Báo lỗi ngay thay vì sau khi đã encode toàn bộ dữ liệu
+        check_storage(args.index_type, args.storage)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+def list_sources(src_dir, extensions):
+    return {f: os.path.join(src_dir, f) for f in sorted(os.listdir(src_dir)) if f.lower().endswith(extensions)}
+
+def embed_text_files(sources, args, cache, thumbs=None):
+    """Embed từng dòng text của các file (fname, path, sha256) bằng CLIP, trả về (embs, metas)"""
+    texts = []
+    metas = []
+    for fname, fpath, _ in sources:
+        print(f"📖 Processing file: {fname}")
+
+        with open(fpath, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                text = line.strip()
+                if text:
+                    texts.append(text)
+                    metas.append({"file": fname, "line": i+1, "text": text})
+
+    if not texts:
+        return np.zeros((0, 512), dtype='float32'), metas
+
+    # Xử lý text với CLIP (thay vì SimCSE), truncation max_length=77
+    print(f"📊 Processing {len(texts)} text entries with CLIP...")
+    keyed_texts = ((content_key(CLIP_MODEL_NAME, TEXT_PREPROCESS_VERSION, text_hash(text)), text) for text in texts)
+    embs = encode_with_cache(cache, keyed_texts, lambda items: encode_texts(items, batch_size=args.batch_size, prefetch=args.prefetch, report=True))
+    return embs, metas
+
+def embed_video_files(sources, args, cache, thumbs=None):
+    """
+    Sample frames từ các video (fname, path, sha256) và embed bằng CLIP, trả về (embs, metas).
+    thumbs (ThumbnailWriter): lưu thumbnail của từng frame theo đúng thứ tự metas để API không phải decode video
+    """
+    vid_metas = []
+    names = {path: fname for fname, path, _ in sources}
+    hashes = {path: sha256 for _, path, sha256 in sources}
+    max_frames = args.max_frames_per_video or None
+    if args.video_workers > 0:
+        print(f"⚙️ Decoding videos with {args.video_workers} worker processes")
+
+    def sampled_frames():
+        # Frame RGB trong memory đi thẳng vào batch encoder (model chạy ở process chính)
+        videos = iter_videos(list(names), args.frame_interval, max_frames, args.frame_short_side, workers=args.video_workers)
+        for vid_path, info, frames in videos:
+            fname = names[vid_path]
+
+            if info is None:
+                print(f"❌ Cannot open video: {fname}")
+                continue
+
+            print(f"📹 Processing video: {fname} ({info['total_frames']} frames, {info['duration']:.1f}s)")
+
+            frame_count = 0
+            for frame_number, frame_idx, frame_time, rgb in frames:
+                # Metadata cho frame
+                vid_metas.append({
                     "file": fname,
-                    "description": f"Ảnh {fname}",
-                    "type": "static_image"
+                    "description": f"Frame {frame_number} tại {frame_time:.1f}s của video {fname}",
+                    "frame_number": frame_number,
+                    "frame_time": frame_time
                 })
-            
-            if img_embs:
-                # Sử dụng FlatIP cho static images với cosine similarity
-                static_image_searcher = FaissMultiModalSearch(dim=512, index_path="data/faiss_image_img.bin", meta_path="data/faiss_image_img.pkl", use_ivfpq=False, use_cosine=True)
-                static_image_searcher.add_batch(img_embs, img_metas)
-                static_image_searcher.save()
-                print(f"✅ Static images index built successfully with Cosine. Samples: {len(img_embs)}")
-            else:
-                print("⚠️ No static images processed")
+                frame_count += 1
+                if thumbs is not None:
+                    thumbs.add_frame(rgb)
+                # Frame xác định bởi (nội dung video, frame_idx, kích thước resize)
+                frame_hash = f"{hashes[vid_path]}:{frame_idx}:{args.frame_short_side}"
+                yield content_key(CLIP_MODEL_NAME, IMAGE_PREPROCESS_VERSION, frame_hash), rgb
+
+            print(f"✅ Extracted {frame_count} frames from {fname}")
+
+    embs = encode_with_cache(cache, sampled_frames(), lambda items: encode_images(items, batch_size=args.batch_size, prefetch=args.prefetch, report=True))
+    return embs, vid_metas
+
+def embed_image_files(sources, args, cache, thumbs=None):
+    """Embed các static images (fname, path, sha256) bằng CLIP, trả về (embs, metas)"""
+    keyed_paths = []
+    img_metas = []
+    for fname, img_path, sha256 in sources:
+        print(f"🖼️ Processing image: {fname}")
+        keyed_paths.append((content_key(CLIP_MODEL_NAME, IMAGE_PREPROCESS_VERSION, sha256), img_path))
+
+        # Metadata cho image
+        img_metas.append({
+            "file": fname,
+            "description": f"Ảnh {fname}",
+            "type": "static_image"
+        })
+
+    # Tạo embedding cho images theo batch (decode chạy trước trong thread riêng)
+    embs = encode_with_cache(cache, keyed_paths, lambda items: encode_images(items, batch_size=args.batch_size, prefetch=args.prefetch, report=True))
+    return embs, img_metas
+
+def index_options(num_samples, args):
+    """Tham số chọn loại index: --index-type auto chọn theo số vector và --storage (flat/hnsw/ivf_flat/ivf_pq)"""
+    index_type = choose_index_type(num_samples, args.storage) if args.index_type == "auto" else args.index_type
+    nlist = args.nlist or default_nlist(num_samples, index_type)
+    return dict(index_type=index_type, nlist=nlist, nprobe=args.nprobe or None, ef_search=args.ef_search or None,
+                use_cosine=True, use_id_map=True, ivf_on_disk=args.ivf_on_disk, storage=args.storage, store_vectors=args.store_vectors,
+                snapshots=args.snapshots, keep_snapshots=args.keep_snapshots, model_name=CLIP_MODEL_NAME)
+
+def new_text_searcher(num_samples, args):
+    # CLIP có dimension 512
+    return FaissMultiModalSearch(dim=512, index_path="data/faiss_text.bin", meta_path="data/faiss_text.pkl", **index_options(num_samples, args))
+
+def new_video_searcher(num_samples, args):
+    # Video frames là index lớn nhất, auto chuyển sang HNSW/IVF khi vượt ngưỡng flat
+    return FaissMultiModalSearch(dim=512, index_path="data/faiss_image.bin", meta_path="data/faiss_image.pkl", **index_options(num_samples, args))
+
+def new_static_image_searcher(num_samples, args):
+    return FaissMultiModalSearch(dim=512, index_path="data/faiss_image_img.bin", meta_path="data/faiss_image_img.pkl", **index_options(num_samples, args))
+
+def load_existing(make_searcher, args):
+    """Load index hiện có để update incremental, trả về None nếu phải build lại từ đầu"""
+    searcher = make_searcher(0, args)
+    try:
+        searcher.load()
+    except Exception as e:
+        print(f"⚠️ Cannot load existing index ({e}), rebuilding from scratch")
+        return None
+    if not searcher.use_id_map:
+        print("⚠️ Existing index has no IndexIDMap, rebuilding from scratch")
+        return None
+    return searcher
+
+def commit_thumbnails(thumbs, start_id, searcher):
+    """Commit thumbnail sau khi index đã save, theo snapshot version vừa ghi (index không dùng snapshot: file không phiên bản)"""
+    if thumbs is not None:
+        keep_versions = list_versions(searcher.index_path) if searcher.snapshot_version else None
+        thumbs.commit(start_id, version=searcher.snapshot_version, keep_versions=keep_versions)
+
+def update_index(label, src_dir, extensions, embed_fn, make_searcher, args, state, state_key, cache, thumbnail_path=None):
+    """
+    Build (hoặc update incremental) index cho một modality, ghi fingerprints vào state khi thành công.
+    thumbnail_path: file thumbnail đóng gói theo vector ID (chỉ dùng cho video frames)
+    """
+    if not os.path.exists(src_dir):
+        print(f"⚠️ Directory {src_dir}/ not found")
+        return
+
+    sources = list_sources(src_dir, extensions)
+    if sources:
+        print(f"📁 Found {len(sources)} files in {src_dir}/: {list(sources)}")
+    added, changed, removed, fingerprints = diff_sources(sources, state.get(state_key))
+
+    searcher = None
+    if args.incremental and state_key in state:
+        searcher = load_existing(make_searcher, args)
+    if searcher is not None and searcher.index_type == "hnsw" and (changed or removed):
+        # HNSW không xóa được vector, file thay đổi/bị xóa thì build lại toàn bộ
+        print(f"⚠️ HNSW index cannot remove vectors, rebuilding {label.lower()} index from scratch")
+        searcher = None
+
+    thumbs = None
+    if thumbnail_path and args.thumbnail_size > 0 and (searcher is None or added or changed):
+        thumbs = ThumbnailWriter(thumbnail_path, fresh=searcher is None, base_version=searcher.snapshot_version if searcher else None,
+                                 max_side=args.thumbnail_size, fmt=args.thumbnail_format)
+
+    try:
+        if searcher is None:
+            embs, metas = embed_fn([(fname, path, fingerprints[fname]["sha256"]) for fname, path in sources.items()], args, cache, thumbs)
+            if not len(embs):
+                print(f"⚠️ No {label.lower()} found in {src_dir}/")
+                if thumbs is not None:
+                    thumbs.abort()
+                return
+            searcher = make_searcher(len(embs), args)
+            if not searcher.trained:
+                searcher.train(embs)
+            searcher.add_batch(embs, metas)
+            searcher.save()
+            commit_thumbnails(thumbs, 0, searcher)
+            print(f"✅ {label} index built successfully with Cosine. Samples: {len(embs)}, index_type: {searcher.index_type}, nlist: {searcher.nlist}")
+        elif added or changed or removed:
+            print(f"🔄 Updating {label.lower()} index: {len(added)} new, {len(changed)} changed, {len(removed)} removed files")
+            # File thay đổi: xóa toàn bộ vector cũ của file rồi embed lại
+            stale_ids = [i for fname in changed + removed for i in searcher.ids_by_file(fname)]
+            searcher.remove_ids(stale_ids)
+            embs, metas = embed_fn([(fname, sources[fname], fingerprints[fname]["sha256"]) for fname in added + changed], args, cache, thumbs)
+            # Vector mới nhận ID nối tiếp metadata hiện có
+            start_id = len(searcher.meta)
+            if len(embs):
+                searcher.add_batch(embs, metas)
+            searcher.save()
+            commit_thumbnails(thumbs, start_id, searcher)
+            print(f"✅ {label} index updated: -{len(stale_ids)}/+{len(embs)} vectors, total: {searcher.index.ntotal}")
+        else:
+            print(f"✅ {label} index is up to date ({searcher.index.ntotal} vectors)")
+    except Exception:
+        if thumbs is not None:
+            thumbs.abort()
+        raise
+
+    state[state_key] = fingerprints
+
+def main():
+    args = parse_args()
+    print("🚀 Building indexes for AI Challenge HCM...")
+    state = load_state(args.state_path) if args.incremental else {}
+    cache = None
+    if args.cache_max_mb > 0:
+        cache = EmbeddingCache(args.cache_dir, dim=512, dtype=args.cache_dtype, max_mb=args.cache_max_mb)
+        print(f"💾 Embedding cache: {args.cache_dir} ({len(cache)} entries)")
+
+    # Text dùng CLIP (thay vì SimCSE) để đảm bảo tính nhất quán với ảnh
+    print("📝 Building text index with CLIP...")
+    try:
+        update_index("Text", TEXT_DIR, ('.txt',), embed_text_files, new_text_searcher, args, state, "text", cache)
+    except Exception as e:
+        print(f"❌ Error processing text: {e}")
+
+    print("🖼️ Building image index from video frames...")
+    if VIDEO_EXTENSIONS is None:
+        print("⚠️ OpenCV not available, skipping video processing")
     else:
-        print("⚠️ Images directory data/images/ not found")
-        
-except Exception as e:
-    print(f"❌ Error processing static images: {e}")
+        try:
+            update_index("Video frames", VID_DIR, VIDEO_EXTENSIONS, embed_video_files, new_video_searcher, args, state, "video", cache,
+                         thumbnail_path=THUMBNAILS_PATH)
+        except Exception as e:
+            print(f"❌ Error processing videos: {e}")
+
+    print("🖼️ Building static image index...")
+    try:
+        update_index("Static images", IMG_DIR, IMAGE_EXTENSIONS, embed_image_files, new_static_image_searcher, args, state, "static_image", cache)
+    except Exception as e:
+        print(f"❌ Error processing static images: {e}")
+
+    save_state(state, args.state_path)
+    if cache is not None:
+        cache.save()
+        print(f"💾 Embedding cache stats: {cache.get_stats()}")
+    print("🎉 All indexes built successfully!")
 
-print("🎉 All indexes built successfully!") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = "data/emb_cache"
+DEFAULT_MAX_MB = 1024
+
+def content_key(model_name, preprocess_version, content_hash):
+    """Key của cache: (model, phiên bản preprocessing, hash nội dung) -> sha256 hex"""
+    return hashlib.sha256(f"{model_name}|{preprocess_version}|{content_hash}".encode("utf-8")).hexdigest()
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def bytes_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _key_tag(key):
+    # 64 bit đầu của key, lưu cạnh vector để phát hiện slot bị ghi đè mà key index chưa kịp save
+    return np.uint64(int(key[:16], 16))
+
+def _file_signature(path):
+    # Key index được ghi bằng tmp + rename: inode/mtime/size đổi nghĩa là có bản save mới
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+class EmbeddingCache:
+    """
+    Cache embedding trên disk: vectors lưu trong file .npy memory-mapped (float16/float32),
+    key index nhỏ (OrderedDict key -> slot theo thứ tự LRU) lưu bằng pickle.
+    Khi đầy (max_entries) thì evict entry ít dùng nhất và tái sử dụng slot của nó.
+    Entry được publish theo thứ tự xóa tag -> ghi vector -> flush -> ghi tag, reader so tag trước và sau khi
+    copy vector nên process khác mmap cùng file (API readonly) không đọc được entry ghi dở;
+    reader readonly mở lại key index khi miss mà file trên disk đã có bản save mới.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, dim=512, dtype="float16", max_mb=DEFAULT_MAX_MB, readonly=False):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max(1, int(max_mb * 1024 * 1024 // (dim * self.dtype.itemsize)))
+        self.readonly = readonly
+        self.vectors_path = os.path.join(cache_dir, "vectors.npy")
+        self.tags_path = os.path.join(cache_dir, "tags.npy")
+        self.keys_path = os.path.join(cache_dir, "keys.pkl")
+        self.slots = OrderedDict()
+        self.free_slots = []
+        self.vectors = None
+        self.tags = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._keys_signature = _file_signature(self.keys_path)
+        if os.path.exists(self.keys_path) and os.path.exists(self.vectors_path):
+            with open(self.keys_path, "rb") as f:
+                state = pickle.load(f)
+            if state["dim"] != self.dim or np.dtype(state["dtype"]) != self.dtype:
+                print(f"⚠️ Embedding cache {self.cache_dir} has dim/dtype {state['dim']}/{state['dtype']}, ignoring it")
+            else:
+                mode = "r" if self.readonly else "r+"
+                self.vectors = np.load(self.vectors_path, mmap_mode=mode)
+                self.tags = np.load(self.tags_path, mmap_mode=mode)
+                self.slots = state["slots"]
+                used = set(self.slots.values())
+                self.free_slots = [i for i in range(len(self.vectors)) if i not in used]
+                return
+        if not self.readonly:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._allocate(min(1024, self.max_entries))
+
+    def _allocate(self, capacity):
+        """Tạo (hoặc nới rộng) file vectors/tags, copy dữ liệu cũ sang rồi thay thế atomically"""
+        old_capacity = 0 if self.vectors is None else len(self.vectors)
+        for path, attr, dtype, shape in ((self.vectors_path, "vectors", self.dtype, (capacity, self.dim)),
+                                         (self.tags_path, "tags", np.uint64, (capacity,))):
+            tmp_path = path + ".tmp.npy"
+            arr = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+            if getattr(self, attr) is not None:
+                arr[:old_capacity] = getattr(self, attr)
+            arr.flush()
+            del arr
+            setattr(self, attr, None)
+            os.replace(tmp_path, path)
+            setattr(self, attr, np.load(path, mmap_mode="r+"))
+        self.free_slots.extend(range(capacity - 1, old_capacity - 1, -1))
+
+    def _refresh(self):
+        """Reader readonly: map lại vectors/tags và key index nếu build đã save bản mới, True nếu có reload"""
+        if _file_signature(self.keys_path) == self._keys_signature:
+            return False
+        self.slots = OrderedDict()
+        self.free_slots = []
+        self.vectors = None
+        self.tags = None
+        self._open()
+        return True
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _lookup(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        tag = _key_tag(key)
+        if self.tags[slot] != tag:
+            return None
+        emb = np.array(self.vectors[slot], dtype="float32")
+        # Writer có thể ghi đè slot trong lúc copy: tag phải còn nguyên sau khi copy
+        if self.tags[slot] != tag:
+            return None
+        self.slots.move_to_end(key)
+        return emb
+
+    def get(self, key):
+        """Trả về embedding float32 hoặc None nếu chưa có trong cache"""
+        with self._lock:
+            emb = self._lookup(key)
+            if emb is None and self.readonly and self._refresh():
+                emb = self._lookup(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return emb
+
+    def put(self, key, emb):
+        self.put_many([(key, emb)])
+
+    def put_many(self, items):
+        """Ghi nhiều (key, emb) với một lần flush: tag chỉ được ghi sau khi vector của nó đã flush ra file"""
+        if self.readonly:
+            return
+        with self._lock:
+            writes = []
+            invalidated = False
+            for key, emb in items:
+                slot = self.slots.get(key)
+                if slot is None:
+                    # LRU eviction khi đã đạt giới hạn dung lượng
+                    while len(self.slots) >= self.max_entries:
+                        _, evicted = self.slots.popitem(last=False)
+                        self.free_slots.append(evicted)
+                    if not self.free_slots:
+                        self._allocate(min(self.max_entries, len(self.vectors) * 2))
+                    slot = self.free_slots.pop()
+                self.slots[key] = slot
+                self.slots.move_to_end(key)
+                # Slot tái sử dụng: xóa tag cũ trước để reader không ghép tag cũ với vector mới
+                if self.tags[slot] != 0:
+                    self.tags[slot] = 0
+                    invalidated = True
+                writes.append((slot, key, emb))
+            if not writes:
+                return
+            if invalidated:
+                self.tags.flush()
+            for slot, _, emb in writes:
+                self.vectors[slot] = np.asarray(emb, dtype=self.dtype)
+            self.vectors.flush()
+            for slot, key, _ in writes:
+                self.tags[slot] = _key_tag(key)
+
+    def save(self):
+        """Flush vectors ra disk và ghi key index (tmp file + rename)"""
+        if self.readonly or self.vectors is None:
+            return
+        with self._lock:
+            self.vectors.flush()
+            self.tags.flush()
+            tmp_path = self.keys_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"dim": self.dim, "dtype": self.dtype.str, "slots": self.slots}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.keys_path)
+            self._keys_signature = _file_signature(self.keys_path)
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.slots),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+def encode_with_cache(cache, keyed_items, encode_fn):
+    """
+    Encode (key, item) với cache: chỉ các item chưa có trong cache được đưa vào encode_fn
+    (encode_fn nhận iterable item, trả về mảng (M, dim)). Kết quả trả về đúng thứ tự input.
+    """
+    results = []
+    missing = []
+
+    def misses():
+        for key, item in keyed_items:
+            emb = cache.get(key) if cache is not None else None
+            results.append(emb)
+            if emb is None:
+                missing.append((len(results) - 1, key))
+                yield item
+
+    embs = encode_fn(misses())
+    for (pos, key), emb in zip(missing, embs):
+        results[pos] = emb
+    if cache is not None:
+        cache.put_many((key, results[pos]) for pos, key in missing)
+    if not results:
+        return embs
+    return np.stack(results).astype("float32")
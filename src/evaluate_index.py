@@ -0,0 +1,157 @@
+import argparse
+import time
+import faiss
+import numpy as np
+from faiss_pipeline import FaissMultiModalSearch, INDEX_TYPES, STORAGE_MODES, default_nlist, reconstruct_vectors
+
+SWEEP_NPROBE = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+SWEEP_EF_SEARCH = (16, 32, 64, 128, 256, 512)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Đánh giá offline FAISS index: recall@k so với exact search và throughput của search_batch")
+    parser.add_argument("--index", default="data/faiss_image.bin", help="File index (.bin)")
+    parser.add_argument("--meta", default="data/faiss_image.pkl", help="File metadata tương ứng")
+    parser.add_argument("--vectors", default=None, help="File .npy chứa vectors gốc (mặc định reconstruct từ index)")
+    parser.add_argument("--queries", type=int, default=1000, help="Số query lấy ngẫu nhiên từ vectors")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=256, help="Số query mỗi lần search_batch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sweep", action="store_true", help="Báo cáo recall vs latency theo nprobe (IVF) / efSearch (HNSW)")
+    parser.add_argument("--compare-types", default="", help="Build thử các loại index từ cùng vectors để so sánh, vd: flat,hnsw,ivf_flat,ivf_pq")
+    parser.add_argument("--compare-storage", default="", help="Benchmark các storage mode (bytes/vector, recall, latency), vd: float32,sq_fp16,sq8,opq_pq")
+    parser.add_argument("--storage-index-type", default="flat", choices=INDEX_TYPES, help="Loại index dùng cho --compare-storage")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="Số candidate = top_k * rerank_factor khi re-rank exact (0 = không đo re-rank)")
+    return parser.parse_args()
+
+def exact_ground_truth(ids, vectors, queries, top_k, use_cosine):
+    """Top-k chính xác bằng brute force (IndexFlatIP/L2) trên cùng tập vectors"""
+    flat = faiss.IndexFlatIP(vectors.shape[1]) if use_cosine else faiss.IndexFlatL2(vectors.shape[1])
+    if use_cosine:
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    flat.add(vectors.astype('float32'))
+    _, I = flat.search(queries.astype('float32'), top_k)
+    return ids[I]
+
+def recall_at_k(found_ids, true_ids):
+    """Tỉ lệ trung bình các ID đúng (theo exact search) xuất hiện trong top-k trả về"""
+    hits = [len(set(f[f >= 0]) & set(t[t >= 0])) / max(1, (t >= 0).sum()) for f, t in zip(found_ids, true_ids)]
+    return float(np.mean(hits)) if hits else 0.0
+
+def time_search(searcher, queries, top_k, batch_size):
+    """Search toàn bộ queries theo batch, trả về (ids, tổng thời gian giây)"""
+    found = []
+    start_time = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        found.append(searcher.search_batch(queries[i:i + batch_size], top_k=top_k).ids)
+    return np.concatenate(found), time.perf_counter() - start_time
+
+def sweep_values(searcher):
+    """Tham số search cần quét cho loại index hiện tại: (tên tham số, danh sách giá trị)"""
+    if searcher.use_ivfpq:
+        return "nprobe", [v for v in SWEEP_NPROBE if v <= searcher.nlist]
+    if searcher.index_type == "hnsw":
+        return "ef_search", list(SWEEP_EF_SEARCH)
+    return None, [None]
+
+def recall_latency_report(searcher, queries, true_ids, top_k, batch_size):
+    """In bảng recall@k vs latency (single-query) và QPS (batch) cho từng giá trị nprobe/efSearch"""
+    param, values = sweep_values(searcher)
+    print(f"📈 Recall vs latency ({searcher.index_type}):")
+    for value in values:
+        if param:
+            searcher.set_search_params(**{param: value})
+        single_ids, single_time = time_search(searcher, queries, top_k, 1)
+        _, batch_time = time_search(searcher, queries, top_k, batch_size)
+        label = f"{param}={value}" if param else "exact"
+        print(f"   {label:>14}  recall@{top_k}: {recall_at_k(single_ids, true_ids):.4f}  "
+              f"{single_time / len(queries) * 1000:.3f} ms/query  {len(queries) / batch_time:.1f} QPS (batch)")
+
+def build_candidate(index_type, ids, vectors, storage="float32"):
+    """Build index in-memory (không save) từ cùng tập vectors, giữ nguyên ID gốc để so với ground truth"""
+    searcher = FaissMultiModalSearch(dim=vectors.shape[1], index_type=index_type, nlist=default_nlist(len(vectors), index_type), use_id_map=True, storage=storage)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    searcher.train(vectors)
+    searcher.index.add_with_ids(vectors.astype('float32'), ids)
+    return searcher
+
+def index_bytes_per_vector(searcher):
+    """Dung lượng index đã serialize chia cho số vector (gần đúng RAM cần khi load)"""
+    return len(faiss.serialize_index(searcher.index)) / max(1, searcher.index.ntotal)
+
+def storage_report(ids, vectors, queries, true_ids, args):
+    """So sánh các storage mode trên cùng vectors: bytes/vector, recall@k, latency, có/không re-rank exact"""
+    print(f"💾 Storage modes ({args.storage_index_type}):")
+    # Side store theo ID (như file .vecs.npy) để re-rank
+    side_store = np.zeros((int(ids.max()) + 1, vectors.shape[1]), dtype='float32')
+    side_store[ids] = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    for storage in filter(None, args.compare_storage.split(",")):
+        if storage not in STORAGE_MODES:
+            print(f"⚠️ Unknown storage mode: {storage}")
+            continue
+        try:
+            candidate = build_candidate(args.storage_index_type, ids, vectors, storage=storage)
+        except ValueError as e:
+            print(f"⚠️ {storage}: {e}")
+            continue
+        rerank_factors = [0] + ([args.rerank_factor] if args.rerank_factor > 1 else [])
+        for rerank_factor in rerank_factors:
+            candidate.vectors = side_store if rerank_factor else None
+            candidate.rerank_factor = rerank_factor
+            found, elapsed = time_search(candidate, queries, args.top_k, 1)
+            label = f"{storage}+rerank{rerank_factor}" if rerank_factor else storage
+            print(f"   {label:>18}  {index_bytes_per_vector(candidate):8.1f} bytes/vector  recall@{args.top_k}: {recall_at_k(found, true_ids):.4f}  "
+                  f"{elapsed / len(queries) * 1000:.3f} ms/query")
+
+def main():
+    args = parse_args()
+    searcher = FaissMultiModalSearch(dim=512, index_path=args.index, meta_path=args.meta)
+    searcher.load()
+
+    if args.vectors or searcher.vectors is not None:
+        # Vectors gốc từ file chỉ định hoặc side store .vecs.npy của index
+        if args.vectors:
+            vectors = np.load(args.vectors).astype('float32')
+            ids = np.arange(len(vectors), dtype='int64')
+        else:
+            # Bỏ các ID đã bị remove khỏi index (row vẫn còn trong side store)
+            ids = searcher.meta.live_ids()
+            vectors = np.asarray(searcher.vectors[ids], dtype='float32')
+    else:
+        try:
+            ids, vectors = reconstruct_vectors(searcher)
+        except RuntimeError as e:
+            print(f"❌ Index does not support reconstruct ({e}), pass --vectors")
+            return
+
+    rng = np.random.default_rng(args.seed)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    true_ids = exact_ground_truth(ids, vectors, queries, args.top_k, searcher.use_cosine)
+
+    single_ids, single_time = time_search(searcher, queries, args.top_k, 1)
+    batch_ids, batch_time = time_search(searcher, queries, args.top_k, args.batch_size)
+
+    print(f"📊 Index: {args.index} ({searcher.get_stats()})")
+    print(f"🎯 recall@{args.top_k}: {recall_at_k(batch_ids, true_ids):.4f} ({len(queries)} queries)")
+    print(f"⏱️ Single-query search: {len(queries) / single_time:.1f} QPS ({single_time / len(queries) * 1000:.3f} ms/query)")
+    print(f"⚡ search_batch (batch_size={args.batch_size}): {len(queries) / batch_time:.1f} QPS ({batch_time / len(queries) * 1000:.3f} ms/query)")
+    if not np.array_equal(single_ids, batch_ids):
+        print("⚠️ Single-query and batched results differ")
+
+    if args.sweep:
+        recall_latency_report(searcher, queries, true_ids, args.top_k, args.batch_size)
+
+    for index_type in filter(None, args.compare_types.split(",")):
+        if index_type not in INDEX_TYPES:
+            print(f"⚠️ Unknown index type: {index_type}")
+            continue
+        start_time = time.perf_counter()
+        candidate = build_candidate(index_type, ids, vectors)
+        print(f"🏗️ Built {index_type} in {time.perf_counter() - start_time:.2f}s (nlist={candidate.nlist})")
+        recall_latency_report(candidate, queries, true_ids, args.top_k, args.batch_size)
+
+    if args.compare_storage:
+        storage_report(ids, vectors, queries, true_ids, args)
+
+if __name__ == "__main__":
+    main()
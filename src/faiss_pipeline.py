@@ -2,30 +2,254 @@ import faiss
 import numpy as np
 import os
 import pickle
+import shutil
 import time
 
+try:
+    from .meta_store import MetaStore, meta_store_path
+    from .snapshot import (IndexConsistencyError, DEFAULT_KEEP_SNAPSHOTS, snapshots_dir, snapshot_files, current_version,
+                           read_manifest, new_snapshot_dir, commit_snapshot, verify_snapshot)
+except ImportError:
+    # Chạy như script trong src/ (build_index_fixed.py, evaluate_index.py)
+    from meta_store import MetaStore, meta_store_path
+    from snapshot import (IndexConsistencyError, DEFAULT_KEEP_SNAPSHOTS, snapshots_dir, snapshot_files, current_version,
+                          read_manifest, new_snapshot_dir, commit_snapshot, verify_snapshot)
+
+class SearchResults:
+    """Kết quả của search_batch: ids và distances dạng mảng (nq, top_k), metadata đọc lazy theo ID"""
+
+    def __init__(self, ids, distances, meta, search_time_ms):
+        self.ids = ids
+        self.distances = distances
+        self.meta = meta
+        self.search_time_ms = search_time_ms
+
+    def __len__(self):
+        return len(self.ids)
+
+    def hits(self, q):
+        """Yield (id, distance) hợp lệ của query thứ q (bỏ padding -1 và ID đã bị remove)"""
+        for idx, distance in zip(self.ids[q], self.distances[q]):
+            if self.meta.is_alive(idx):
+                yield int(idx), float(distance)
+            elif idx >= len(self.meta):
+                print(f"⚠️ Warning: Index {idx} out of range (meta length: {len(self.meta)})")
+
+    def to_dicts(self, q):
+        """Kết quả query thứ q dạng list dict (copy metadata + id, distance, search_time_ms)"""
+        results = []
+        for idx, distance in self.hits(q):
+            result = self.meta[idx].copy()
+            result['id'] = idx
+            result['distance'] = distance
+            result['search_time_ms'] = self.search_time_ms
+            results.append(result)
+        return results
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+LOAD_MODES = ("memory", "mmap")
+# Cách lưu vector trong index: float32 (4 bytes/chiều), scalar quantizer fp16 (2) / int8 (1), PQ / OPQ+PQ (dim/8 bytes/vector)
+STORAGE_MODES = ("float32", "sq_fp16", "sq8", "pq", "opq_pq")
+SQ_TYPES = {"sq_fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+# Loại index dùng được với từng storage mode (ivf_pq + float32 được map sang pq vì IVF-PQ luôn lưu code PQ)
+STORAGE_INDEX_TYPES = {
+    "float32": INDEX_TYPES,
+    "sq_fp16": ("flat", "ivf_flat", "hnsw"),
+    "sq8": ("flat", "ivf_flat", "hnsw"),
+    "pq": ("flat", "ivf_pq"),
+    "opq_pq": ("flat", "ivf_flat", "ivf_pq"),
+}
+DEFAULT_EF_SEARCH = 64
+DEFAULT_HNSW_M = 32
+
+def check_storage(index_type, storage):
+    """Raise ValueError nếu storage không dùng được với index_type ("auto" luôn hợp lệ vì được chọn theo storage)"""
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"storage phải là một trong {STORAGE_MODES}, nhận được: {storage}")
+    if index_type != "auto" and index_type not in STORAGE_INDEX_TYPES[storage]:
+        raise ValueError(f"storage={storage} không dùng được với index_type={index_type} "
+                         f"(chỉ hỗ trợ: {', '.join(STORAGE_INDEX_TYPES[storage])})")
+
+def choose_index_type(num_vectors, storage="float32"):
+    """
+    Chọn loại index theo kích thước corpus:
+    < 10k: flat (exact, đủ nhanh); < 200k: hnsw; < 1M: ivf_flat; còn lại ivf_pq (nén vector để vừa RAM).
+    Loại không dùng được với storage thì đổi sang loại gần nhất: scalar quantizer -> ivf_flat (IVF-SQ vẫn nén), PQ -> ivf_pq.
+    """
+    if num_vectors < 10_000:
+        index_type = "flat"
+    elif num_vectors < 200_000:
+        index_type = "hnsw"
+    elif num_vectors < 1_000_000:
+        index_type = "ivf_flat"
+    else:
+        index_type = "ivf_pq"
+    if index_type not in STORAGE_INDEX_TYPES[storage]:
+        index_type = "ivf_flat" if storage in SQ_TYPES else "ivf_pq"
+    return index_type
+
+def default_nlist(num_vectors, index_type):
+    """nlist ~ 4*sqrt(N) (IVF-Flat) / 16*sqrt(N) (IVF-PQ), giữ mỗi list >= 39 điểm để k-means train ổn định"""
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        return 1
+    factor = 4 if index_type == "ivf_flat" else 16
+    return max(1, int(min(factor * np.sqrt(num_vectors), 65536, num_vectors // 39)))
+
+def _unwrap_index(index):
+    """Bỏ các lớp bọc ngoài (IndexIDMap, IndexPreTransform của OPQ) để lấy index lưu vector"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def detect_index_type(index):
+    """Xác định loại index đã load từ file (bỏ qua IndexIDMap/OPQ bọc ngoài)"""
+    index = _unwrap_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, (faiss.IndexIVFFlat, faiss.IndexIVFScalarQuantizer)):
+        return "ivf_flat"
+    if isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer, faiss.IndexPQ)):
+        return "flat"
+    return type(index).__name__
+
+def detect_storage(index):
+    """Xác định storage mode của index đã load: float32 / sq_fp16 / sq8 / pq / opq_pq"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexPreTransform):
+        return "opq_pq"
+    if isinstance(index, (faiss.IndexIVFPQ, faiss.IndexPQ)):
+        return "pq"
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+def reconstruct_vectors(searcher):
+    """Lấy lại (ids, vectors) đã lưu trong index (exact với Flat, gần đúng với index nén)"""
+    index = searcher.index
+    ids = None
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        ids = faiss.vector_to_array(index.id_map)
+        index = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    if ids is None:
+        ids = np.arange(index.ntotal, dtype='int64')
+    return ids, vectors
+
+def copy_invlists(invlists):
+    """Chép inverted lists (vd. OnDiskInvertedLists) sang ArrayInvertedLists trong RAM"""
+    copied = faiss.ArrayInvertedLists(invlists.nlist, invlists.code_size)
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            copied.add_entries(list_no, size, invlists.get_ids(list_no), invlists.get_codes(list_no))
+    copied.this.disown()
+    return copied
+
 class FaissMultiModalSearch:
-    def __init__(self, dim=512, index_path="data/faiss_index.bin", meta_path="data/faiss_meta.pkl", nlist=100, use_ivfpq=True, use_cosine=True):
+    def __init__(self, dim=512, index_path="data/faiss_index.bin", meta_path="data/faiss_meta.pkl", nlist=100, use_ivfpq=True, use_cosine=True, use_id_map=False,
+                 index_type=None, num_vectors=0, nprobe=None, ef_search=None, hnsw_m=DEFAULT_HNSW_M, pq_m=None, load_mode="memory", ivf_on_disk=False,
+                 storage="float32", rerank_factor=0, store_vectors=False, snapshots=False, keep_snapshots=DEFAULT_KEEP_SNAPSHOTS,
+                 model_name=None, verify_checksums=False):
         self.dim = dim
         self.index_path = index_path
         self.meta_path = meta_path
-        self.nlist = nlist
-        self.use_ivfpq = use_ivfpq
+        # snapshots=True: save() ghi snapshot có phiên bản (<index>.snapshots/vNNNNNN + CURRENT) thay vì ghi đè file tại chỗ;
+        # load() luôn ưu tiên snapshot CURRENT nếu có và kiểm tra khớp manifest (model_name, dim, số vector, kích thước file,
+        # sha256 khi verify_checksums=True)
+        self.snapshots = snapshots
+        self.keep_snapshots = keep_snapshots
+        self.model_name = model_name
+        self.verify_checksums = verify_checksums
+        self.snapshot_version = None
+        self.manifest = None
+        # mmap: index chỉ đọc, dữ liệu nằm trong page cache của OS và được chia sẻ giữa các worker process
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"load_mode phải là một trong {LOAD_MODES}, nhận được: {load_mode}")
+        self.load_mode = load_mode
+        self.read_only = False
+        # IVF: lưu inverted lists ra file .ivfdata riêng (OnDiskInvertedLists) thay vì nằm trong file index
+        self.ivf_on_disk = ivf_on_disk
         self.use_cosine = use_cosine
-        self.trained = False
-        self.meta = []
-        
-        # Tối ưu index type dựa trên kích thước dữ liệu
-        if use_ivfpq:
-            if use_cosine:
-                # Sử dụng IndexFlatIP cho cosine similarity
-                self.index = faiss.IndexFlatIP(dim)
+        self.use_id_map = use_id_map
+        self.meta = MetaStore()
+        # Side store .vecs.npy: vector float32 gốc (đã normalize) theo ID, dùng để re-rank exact các candidate
+        # của index nén; rerank_factor > 1 thì lấy top_k * rerank_factor candidate rồi tính lại distance chính xác
+        self.store_vectors = store_vectors
+        self.rerank_factor = rerank_factor
+        self.vectors = None
+        self._pending_vectors = []
+
+        # index_type=None giữ hành vi cũ của use_ivfpq; "auto" chọn theo num_vectors (kèm nlist) qua choose_index_type
+        legacy_type = index_type is None
+        if index_type is None:
+            index_type = "ivf_pq" if use_ivfpq else "flat"
+        elif index_type == "auto":
+            if storage not in STORAGE_MODES:
+                raise ValueError(f"storage phải là một trong {STORAGE_MODES}, nhận được: {storage}")
+            index_type = choose_index_type(num_vectors, storage)
+            nlist = default_nlist(num_vectors, index_type)
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type phải là một trong {INDEX_TYPES} hoặc 'auto', nhận được: {index_type}")
+        check_storage(index_type, storage)
+        if index_type == "ivf_flat" and storage == "opq_pq":
+            # IVF + OPQ luôn lưu code PQ (IndexIVFPQ), load lại sẽ được nhận là ivf_pq
+            index_type = "ivf_pq"
+        self.index_type = index_type
+        self.nlist = max(1, nlist)
+        # use_ivfpq: index dạng IVF (có nlist/nprobe); train hay không xét qua self.trained
+        self.use_ivfpq = index_type in ("ivf_flat", "ivf_pq")
+        if index_type == "ivf_pq" and storage == "float32":
+            # IVF-PQ luôn lưu code PQ: storage mặc định (kể cả khi "auto" chọn ivf_pq) được map sang pq
+            if not legacy_type:
+                print("ℹ️ index_type=ivf_pq stores PQ codes, using storage=pq")
+            storage = "pq"
+        # nprobe/efSearch do caller truyền vào: ghi đè giá trị lưu trong file khi load; None thì giữ giá trị của file
+        # (giá trị mặc định tính theo nlist chỉ áp dụng cho index mới build)
+        self.nprobe = self.requested_nprobe = nprobe
+        self.ef_search = self.requested_ef_search = ef_search
+
+        # Cosine = inner product trên vector đã normalize, dùng METRIC_INNER_PRODUCT cho mọi loại index
+        metric = faiss.METRIC_INNER_PRODUCT if use_cosine else faiss.METRIC_L2
+        # Mặc định mỗi sub-vector PQ 8 chiều, 8 bits/sub-vector (64 bytes/vector với dim=512)
+        m = pq_m or max(1, dim // 8)
+        if storage == "opq_pq":
+            # OPQ xoay vector trước khi PQ để giảm sai số lượng tử hóa; flat -> PQ, IVF -> IVF-PQ
+            if index_type == "flat":
+                inner = faiss.IndexPQ(dim, m, 8, metric)
             else:
-                quantizer = faiss.IndexFlatL2(dim)
-                # Tối ưu IVF+PQ parameters
-                m = min(8, dim // 64)  # Số sub-vectors
-                bits = 8  # Bits per sub-vector
-                self.index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, bits)
+                inner = faiss.IndexIVFPQ(faiss.IndexFlatIP(dim) if use_cosine else faiss.IndexFlatL2(dim), dim, self.nlist, m, 8, metric)
+            self.index = faiss.IndexPreTransform(faiss.OPQMatrix(dim, m), inner)
+        elif index_type == "flat":
+            if storage == "float32":
+                self.index = faiss.IndexFlatIP(dim) if use_cosine else faiss.IndexFlatL2(dim)
+            elif storage == "pq":
+                self.index = faiss.IndexPQ(dim, m, 8, metric)
+            else:
+                self.index = faiss.IndexScalarQuantizer(dim, SQ_TYPES[storage], metric)
+        elif index_type == "hnsw":
+            if storage == "float32":
+                self.index = faiss.IndexHNSWFlat(dim, hnsw_m, metric)
+            else:
+                self.index = faiss.IndexHNSWSQ(dim, SQ_TYPES[storage], hnsw_m, metric)
+            self.index.hnsw.efConstruction = max(40, 2 * hnsw_m)
+        else:
+            quantizer = faiss.IndexFlatIP(dim) if use_cosine else faiss.IndexFlatL2(dim)
+            if index_type == "ivf_pq":
+                self.index = faiss.IndexIVFPQ(quantizer, dim, self.nlist, m, 8, metric)
+            elif storage == "float32":
+                self.index = faiss.IndexIVFFlat(quantizer, dim, self.nlist, metric)
+            else:
+                self.index = faiss.IndexIVFScalarQuantizer(quantizer, dim, self.nlist, SQ_TYPES[storage], metric)
             # Enable GPU nếu có
             try:
                 res = faiss.StandardGpuResources()
@@ -33,12 +257,30 @@ class FaissMultiModalSearch:
                 print("✅ Using GPU acceleration")
             except:
                 print("⚠️ GPU not available, using CPU")
-        else:
-            # Sử dụng IndexFlatIP cho cosine hoặc IndexFlatL2 cho L2
-            if use_cosine:
-                self.index = faiss.IndexFlatIP(dim)
-            else:
-                self.index = faiss.IndexFlatL2(dim)
+        # SQ8/OPQ/IVF cần train trước khi add (Flat, HNSW-Flat, SQfp16 thì không)
+        self.trained = self.index.is_trained
+        self.storage = detect_storage(self.index)
+        self.set_search_params(nprobe=nprobe or max(1, min(self.nlist, max(16, self.nlist // 32))), ef_search=ef_search or DEFAULT_EF_SEARCH)
+
+        # IndexIDMap: ID của vector = vị trí trong self.meta, cho phép remove_ids khi update incremental
+        if use_id_map:
+            self.index = faiss.IndexIDMap(self.index)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Đặt tham số search cân bằng recall/latency: nprobe (IVF) hoặc efSearch (HNSW).
+        Giá trị được ghi vào index nên được lưu cùng file khi save.
+        """
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            if nprobe:
+                ivf.nprobe = min(int(nprobe), ivf.nlist)
+            self.nprobe = ivf.nprobe
+        base = _unwrap_index(self.index)
+        if isinstance(base, faiss.IndexHNSW):
+            if ef_search:
+                base.hnsw.efSearch = int(ef_search)
+            self.ef_search = base.hnsw.efSearch
 
     def normalize_embedding(self, emb):
         """Normalize embedding để sử dụng cosine similarity"""
@@ -52,9 +294,9 @@ class FaissMultiModalSearch:
     def add(self, emb, meta):
         emb = np.array(emb).reshape(1, -1).astype('float32')
         emb = self.normalize_embedding(emb)
-        if self.use_ivfpq and not self.trained:
+        if not self.trained:
             raise RuntimeError("Index chưa được train! Hãy gọi train trước khi add.")
-        self.index.add(emb)
+        self._add_vectors(emb)
         self.meta.append(meta)
 
     def add_batch(self, embs, metas):
@@ -64,14 +306,53 @@ class FaissMultiModalSearch:
             norms = np.linalg.norm(embs, axis=1, keepdims=True)
             norms[norms == 0] = 1  # Tránh division by zero
             embs = embs / norms
-        if self.use_ivfpq and not self.trained:
+        if not self.trained:
             raise RuntimeError("Index chưa được train! Hãy gọi train trước khi add.")
-        self.index.add(embs)
+        self._add_vectors(embs)
         self.meta.extend(metas)
 
+    def _add_vectors(self, embs):
+        if self.read_only:
+            raise RuntimeError("Index được load ở chế độ mmap (read-only), không thể add")
+        if self.use_id_map:
+            ids = np.arange(len(self.meta), len(self.meta) + len(embs), dtype='int64')
+            self.index.add_with_ids(embs, ids)
+        else:
+            self.index.add(embs)
+        if self.store_vectors:
+            self._pending_vectors.append(np.asarray(embs, dtype='float32'))
+
+    def remove_ids(self, ids):
+        """Xóa vector theo ID (cần IndexIDMap), metadata tương ứng được đánh dấu None để giữ nguyên ID các vector khác"""
+        if not self.use_id_map:
+            raise RuntimeError("Index không dùng IndexIDMap, không thể remove_ids")
+        if self.index_type == "hnsw":
+            raise RuntimeError("HNSW không hỗ trợ remove_ids, cần build lại index")
+        if self.read_only:
+            raise RuntimeError("Index được load ở chế độ mmap (read-only), không thể remove_ids")
+        ids = np.asarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return 0
+        removed = self.index.remove_ids(ids)
+        for idx in ids:
+            self.meta[idx] = None
+        return removed
+
+    def ids_by_file(self, file_name):
+        """Lấy ID của tất cả vector thuộc một file nguồn"""
+        return self.meta.find_rows('file', file_name)
+
+    def live_count(self):
+        """Số metadata còn hiệu lực (không tính các ID đã bị remove)"""
+        return self.meta.live_count()
+
     def train(self, embs):
-        if self.use_ivfpq and not self.trained:
+        if not self.trained:
             embs = np.array(embs).astype('float32')
+            # k-means chỉ cần ~256 điểm mỗi list (PQ/SQ8 cần ít nhất vài chục nghìn điểm), sample bớt khi corpus lớn để train nhanh
+            max_samples = max(256 * self.nlist, 65536)
+            if len(embs) > max_samples:
+                embs = embs[np.random.default_rng(0).choice(len(embs), size=max_samples, replace=False)]
             # Normalize training data
             if self.use_cosine:
                 norms = np.linalg.norm(embs, axis=1, keepdims=True)
@@ -85,108 +366,297 @@ class FaissMultiModalSearch:
 
     def search(self, emb, top_k=5):
         try:
-            emb = np.array(emb).reshape(1, -1).astype('float32')
-            emb = self.normalize_embedding(emb)
-            start_time = time.time()
-            
-            # Tối ưu search parameters
-            if self.use_ivfpq and not self.use_cosine:
-                # Sử dụng nprobe để cân bằng tốc độ và độ chính xác
-                nprobe = min(16, self.nlist // 4)
-                self.index.nprobe = nprobe
-            
-            D, I = self.index.search(emb, top_k)
-            search_time = time.time() - start_time
-            
-            results = []
-            for i, idx in enumerate(I[0]):
-                if idx < len(self.meta):
-                    result = self.meta[idx].copy()
-                    # Chuyển đổi distance dựa trên metric
-                    if self.use_cosine:
-                        # Cosine similarity: càng cao càng tốt, chuyển thành distance
-                        similarity = float(D[0][i])
-                        distance = 1.0 - similarity  # Chuyển thành distance (0-2)
-                    else:
-                        # L2 distance: càng thấp càng tốt
-                        distance = float(D[0][i])
-                    result['distance'] = distance
-                    result['search_time_ms'] = round(search_time * 1000, 2)
-                    results.append(result)
-                else:
-                    print(f"⚠️ Warning: Index {idx} out of range (meta length: {len(self.meta)})")
-            
-            return results
+            return self.search_batch(emb, top_k=top_k).to_dicts(0)
         except Exception as e:
             print(f"❌ Error in search: {e}")
             print(f"   Index size: {self.index.ntotal}")
             print(f"   Meta length: {len(self.meta)}")
             raise
 
+    def search_batch(self, embs, top_k=5):
+        """
+        Search cả ma trận query (nq, dim) bằng một lần index.search (FAISS dùng BLAS + multi-thread cho batch).
+        Trả về SearchResults (mảng ids/distances), metadata chỉ được đọc khi cần.
+        """
+        embs = np.atleast_2d(np.array(embs, dtype='float32'))
+        if self.use_cosine:
+            norms = np.linalg.norm(embs, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            embs = embs / norms
+        start_time = time.time()
+        if self.rerank_factor > 1 and self.vectors is not None:
+            D, I = self.index.search(embs, top_k * self.rerank_factor)
+            D, I = self._rerank(embs, I, top_k)
+        else:
+            D, I = self.index.search(embs, top_k)
+        search_time = time.time() - start_time
+
+        # Chuyển đổi distance dựa trên metric
+        if self.use_cosine:
+            # Cosine similarity: càng cao càng tốt, chuyển thành distance (0-2)
+            D = 1.0 - D
+        return SearchResults(I, D, self.meta, round(search_time * 1000, 2))
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def ivfdata_path(self):
+        return os.path.splitext(self.index_path)[0] + ".ivfdata"
+
+    def _move_invlists_on_disk(self, path):
+        """Chép inverted lists của IVF sang OnDiskInvertedLists tại path, index dùng luôn bản on-disk này"""
+        ivf = faiss.extract_index_ivf(self.index)
+        ondisk = faiss.OnDiskInvertedLists(ivf.nlist, ivf.code_size, path)
+        lists = faiss.InvertedListsPtrVector()
+        lists.push_back(ivf.invlists)
+        if hasattr(ondisk, "merge_from_multiple"):
+            ondisk.merge_from_multiple(lists.data(), lists.size(), False, False)
+        else:
+            ondisk.merge_from(lists.data(), lists.size())
+        # Index chỉ ghi tên file, khi load dùng IO_FLAG_ONDISK_SAME_DIR để tìm .ivfdata cạnh file index
+        ondisk.filename = os.path.basename(self.ivfdata_path)
+        ivf.replace_invlists(ondisk, True)
+        ondisk.this.disown()
+
+    def _rerank(self, embs, I, top_k):
+        """Tính lại distance chính xác cho các candidate từ side store (chỉ đọc các row cần thiết của file mmap)"""
+        valid = (I >= 0) & (I < len(self.vectors))
+        rows = np.asarray(self.vectors[np.where(valid, I, 0).ravel()], dtype='float32').reshape(I.shape + (self.vectors.shape[1],))
+        if self.use_cosine:
+            scores = np.einsum('qkd,qd->qk', rows, embs)
+            scores[~valid] = -np.inf
+            order = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+        else:
+            scores = ((rows - embs[:, None, :]) ** 2).sum(axis=2)
+            scores[~valid] = np.inf
+            order = np.argsort(scores, axis=1, kind='stable')[:, :top_k]
+        I = np.take_along_axis(np.where(valid, I, -1), order, axis=1)
+        D = np.take_along_axis(scores, order, axis=1).astype('float32')
+        return D, I
+
+    @property
+    def vectors_path(self):
+        return os.path.splitext(self.index_path)[0] + ".vecs.npy"
+
+    def _save_vectors(self):
+        """Ghi side store = vectors đã có + vectors mới add (tmp + os.replace), row i là vector có ID i"""
+        base_count = len(self.vectors) if self.vectors is not None else 0
+        total = base_count + sum(len(v) for v in self._pending_vectors)
+        if total != len(self.meta):
+            print(f"⚠️ Vector side store does not cover all ids ({total} vectors, {len(self.meta)} ids), skipping {self.vectors_path}")
+            return
+        tmp_path = f"{self.vectors_path}.tmp"
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='float32', shape=(total, self.dim))
+        if base_count:
+            out[:base_count] = self.vectors
+        position = base_count
+        for chunk in self._pending_vectors:
+            out[position:position + len(chunk)] = chunk
+            position += len(chunk)
+        out.flush()
+        del out
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.load(self.vectors_path, mmap_mode='r')
+        self._pending_vectors = []
+        print(f"✅ Saved vectors to {self.vectors_path}")
+
     def save(self):
+        # Index đã có snapshot thì luôn ghi snapshot mới: load() ưu tiên CURRENT nên file ghi tại chỗ sẽ bị bỏ qua
+        if self.snapshots or current_version(self.index_path):
+            self.save_snapshot()
+        else:
+            self._save_files()
+
+    def _manifest(self):
+        return {
+            "count": int(self.index.ntotal),
+            "meta_rows": len(self.meta),
+            "live_count": self.live_count(),
+            "dim": int(self.index.d),
+            "index_type": self.index_type,
+            "storage": self.storage,
+            "metric": "cosine" if self.use_cosine else "L2",
+            "model_name": self.model_name
+        }
+
+    def save_snapshot(self):
+        """Ghi toàn bộ file vào thư mục tạm, rename thành phiên bản mới rồi đổi CURRENT; trả về phiên bản"""
+        if self.index.ntotal != self.live_count():
+            raise IndexConsistencyError(f"Index size ({self.index.ntotal}) != Meta size ({self.live_count()}), refusing to snapshot")
+        tmp_dir = new_snapshot_dir(self.index_path)
+        logical_paths = (self.index_path, self.meta_path)
+        self.index_path, self.meta_path = snapshot_files(tmp_dir)
+        try:
+            self._save_files()
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        finally:
+            self.index_path, self.meta_path = logical_paths
+        self.snapshot_version = commit_snapshot(self.index_path, tmp_dir, self._manifest(), self.keep_snapshots)
+        self.manifest = read_manifest(self.index_path, self.snapshot_version)
+        print(f"✅ Committed snapshot {self.snapshot_version} ({snapshots_dir(self.index_path)})")
+        return self.snapshot_version
+
+    def _save_files(self):
         try:
-            # Lưu index
-            faiss.write_index(self.index, self.index_path)
-            
-            # Lưu metadata với compression
-            with open(self.meta_path, 'wb') as f:
-                pickle.dump(self.meta, f, protocol=pickle.HIGHEST_PROTOCOL)
-            
+            # Ghi ra file tạm rồi os.replace: process đang mmap file cũ không bị ảnh hưởng
+            tmp_path = f"{self.index_path}.tmp"
+            if self.ivf_on_disk and self.use_ivfpq:
+                self._move_invlists_on_disk(f"{self.ivfdata_path}.tmp")
+                faiss.write_index(self.index, tmp_path)
+                os.replace(f"{self.ivfdata_path}.tmp", self.ivfdata_path)
+            else:
+                faiss.write_index(self.index, tmp_path)
+                if os.path.exists(self.ivfdata_path):
+                    os.remove(self.ivfdata_path)
+            os.replace(tmp_path, self.index_path)
+
+            if self.store_vectors:
+                self._save_vectors()
+            elif os.path.exists(self.vectors_path):
+                # Build lại không kèm side store: xóa file cũ để không re-rank bằng vector lỗi thời
+                os.remove(self.vectors_path)
+                self.vectors = None
+
+            # Lưu metadata dạng cột (memory-mapped khi load) thay cho pickle list dict
+            store_path = meta_store_path(self.meta_path)
+            self.meta.save(store_path)
+
             print(f"✅ Saved index to {self.index_path}")
-            print(f"✅ Saved metadata to {self.meta_path}")
+            print(f"✅ Saved metadata to {store_path}")
         except Exception as e:
             print(f"❌ Error saving: {e}")
             raise
 
     def load(self):
+        version = current_version(self.index_path)
+        if version is None:
+            self._load_files()
+        else:
+            self.load_snapshot(version)
+
+    def load_snapshot(self, version):
+        """Load snapshot theo phiên bản, raise IndexConsistencyError nếu file/index/metadata không khớp manifest"""
+        snapshot_dir = os.path.join(snapshots_dir(self.index_path), version)
+        manifest = read_manifest(self.index_path, version)
+        verify_snapshot(snapshot_dir, manifest, checksums=self.verify_checksums)
+        if self.model_name and manifest.get("model_name") and manifest["model_name"] != self.model_name:
+            raise IndexConsistencyError(f"Snapshot {version} was built with {manifest['model_name']}, expected {self.model_name}")
+        if manifest["dim"] != self.dim:
+            raise IndexConsistencyError(f"Snapshot {version} has dim {manifest['dim']}, expected {self.dim}")
+        logical_paths = (self.index_path, self.meta_path)
+        self.index_path, self.meta_path = snapshot_files(snapshot_dir)
+        try:
+            self._load_files()
+        finally:
+            self.index_path, self.meta_path = logical_paths
+        for key, actual in (("count", self.index.ntotal), ("meta_rows", len(self.meta)), ("live_count", self.live_count())):
+            if manifest[key] != actual:
+                raise IndexConsistencyError(f"Snapshot {version}: {key} is {actual}, manifest says {manifest[key]}")
+        # Index load từ snapshot thì lần save sau (update incremental) cũng ghi snapshot mới
+        self.snapshots = True
+        self.snapshot_version = version
+        self.manifest = manifest
+
+    def _load_files(self):
         try:
             if os.path.exists(self.index_path):
-                self.index = faiss.read_index(self.index_path)
-                if self.use_ivfpq:
-                    self.trained = self.index.is_trained
+                self.index = self._read_index()
+                self.read_only = self.load_mode == "mmap"
+                self.use_id_map = isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+                self.index_type = detect_index_type(self.index)
+                self.use_ivfpq = self.index_type in ("ivf_flat", "ivf_pq")
+                self.use_cosine = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+                self.trained = self.index.is_trained
+                self.storage = detect_storage(self.index)
+                if os.path.exists(self.vectors_path):
+                    self.vectors = np.load(self.vectors_path, mmap_mode='r')
+                    # Index đã có side store thì update incremental tiếp tục ghi vectors mới
+                    self.store_vectors = not self.read_only
+                ivf = faiss.try_extract_index_ivf(self.index)
+                if ivf is not None:
+                    self.nlist = ivf.nlist
+                    if not self.read_only and os.path.exists(self.ivfdata_path):
+                        # Load để update: chép inverted lists vào RAM, không ghi vào file .ivfdata mà API đang mmap
+                        ivf.replace_invlists(copy_invlists(ivf.invlists), True)
+                # Chỉ nprobe/efSearch truyền vào constructor mới ghi đè giá trị đã lưu trong file
+                self.set_search_params(nprobe=self.requested_nprobe, ef_search=self.requested_ef_search)
                 print(f"✅ Loaded index from {self.index_path} (size: {self.index.ntotal})")
             else:
                 print(f"❌ Index file not found: {self.index_path}")
                 raise FileNotFoundError(f"Index file not found: {self.index_path}")
                 
-            if os.path.exists(self.meta_path):
+            store_path = meta_store_path(self.meta_path)
+            if os.path.exists(store_path):
+                self.meta = MetaStore.open(store_path)
+                print(f"✅ Loaded metadata from {store_path} (size: {self.live_count()})")
+            elif os.path.exists(self.meta_path):
+                # Index build bằng phiên bản cũ: đọc pickle, lần save tiếp theo sẽ ghi dạng cột
                 with open(self.meta_path, 'rb') as f:
-                    self.meta = pickle.load(f)
-                print(f"✅ Loaded metadata from {self.meta_path} (size: {len(self.meta)})")
+                    self.meta = MetaStore(pickle.load(f))
+                print(f"✅ Loaded metadata from {self.meta_path} (size: {self.live_count()})")
             else:
                 print(f"❌ Metadata file not found: {self.meta_path}")
                 raise FileNotFoundError(f"Metadata file not found: {self.meta_path}")
                 
-            # Kiểm tra tính nhất quán
-            if self.index.ntotal != len(self.meta):
-                print(f"⚠️ Warning: Index size ({self.index.ntotal}) != Meta size ({len(self.meta)})")
+            # Kiểm tra tính nhất quán: index và metadata lệch nhau thì ID trả về trỏ sai metadata
+            if self.index.ntotal != self.live_count():
+                raise IndexConsistencyError(f"Index size ({self.index.ntotal}) != Meta size ({self.live_count()})")
                 
         except Exception as e:
             print(f"❌ Error loading: {e}")
             raise
 
+    def _read_index(self):
+        """faiss.read_index với IO flags theo load_mode"""
+        ondisk = os.path.exists(self.ivfdata_path)
+        if self.load_mode == "memory":
+            return faiss.read_index(self.index_path, faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY if ondisk else 0)
+        if ondisk:
+            # OnDiskInvertedLists tự mmap file .ivfdata, không kết hợp với IO_FLAG_MMAP
+            return faiss.read_index(self.index_path, faiss.IO_FLAG_ONDISK_SAME_DIR | faiss.IO_FLAG_READ_ONLY)
+        # IO_FLAG_MMAP_IFC (faiss >= 1.9): mmap codes của Flat/HNSW storage; IVF không đọc được với flag này
+        mmap_ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        if mmap_ifc:
+            try:
+                return faiss.read_index(self.index_path, mmap_ifc | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass
+        # IO_FLAG_MMAP: inverted lists IVF được mmap thẳng từ file index
+        index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        if not mmap_ifc and faiss.try_extract_index_ivf(index) is None:
+            # faiss < 1.9 (vd. faiss-cpu==1.7.4 trong requirements.txt) không mmap được Flat/HNSW: mỗi process giữ một bản riêng
+            print(f"⚠️ faiss {faiss.__version__} has no IO_FLAG_MMAP_IFC: {self.index_path} ({detect_index_type(index)}) "
+                  f"is loaded as a private copy, mmap only shares IVF indexes (upgrade to faiss >= 1.9)")
+        return index
+
     def get_stats(self):
         """Lấy thống kê về index"""
         return {
             "index_size": self.index.ntotal,
-            "meta_size": len(self.meta),
+            "meta_size": self.live_count(),
             "dimension": self.dim,
-            "index_type": "IVFPQ" if self.use_ivfpq else "FlatIP" if self.use_cosine else "FlatL2",
+            "index_type": self.index_type,
             "distance_metric": "cosine" if self.use_cosine else "L2",
-            "trained": self.trained if self.use_ivfpq else True
+            "trained": self.trained,
+            "nlist": self.nlist if self.use_ivfpq else None,
+            "nprobe": self.nprobe if self.use_ivfpq else None,
+            "ef_search": self.ef_search if self.index_type == "hnsw" else None,
+            "load_mode": self.load_mode,
+            "storage": self.storage,
+            "rerank_factor": self.rerank_factor if self.vectors is not None else 0,
+            "snapshot": self.snapshot_version
         }
 
 if __name__ == "__main__":
     # Ví dụ build index cho text với IVF+PQ
-    from text_pipeline import preprocess, get_embedding as get_text_emb
+    from text_pipeline import preprocess, get_embedding as get_text_emb, get_embeddings_batch
     texts = ["Tôi yêu tiếng Việt và AI Challenge 2025.", "Trí tuệ nhân tạo đang thay đổi thế giới."]
-    embs = []
-    metas = []
-    for t in texts:
-        clean = preprocess(t)
-        emb = get_text_emb(clean)
-        embs.append(emb)
-        metas.append(t)
+    embs = get_embeddings_batch(texts)
+    metas = [{"text": t} for t in texts]
     searcher = FaissMultiModalSearch(dim=768, index_path="data/faiss_text.bin", meta_path="data/faiss_text.pkl", nlist=10, use_ivfpq=True)
     searcher.train(embs)
     searcher.add_batch(embs, metas)
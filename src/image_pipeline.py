@@ -1,18 +1,247 @@
 from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
-import torch
+import numpy as np
+import io
 import os
+import queue
+import threading
+import time
+
+try:
+    from .runtime_config import apply_torch_threads, runtime_threads
+except ImportError:
+    from runtime_config import apply_torch_threads, runtime_threads
 
 # Sử dụng CLIP
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+CLIP_EMBED_DIM = 512
+
+# Backend inference: torch (CLIPModel fp32), onnx (ONNX Runtime fp32) hoặc onnx-int8 (dynamic int8 quantization)
+# Model ONNX export bằng: python src/onnx_backend.py export --quantize
+CLIP_BACKENDS = ("torch", "onnx", "onnx-int8")
+CLIP_BACKEND = os.environ.get("CLIP_BACKEND", "torch")
+
+# torch/transformers và model CLIP chỉ được load ở lần dùng đầu tiên (hoặc warm-up), import module này rất nhẹ
+_clip = None
+_processor = None
+_encoder = None
+_clip_lock = threading.Lock()
+_encoder_lock = threading.Lock()
+
+def load_processor():
+    """CLIPProcessor (tokenizer + image preprocess), dùng chung cho mọi backend"""
+    global _processor
+    if _processor is None:
+        with _clip_lock:
+            if _processor is None:
+                from transformers import CLIPProcessor
+                _processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    return _processor
+
+def load_clip():
+    """Load CLIP model (torch) + processor một lần (thread-safe), trả về (model, processor)"""
+    global _clip
+    if _clip is None:
+        processor = load_processor()
+        with _clip_lock:
+            if _clip is None:
+                from transformers import CLIPModel
+                apply_torch_threads()
+                start_time = time.time()
+                _clip = (CLIPModel.from_pretrained(CLIP_MODEL_NAME), processor)
+                print(f"✅ Loaded CLIP {CLIP_MODEL_NAME} in {time.time() - start_time:.2f}s")
+    return _clip
+
+class TorchClipEncoder:
+    """Backend mặc định: forward CLIPModel bằng PyTorch, input/output giống ONNX backend (trả về numpy)"""
+    name = "torch"
+    tensor_type = "pt"
+
+    def __init__(self, model):
+        self.model = model
+
+    def text_features(self, inputs):
+        import torch
+        with torch.inference_mode():
+            return self.model.get_text_features(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).cpu().numpy()
+
+    def image_features(self, pixel_values):
+        import torch
+        with torch.inference_mode():
+            return self.model.get_image_features(pixel_values=pixel_values).cpu().numpy()
+
+    def concat(self, pixel_values_list):
+        import torch
+        return torch.cat(list(pixel_values_list))
+
+def create_encoder(backend):
+    if backend not in CLIP_BACKENDS:
+        raise ValueError(f"Unknown CLIP backend: {backend} (expected one of {CLIP_BACKENDS})")
+    if backend == "torch":
+        return TorchClipEncoder(load_clip()[0])
+    try:
+        from .onnx_backend import OnnxClipEncoder
+    except ImportError:
+        from onnx_backend import OnnxClipEncoder
+    return OnnxClipEncoder(quantized=backend == "onnx-int8", num_threads=runtime_threads())
+
+def load_encoder():
+    """Encoder theo CLIP_BACKEND, tạo một lần (thread-safe)"""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = create_encoder(CLIP_BACKEND)
+                print(f"✅ CLIP backend: {_encoder.name}")
+    return _encoder
+
+def is_clip_loaded():
+    return _encoder is not None
+
+def __getattr__(name):
+    # Giữ tương thích với code cũ dùng image_pipeline.clip_model / clip_processor
+    if name == "clip_model":
+        return load_clip()[0]
+    if name == "clip_processor":
+        return load_processor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Tăng version khi đổi cách preprocess để embedding cache không trả về kết quả cũ
+TEXT_PREPROCESS_VERSION = "text-v1"
+IMAGE_PREPROCESS_VERSION = "image-v1"
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_PREFETCH = 4
+
+# Giới hạn số pixel khi decode ảnh từ bytes (upload): kiểm tra từ header trước khi decode toàn bộ ảnh
+MAX_IMAGE_PIXELS = 40_000_000
+# JPEG được decode ở scale nhỏ nhất (1/2, 1/4, 1/8) mà cạnh ngắn vẫn >= DRAFT_MIN_SIDE, CLIP chỉ cần 224
+DRAFT_MIN_SIDE = 448
 
 def get_image_embedding(image_path):
-    image = Image.open(image_path).convert("RGB")
-    inputs = clip_processor(images=image, return_tensors="pt")
-    with torch.no_grad():
-        emb = clip_model.get_image_features(**inputs)
-    return emb[0].cpu().numpy()
+    encoder = load_encoder()
+    inputs = load_processor()(images=load_image(image_path), return_tensors=encoder.tensor_type)
+    return encoder.image_features(inputs["pixel_values"])[0]
+
+def decode_image_bytes(data, max_pixels=MAX_IMAGE_PIXELS, min_side=DRAFT_MIN_SIDE):
+    """
+    Decode ảnh từ bytes trong memory (không ghi file tạm) thành PIL.Image RGB.
+    Raise ValueError nếu ảnh vượt max_pixels; JPEG được downscale ngay lúc decode bằng Image.draft.
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.width * image.height > max_pixels:
+        raise ValueError(f"Image too large ({image.width}x{image.height}, max {max_pixels} pixels)")
+    # draft() chỉ có tác dụng với JPEG, các format khác decode bình thường
+    image.draft("RGB", (min_side, min_side))
+    return image.convert("RGB")
+
+def load_image(item):
+    """Chuẩn hóa input ảnh (đường dẫn, bytes, PIL.Image hoặc mảng RGB) thành PIL.Image RGB"""
+    if isinstance(item, Image.Image):
+        return item.convert("RGB")
+    if isinstance(item, np.ndarray):
+        return Image.fromarray(item).convert("RGB")
+    if isinstance(item, (bytes, bytearray, memoryview)):
+        return decode_image_bytes(bytes(item))
+    return Image.open(item).convert("RGB")
+
+def _chunks(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _prefetch_batches(items, batch_size, prepare_fn, prefetch):
+    """Chạy decode + preprocess trong thread riêng, đẩy trước tối đa `prefetch` batch vào queue"""
+    q = queue.Queue(maxsize=max(1, prefetch))
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # Không block mãi khi consumer đã dừng giữa chừng
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for batch in _chunks(items, batch_size):
+                if not put((len(batch), prepare_fn(batch))):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(done)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def _report_throughput(kind, count, elapsed, batch_size):
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"⚡ Encoded {count} {kind} in {elapsed:.2f}s ({rate:.1f} items/s, batch_size={batch_size})")
+
+def _encode(items, kind, prepare_fn, forward_fn, batch_size, prefetch, report):
+    start_time = time.time()
+    embs = []
+    count = 0
+    for n, inputs in _prefetch_batches(items, batch_size, prepare_fn, prefetch):
+        embs.append(forward_fn(inputs))
+        count += n
+    elapsed = time.time() - start_time
+    if report:
+        _report_throughput(kind, count, elapsed, batch_size)
+    if not embs:
+        return np.zeros((0, CLIP_EMBED_DIM), dtype="float32")
+    return np.concatenate(embs).astype("float32")
+
+def encode_texts(texts, batch_size=DEFAULT_BATCH_SIZE, prefetch=DEFAULT_PREFETCH, report=False):
+    """Encode danh sách text bằng CLIP theo batch, trả về mảng (N, 512)"""
+    encoder, processor = load_encoder(), load_processor()
+
+    def prepare(batch):
+        return processor(text=batch, return_tensors=encoder.tensor_type, padding=True, truncation=True, max_length=77)
+    return _encode(texts, "texts", prepare, encoder.text_features, batch_size, prefetch, report)
+
+def encode_images(images, batch_size=DEFAULT_BATCH_SIZE, prefetch=DEFAULT_PREFETCH, report=False):
+    """Encode ảnh (đường dẫn, bytes, PIL.Image hoặc mảng RGB) bằng CLIP theo batch, trả về mảng (N, 512)"""
+    encoder, processor = load_encoder(), load_processor()
+
+    def prepare(batch):
+        return processor(images=[load_image(item) for item in batch], return_tensors=encoder.tensor_type)["pixel_values"]
+    return _encode(images, "images", prepare, encoder.image_features, batch_size, prefetch, report)
+
+def embed_text_batch(texts):
+    """Một lần forward CLIP cho cả list text (dùng cho micro-batching ở API)"""
+    encoder = load_encoder()
+    inputs = load_processor()(text=list(texts), return_tensors=encoder.tensor_type, padding=True, truncation=True, max_length=77)
+    return encoder.text_features(inputs)
+
+def preprocess_image(image):
+    """Preprocess một ảnh thành pixel_values (1, 3, 224, 224), chạy ở thread của request"""
+    return load_processor()(images=load_image(image), return_tensors=load_encoder().tensor_type)["pixel_values"]
+
+def embed_pixel_values(pixel_values_list):
+    """Một lần forward CLIP cho nhiều ảnh đã preprocess (dùng cho micro-batching ở API)"""
+    encoder = load_encoder()
+    return encoder.image_features(encoder.concat(pixel_values_list))
 
 if __name__ == "__main__":
     sample_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'sample.jpg')
@@ -20,4 +249,4 @@ if __name__ == "__main__":
         emb = get_image_embedding(sample_path)
         print("CLIP Embedding shape:", emb.shape)
     else:
-        print("Vui lòng đặt file ảnh mẫu tại data/sample.jpg để test.") 
\ No newline at end of file
+        print("Vui lòng đặt file ảnh mẫu tại data/sample.jpg để test.")
@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+
+STATE_PATH = "data/index_state.json"
+
+def content_hash(path, chunk_size=1 << 20):
+    """SHA-256 của nội dung file (đọc theo chunk để không load cả file vào RAM)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_fingerprint(path, previous=None):
+    """
+    Fingerprint của file: size, mtime_ns và sha256.
+    Nếu size + mtime không đổi so với fingerprint cũ thì dùng lại hash cũ, không đọc lại file.
+    """
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previous and previous.get("size") == fp["size"] and previous.get("mtime_ns") == fp["mtime_ns"]:
+        fp["sha256"] = previous["sha256"]
+    else:
+        fp["sha256"] = content_hash(path)
+    return fp
+
+def diff_sources(paths, previous):
+    """
+    So sánh các file nguồn hiện tại ({tên: đường dẫn}) với fingerprints lần build trước.
+    Trả về (added, changed, removed, fingerprints) - file chỉ đổi mtime mà cùng hash không tính là changed.
+    """
+    previous = previous or {}
+    fingerprints = {}
+    added, changed = [], []
+    for name in sorted(paths):
+        fp = file_fingerprint(paths[name], previous.get(name))
+        fingerprints[name] = fp
+        if name not in previous:
+            added.append(name)
+        elif previous[name].get("sha256") != fp["sha256"]:
+            changed.append(name)
+    removed = sorted(name for name in previous if name not in paths)
+    return added, changed, removed, fingerprints
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
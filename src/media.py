@@ -0,0 +1,113 @@
+import email.utils
+import hashlib
+import os
+from urllib.parse import quote
+from fastapi.responses import Response
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+IMAGE_MEDIA_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.bmp': 'image/bmp', '.webp': 'image/webp'}
+RESPONSE_MODES = ("base64", "url")
+
+def image_url(file_name):
+    return f"/media/image/{quote(file_name)}"
+
+def frame_url(vector_id):
+    return f"/media/frame/{vector_id}"
+
+def resolve_media_file(name, dirs):
+    """Tìm file ảnh theo tên trong các thư mục cho phép, None nếu tên không hợp lệ (path traversal) hoặc không có"""
+    if not name or name != os.path.basename(name) or name.startswith('.') or not name.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    for directory in dirs:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def file_etag(stat):
+    """ETag rẻ theo mtime + size, không cần đọc nội dung file"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+def content_etag(data):
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+def http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+def is_not_modified(headers, etag, last_modified):
+    """Conditional GET: If-None-Match ưu tiên hơn If-Modified-Since (RFC 7232)"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def parse_range(header, size):
+    """
+    Parse header Range "bytes=start-end" / "bytes=start-" / "bytes=-suffix" (chỉ hỗ trợ một range).
+    Trả về (start, end) inclusive, None nếu không có/không hỗ trợ (trả cả file), raise ValueError nếu không thỏa mãn được (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, sep, end = header[len("bytes="):].strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start:
+            start, end = int(start), int(end) if end else size - 1
+        elif end:
+            start, end = max(0, size - int(end)), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, min(end, size - 1)
+
+def media_response(headers, size, read, media_type, etag, last_modified, max_age):
+    """
+    Response cho file media với ETag/Last-Modified (304), Range (206/416) và Cache-Control.
+    read(offset, length) -> bytes chỉ được gọi cho phần thật sự cần trả về.
+    """
+    response_headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": f"public, max-age={max_age}",
+        "Accept-Ranges": "bytes"
+    }
+    if is_not_modified(headers, etag, last_modified):
+        return Response(status_code=304, headers=response_headers)
+    # If-Range: chỉ trả một phần khi client vẫn giữ đúng phiên bản, ngược lại trả cả file
+    if_range = headers.get("if-range")
+    range_header = headers.get("range") if if_range is None or if_range == etag else None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**response_headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return Response(content=read(0, size), media_type=media_type, headers=response_headers)
+    start, end = byte_range
+    response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=read(start, end - start + 1), status_code=206, media_type=media_type, headers=response_headers)
+
+def file_response(headers, path, max_age):
+    stat = os.stat(path)
+
+    def read(offset, length):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    media_type = IMAGE_MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+    return media_response(headers, stat.st_size, read, media_type, file_etag(stat), stat.st_mtime, max_age)
+
+def bytes_response(headers, data, media_type, last_modified, max_age):
+    return media_response(headers, len(data), lambda offset, length: data[offset:offset + length],
+                          media_type, content_etag(data), last_modified, max_age)
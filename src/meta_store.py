@@ -0,0 +1,323 @@
+import functools
+import json
+import os
+import numpy as np
+
+MAGIC = b"MMETA001"
+ALIGN = 64
+STRING_CACHE_SIZE = 65536
+
+def meta_store_path(meta_path):
+    """File metadata dạng cột nằm cạnh file pickle cũ: data/faiss_image.pkl -> data/faiss_image.meta"""
+    return os.path.splitext(meta_path)[0] + ".meta"
+
+def _column_kind(values):
+    """Kiểu lưu của một cột theo các giá trị có mặt: bool/int/float/str, còn lại lưu JSON trong string table"""
+    kinds = {"bool" if isinstance(v, (bool, np.bool_)) else
+             "int" if isinstance(v, (int, np.integer)) else
+             "float" if isinstance(v, (float, np.floating)) else
+             "str" if isinstance(v, str) else "json" for v in values}
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == {"int", "float"}:
+        return "float"
+    return "json"
+
+NUMERIC_DTYPES = {"bool": np.bool_, "int": np.int64, "float": np.float64}
+
+class MetaStore:
+    """
+    Metadata của index dạng cột, memory-mapped từ một file duy nhất:
+    cột số (frame_number, frame_time, line, ...) là mảng numpy, cột chuỗi (file, text, description)
+    là mã int32 trỏ vào string table đã intern + sort (offsets + blob UTF-8).
+    Truy cập như list: store[id] -> dict (hoặc None nếu đã remove), append/extend ghi vào phần tail trong RAM,
+    save() gộp tail vào file mới. Chỉ các trang được đọc mới nằm trong RAM.
+    """
+
+    def __init__(self, rows=None):
+        self.path = None
+        self._rows = 0
+        self._columns = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._blob = np.zeros(0, dtype=np.uint8)
+        self._alive = np.zeros(0, dtype=bool)
+        self._tail = []
+        self._string = functools.lru_cache(maxsize=STRING_CACHE_SIZE)(self._decode_string)
+        if rows:
+            self.extend(rows)
+
+    @classmethod
+    def open(cls, path):
+        store = cls()
+        store._map(path)
+        return store
+
+    def _map(self, path):
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Not a metadata store file: {path}")
+        header_len = int(raw[8:16].view(np.uint64)[0])
+        header = json.loads(bytes(raw[16:16 + header_len]).decode("utf-8"))
+
+        def array(spec):
+            if spec is None:
+                return None
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            return raw[spec["offset"]:spec["offset"] + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+
+        self.path = path
+        self._rows = header["rows"]
+        self._columns = {c["name"]: (c["kind"], array(c["values"]), array(c["present"])) for c in header["columns"]}
+        self._offsets = array(header["string_offsets"])
+        self._blob = array(header["string_blob"])
+        # Cờ alive copy vào RAM (1 byte/row) để remove_ids ghi được
+        self._alive = np.array(array(header["alive"]))
+        self._tail = []
+        self._string = functools.lru_cache(maxsize=STRING_CACHE_SIZE)(self._decode_string)
+
+    def _decode_string(self, code):
+        return bytes(self._blob[self._offsets[code]:self._offsets[code + 1]]).decode("utf-8")
+
+    def _string_code(self, value):
+        """Tìm mã của chuỗi trong string table (đã sort theo bytes UTF-8) bằng binary search, None nếu không có"""
+        target = value.encode("utf-8")
+        lo, hi = 0, len(self._offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self._blob[self._offsets[mid]:self._offsets[mid + 1]]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._offsets) - 1 and self._string(lo) == value:
+            return lo
+        return None
+
+    def _base_value(self, kind, values, row):
+        value = values[row]
+        if kind == "str":
+            return self._string(int(value))
+        if kind == "json":
+            return json.loads(self._string(int(value)))
+        if kind == "bool":
+            return bool(value)
+        if kind == "int":
+            return int(value)
+        return float(value)
+
+    def _base_row(self, row):
+        if not self._alive[row]:
+            return None
+        result = {}
+        for name, (kind, values, present) in self._columns.items():
+            if present is None or present[row]:
+                result[name] = self._base_value(kind, values, row)
+        return result
+
+    def __len__(self):
+        return self._rows + len(self._tail)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Meta index {idx} out of range ({len(self)})")
+        if idx < self._rows:
+            return self._base_row(idx)
+        return self._tail[idx - self._rows]
+
+    def is_alive(self, idx):
+        """Row idx tồn tại và chưa bị remove, không decode row"""
+        if not 0 <= idx < len(self):
+            return False
+        if idx < self._rows:
+            return bool(self._alive[idx])
+        return self._tail[idx - self._rows] is not None
+
+    def get_value(self, idx, name, default=None):
+        """meta[idx][name] đọc thẳng từ cột (không decode cả row), default nếu row không có trường này"""
+        if idx < 0:
+            idx += len(self)
+        if idx >= self._rows:
+            meta = self._tail[idx - self._rows]
+            return default if meta is None else meta.get(name, default)
+        column = self._columns.get(name)
+        if column is None or not self._alive[idx]:
+            return default
+        kind, values, present = column
+        if present is not None and not present[idx]:
+            return default
+        return self._base_value(kind, values, idx)
+
+    def __setitem__(self, idx, value):
+        if idx < 0:
+            idx += len(self)
+        if idx >= self._rows:
+            self._tail[idx - self._rows] = value
+        elif value is None:
+            self._alive[idx] = False
+        else:
+            raise TypeError("Rows đã lưu chỉ hỗ trợ gán None (remove)")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def append(self, meta):
+        self._tail.append(meta)
+
+    def extend(self, metas):
+        self._tail.extend(metas)
+
+    def live_count(self):
+        """Số row còn hiệu lực (không tính row đã remove)"""
+        return int(self._alive.sum()) + sum(1 for m in self._tail if m is not None)
+
+    def live_ids(self):
+        """Mảng ID của các row còn hiệu lực"""
+        tail = [self._rows + i for i, m in enumerate(self._tail) if m is not None]
+        return np.concatenate([np.flatnonzero(self._alive), np.array(tail, dtype=np.int64)]).astype(np.int64)
+
+    def find_rows(self, name, value):
+        """ID của các row còn hiệu lực có meta[name] == value (so sánh vector hóa trên cột, không decode từng row)"""
+        ids = []
+        column = self._columns.get(name)
+        if column is not None and self._rows:
+            kind, values, present = column
+            if kind == "str":
+                code = self._string_code(value) if isinstance(value, str) else None
+                mask = values == code if code is not None else None
+            elif kind in NUMERIC_DTYPES and isinstance(value, (bool, int, float)):
+                mask = values == value
+            else:
+                mask = np.array([self._base_value(kind, values, row) == value for row in range(self._rows)], dtype=bool)
+            if mask is not None:
+                mask = mask & self._alive
+                if present is not None:
+                    mask &= present
+                ids.extend(int(i) for i in np.flatnonzero(mask))
+        ids.extend(self._rows + i for i, m in enumerate(self._tail) if m is not None and m.get(name) == value)
+        return ids
+
+    def _merged_columns(self):
+        """Gộp schema của base (mmap) với tail: {name: (kind mới, kind cũ, mảng base, giá trị tail, present mask)}"""
+        names = list(self._columns)
+        for meta in self._tail:
+            if meta is not None:
+                names.extend(k for k in meta if k not in names)
+        total = len(self)
+        merged = {}
+        for name in names:
+            base_kind, base_values, base_present = self._columns.get(name, (None, None, None))
+            tail_values = [m[name] for m in self._tail if m is not None and name in m]
+            if base_kind is None:
+                kind = _column_kind(tail_values)
+            elif not tail_values:
+                kind = base_kind
+            else:
+                tail_kind = _column_kind(tail_values)
+                kind = base_kind if tail_kind == base_kind else "float" if {base_kind, tail_kind} == {"int", "float"} else "json"
+            present = np.zeros(total, dtype=bool)
+            if base_kind is not None:
+                present[:self._rows] = True if base_present is None else base_present
+            present[self._rows:] = [m is not None and name in m for m in self._tail]
+            merged[name] = (kind, base_kind, base_values, tail_values, present)
+        return merged
+
+    def save(self, path):
+        """Ghi toàn bộ store (base + tail) ra file mới (tmp + os.replace), sau đó map lại từ file đó"""
+        total = len(self)
+        merged = self._merged_columns()
+
+        # String table mới: chuỗi cũ (giữ nguyên) + chuỗi mới của tail, intern + sort theo bytes UTF-8
+        old_strings = [self._string(i) for i in range(len(self._offsets) - 1)]
+        strings = set(old_strings)
+        for name, (kind, base_kind, base_values, tail_values, present) in merged.items():
+            if kind == "str":
+                strings.update(tail_values)
+            elif kind == "json":
+                strings.update(json.dumps(v, ensure_ascii=False) for v in tail_values)
+                if base_kind not in (None, "json"):
+                    strings.update(json.dumps(self._base_value(base_kind, base_values, r), ensure_ascii=False) for r in range(self._rows))
+        encoded = sorted(s.encode("utf-8") for s in strings)
+        codes = {s.decode("utf-8"): i for i, s in enumerate(encoded)}
+        remap = np.array([codes[s] for s in old_strings], dtype=np.int32)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(s) for s in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        arrays = {}
+        columns = []
+        for name, (kind, base_kind, base_values, tail_values, present) in merged.items():
+            values = np.zeros(total, dtype=np.int32 if kind in ("str", "json") else NUMERIC_DTYPES[kind])
+            if kind in ("str", "json"):
+                values[:] = -1
+            if base_kind is not None and self._rows:
+                if base_kind == kind and kind in ("str", "json"):
+                    values[:self._rows] = np.where(base_values >= 0, remap[np.maximum(base_values, 0)], -1)
+                elif base_kind == kind or (base_kind in NUMERIC_DTYPES and kind in NUMERIC_DTYPES):
+                    values[:self._rows] = base_values
+                else:
+                    # Đổi kiểu cột (vd. int -> json): decode từng row của base
+                    for row in range(self._rows):
+                        values[row] = codes[json.dumps(self._base_value(base_kind, base_values, row), ensure_ascii=False)]
+            tail_rows = np.flatnonzero(present[self._rows:]) + self._rows
+            if kind == "str":
+                values[tail_rows] = [codes[v] for v in tail_values]
+            elif kind == "json":
+                values[tail_rows] = [codes[json.dumps(v, ensure_ascii=False)] for v in tail_values]
+            else:
+                values[tail_rows] = tail_values
+            arrays[f"{name}.values"] = values
+            if not present.all():
+                arrays[f"{name}.present"] = present
+            columns.append({"name": name, "kind": kind, "values": f"{name}.values", "present": f"{name}.present" if not present.all() else None})
+
+        alive = np.ones(total, dtype=bool)
+        alive[:self._rows] = self._alive
+        alive[self._rows:] = [m is not None for m in self._tail]
+        arrays["alive"] = alive
+        arrays["string_offsets"] = offsets
+        arrays["string_blob"] = blob
+
+        # Header JSON chứa offset của từng mảng, dữ liệu mảng được align 64 bytes
+        layout = {}
+        position = 0
+        for key, arr in arrays.items():
+            layout[key] = {"offset": position, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+            position += -(-arr.nbytes // ALIGN) * ALIGN
+        header = {"version": 1, "rows": total, "columns": columns}
+        header_bytes = json.dumps(header).encode("utf-8")
+        # Offset tuyệt đối phụ thuộc độ dài header, tính lại cho tới khi ổn định
+        while True:
+            data_start = -(-(16 + len(header_bytes)) // ALIGN) * ALIGN
+            specs = {key: dict(spec, offset=spec["offset"] + data_start) for key, spec in layout.items()}
+            full = dict(header, columns=[dict(c, values=specs[c["values"]], present=specs[c["present"]] if c["present"] else None) for c in columns],
+                        alive=specs["alive"], string_offsets=specs["string_offsets"], string_blob=specs["string_blob"])
+            new_bytes = json.dumps(full).encode("utf-8")
+            if -(-(16 + len(new_bytes)) // ALIGN) * ALIGN == data_start:
+                header_bytes = new_bytes
+                break
+            header_bytes = new_bytes
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header_bytes)).tobytes())
+            f.write(header_bytes)
+            f.write(b"\0" * (data_start - 16 - len(header_bytes)))
+            for key, arr in arrays.items():
+                f.write(np.ascontiguousarray(arr).tobytes())
+                f.write(b"\0" * (-arr.nbytes % ALIGN))
+        os.replace(tmp_path, path)
+        self._map(path)
+
+    def get_stats(self):
+        return {
+            "rows": len(self),
+            "live_rows": self.live_count(),
+            "mapped_rows": self._rows,
+            "pending_rows": len(self._tail),
+            "columns": {name: kind for name, (kind, _, _) in self._columns.items()},
+            "strings": len(self._offsets) - 1
+        }
@@ -0,0 +1,81 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+def _distance(result):
+    distance = result.get('distance')
+    return float('inf') if distance is None else distance
+
+def _stream(order, name, results):
+    for result in results:
+        yield _distance(result), order, name, result
+
+def merge_results(result_lists, top_k=None, quotas=None, dedup_key=None):
+    """
+    Gộp các list kết quả (mỗi list đã sắp theo distance tăng dần) bằng heap merge, một lượt duy nhất:
+    áp quota theo từng nguồn (quotas[name]) và bỏ kết quả trùng theo dedup_key(name, result).
+    result_lists: list (name, results) theo thứ tự ưu tiên khi distance bằng nhau.
+    Trả về list (name, result) theo distance tăng dần, tối đa top_k phần tử (None = không giới hạn).
+    """
+    streams = [_stream(order, name, results) for order, (name, results) in enumerate(result_lists)]
+    counts = {}
+    seen = set()
+    merged = []
+    for _, _, name, result in heapq.merge(*streams, key=lambda item: item[:2]):
+        if quotas and name in quotas and counts.get(name, 0) >= quotas[name]:
+            continue
+        if dedup_key is not None:
+            key = dedup_key(name, result)
+            if key in seen:
+                continue
+            seen.add(key)
+        counts[name] = counts.get(name, 0) + 1
+        merged.append((name, result))
+        if top_k is not None and len(merged) >= top_k:
+            break
+    return merged
+
+def searcher_fetch(searcher, emb, k):
+    """Nguồn mặc định: search trực tiếp một FaissMultiModalSearch, trả về list dict đã sắp theo distance"""
+    return searcher.search_batch(emb.reshape(1, -1), top_k=k).to_dicts(0)
+
+class MultiIndexSearch:
+    """
+    Search nhiều index song song rồi gộp kết quả: latency bị chặn bởi index chậm nhất thay vì tổng các index
+    (FAISS nhả GIL khi search nên các thread chạy song song thật sự).
+    """
+
+    def __init__(self, max_workers=4, name="multi-search"):
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self.searches = 0
+
+    def run_parallel(self, fns):
+        """Chạy các hàm không tham số song song, hàm đầu tiên chạy ngay ở thread hiện tại; trả về kết quả theo thứ tự"""
+        if not fns:
+            return []
+        futures = [self._pool.submit(fn) for fn in fns[1:]]
+        first = fns[0]()
+        return [first] + [future.result() for future in futures]
+
+    @staticmethod
+    def _fetch(name, fetch, quota):
+        # Một index lỗi không làm hỏng cả request, các index còn lại vẫn trả kết quả
+        try:
+            return fetch(quota)
+        except Exception as e:
+            print(f"⚠️ Search on {name} failed: {e}")
+            return []
+
+    def search(self, sources, top_k=None, dedup_key=None):
+        """
+        sources: list (name, fetch, quota) với fetch(k) -> list dict đã sắp theo distance, quota = số kết quả tối đa của nguồn đó.
+        Nguồn có quota <= 0 hoặc fetch None bị bỏ qua. Trả về list (name, result) đã gộp.
+        """
+        sources = [(name, fetch, quota) for name, fetch, quota in sources if fetch is not None and quota > 0]
+        results = self.run_parallel([lambda name=name, fetch=fetch, quota=quota: self._fetch(name, fetch, quota) for name, fetch, quota in sources])
+        self.searches += 1
+        return merge_results([(name, result) for (name, _, _), result in zip(sources, results)], top_k,
+                             quotas={name: quota for name, _, quota in sources}, dedup_key=dedup_key)
+
+    def get_stats(self):
+        return {"max_workers": self.max_workers, "searches": self.searches}
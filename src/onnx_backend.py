@@ -0,0 +1,202 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+try:
+    from .image_pipeline import CLIP_MODEL_NAME, TorchClipEncoder, load_clip, load_processor, load_image
+except ImportError:
+    from image_pipeline import CLIP_MODEL_NAME, TorchClipEncoder, load_clip, load_processor, load_image
+
+# Thư mục chứa CLIP text/vision tower đã export sang ONNX (fp32 + int8)
+ONNX_DIR = os.environ.get("CLIP_ONNX_DIR", "data/onnx")
+ONNX_OPSET = 17
+PARITY_THRESHOLD = 0.99
+
+PARITY_TEXTS = [
+    "xin chào", "một con mèo đang ngủ trên ghế sofa", "người đàn ông đi xe đạp trên phố",
+    "a dog playing in the park", "bát phở bò nóng hổi", "biển xanh và bầu trời đầy mây",
+    "trí tuệ nhân tạo và học máy", "a red car parked next to a building"
+]
+
+def onnx_model_paths(onnx_dir=ONNX_DIR, quantized=False):
+    """(text_path, vision_path) của model ONNX fp32 hoặc int8"""
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return os.path.join(onnx_dir, f"clip_text{suffix}"), os.path.join(onnx_dir, f"clip_vision{suffix}")
+
+class OnnxClipEncoder:
+    """CLIP text/vision tower chạy bằng ONNX Runtime trên CPU, cùng interface với TorchClipEncoder"""
+    tensor_type = "np"
+
+    def __init__(self, onnx_dir=ONNX_DIR, quantized=False, num_threads=None):
+        import onnxruntime as ort
+        self.name = "onnx-int8" if quantized else "onnx"
+        text_path, vision_path = onnx_model_paths(onnx_dir, quantized)
+        for path in (text_path, vision_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} not found, run: python src/onnx_backend.py export{' --quantize' if quantized else ''}")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        self.text_session = ort.InferenceSession(text_path, options, providers=providers)
+        self.vision_session = ort.InferenceSession(vision_path, options, providers=providers)
+
+    def text_features(self, inputs):
+        feeds = {
+            "input_ids": np.asarray(inputs["input_ids"], dtype=np.int64),
+            "attention_mask": np.asarray(inputs["attention_mask"], dtype=np.int64)
+        }
+        return self.text_session.run(None, feeds)[0]
+
+    def image_features(self, pixel_values):
+        return self.vision_session.run(None, {"pixel_values": np.asarray(pixel_values, dtype=np.float32)})[0]
+
+    def concat(self, pixel_values_list):
+        return np.concatenate(list(pixel_values_list))
+
+def export_onnx(onnx_dir=ONNX_DIR, quantize=False, opset=ONNX_OPSET):
+    """Export text tower (input_ids, attention_mask -> text_embeds) và vision tower (pixel_values -> image_embeds) sang ONNX"""
+    import torch
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    model, processor = load_clip()
+    model.eval()
+    os.makedirs(onnx_dir, exist_ok=True)
+    text_path, vision_path = onnx_model_paths(onnx_dir)
+    text_inputs = processor(text=PARITY_TEXTS[:2], return_tensors="pt", padding=True)
+    pixel_values = processor(images=[np.zeros((224, 224, 3), dtype=np.uint8)] * 2, return_tensors="pt")["pixel_values"]
+
+    with torch.inference_mode():
+        torch.onnx.export(TextTower(model), (text_inputs["input_ids"], text_inputs["attention_mask"]), text_path,
+                          input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+                          dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                                        "text_embeds": {0: "batch"}},
+                          opset_version=opset, do_constant_folding=True)
+        print(f"✅ Exported text tower to {text_path}")
+        torch.onnx.export(VisionTower(model), (pixel_values,), vision_path,
+                          input_names=["pixel_values"], output_names=["image_embeds"],
+                          dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                          opset_version=opset, do_constant_folding=True)
+        print(f"✅ Exported vision tower to {vision_path}")
+
+    if quantize:
+        quantize_onnx(onnx_dir)
+
+def quantize_onnx(onnx_dir=ONNX_DIR):
+    """Dynamic int8 quantization (weight int8, activation quantize lúc chạy) cho MatMul/Gemm của cả hai tower"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    for src, dst in zip(onnx_model_paths(onnx_dir), onnx_model_paths(onnx_dir, quantized=True)):
+        # Chỉ quantize MatMul/Gemm: ConvInteger (patch embedding) chậm hơn fp32 trên nhiều CPU
+        quantize_dynamic(src, dst, weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul", "Gemm"])
+        print(f"✅ Quantized {src} -> {dst} ({os.path.getsize(src) / 1024 / 1024:.0f} MB -> {os.path.getsize(dst) / 1024 / 1024:.0f} MB)")
+
+def sample_images(image_dir="data/images", limit=16, seed=0):
+    """Ảnh thật trong image_dir (tối đa limit), bổ sung ảnh ngẫu nhiên nếu thiếu"""
+    images = []
+    if os.path.isdir(image_dir):
+        for fname in sorted(os.listdir(image_dir))[:limit]:
+            if fname.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.webp')):
+                images.append(load_image(os.path.join(image_dir, fname)))
+    rng = np.random.default_rng(seed)
+    while len(images) < 4:
+        images.append(rng.integers(0, 256, size=(256, 320, 3), dtype=np.uint8))
+    return images
+
+def _embed(encoder, texts, images):
+    processor = load_processor()
+    text_embs = encoder.text_features(processor(text=texts, return_tensors=encoder.tensor_type, padding=True, truncation=True, max_length=77))
+    image_embs = encoder.image_features(processor(images=images, return_tensors=encoder.tensor_type)["pixel_values"])
+    return np.asarray(text_embs, dtype=np.float32), np.asarray(image_embs, dtype=np.float32)
+
+def _cosine(a, b):
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+def check_parity(onnx_dir=ONNX_DIR, quantized=False, threshold=PARITY_THRESHOLD, image_dir="data/images"):
+    """So embedding ONNX với torch trên cùng input, True nếu cosine nhỏ nhất >= threshold (cả text và ảnh)"""
+    texts, images = PARITY_TEXTS, sample_images(image_dir)
+    torch_text, torch_image = _embed(TorchClipEncoder(load_clip()[0]), texts, images)
+    onnx_text, onnx_image = _embed(OnnxClipEncoder(onnx_dir, quantized), texts, images)
+    ok = True
+    for kind, ref, out in (("text", torch_text, onnx_text), ("image", torch_image, onnx_image)):
+        cos = _cosine(ref, out)
+        passed = cos.min() >= threshold
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} {kind} parity ({'onnx-int8' if quantized else 'onnx'} vs torch, {len(cos)} samples): "
+              f"min cosine {cos.min():.5f}, mean {cos.mean():.5f} (threshold {threshold})")
+    return ok
+
+def _latency(fn, runs, warmup=3):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start_time) * 1000)
+    return np.median(times), np.percentile(times, 95)
+
+def benchmark(onnx_dir=ONNX_DIR, runs=50, num_threads=None):
+    """Latency single-query (batch 1, gồm cả preprocess) cho text và ảnh với từng backend có sẵn"""
+    processor = load_processor()
+    image = sample_images(limit=1)[0]
+    encoders = [TorchClipEncoder(load_clip()[0])]
+    for quantized in (False, True):
+        if all(os.path.exists(p) for p in onnx_model_paths(onnx_dir, quantized)):
+            encoders.append(OnnxClipEncoder(onnx_dir, quantized, num_threads=num_threads))
+    baseline = {}
+    for encoder in encoders:
+        def text_query():
+            encoder.text_features(processor(text=[PARITY_TEXTS[1]], return_tensors=encoder.tensor_type, padding=True, truncation=True, max_length=77))
+
+        def image_query():
+            encoder.image_features(processor(images=image, return_tensors=encoder.tensor_type)["pixel_values"])
+
+        for kind, fn in (("text", text_query), ("image", image_query)):
+            median, p95 = _latency(fn, runs)
+            baseline.setdefault(kind, median)
+            print(f"⏱️ {encoder.name:>9} {kind:>5}: median {median:7.2f} ms  p95 {p95:7.2f} ms  ({baseline[kind] / median:.2f}x vs torch)")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"Export {CLIP_MODEL_NAME} sang ONNX, kiểm tra parity với torch và benchmark latency")
+    parser.add_argument("command", choices=("export", "parity", "benchmark"))
+    parser.add_argument("--onnx-dir", default=ONNX_DIR)
+    parser.add_argument("--quantize", action="store_true", help="export: tạo thêm bản int8; parity: kiểm tra bản int8")
+    parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD, help="Cosine nhỏ nhất chấp nhận được so với torch")
+    parser.add_argument("--image-dir", default="data/images", help="Ảnh dùng cho parity check")
+    parser.add_argument("--runs", type=int, default=50, help="Số lần đo mỗi backend (benchmark)")
+    parser.add_argument("--threads", type=int, default=None, help="intra_op_num_threads của ONNX Runtime")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.command == "export":
+        export_onnx(args.onnx_dir, args.quantize, args.opset)
+    elif args.command == "parity":
+        if not check_parity(args.onnx_dir, args.quantize, args.threshold, args.image_dir):
+            sys.exit(1)
+    else:
+        benchmark(args.onnx_dir, args.runs, args.threads)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+def normalize_query(query):
+    """Chuẩn hóa query làm cache key: lowercase + gộp khoảng trắng (CLIP tokenizer cũng lowercase)"""
+    return " ".join(query.lower().split())
+
+def payload_size(value):
+    """Ước lượng số byte của một response (dict/list lồng nhau): độ dài chuỗi/bytes + 8 byte cho mỗi giá trị khác"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) for v in value)
+    return 8
+
+class LRUCache:
+    """
+    LRU cache in-process, thread-safe, TTL tùy chọn (giây), có đếm hit/miss.
+    maxbytes (kèm sizeof(value)) giới hạn thêm tổng kích thước: entry cũ nhất bị bỏ khi vượt, value lớn hơn maxbytes không được cache.
+    """
+
+    def __init__(self, maxsize=4096, ttl=None, maxbytes=None, sizeof=payload_size):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        size = self.sizeof(value) if self.maxbytes else 0
+        if self.maxbytes and size > self.maxbytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self._bytes > self.maxbytes):
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        self._bytes -= self._data.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            **({"size_mb": round(self._bytes / 1024 / 1024, 2), "max_mb": round(self.maxbytes / 1024 / 1024, 2)} if self.maxbytes else {}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
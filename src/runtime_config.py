@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+# Biến môi trường của các thread pool native (OpenMP của FAISS/torch, BLAS của numpy), đọc lúc thư viện được load
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+# Cấu hình đã áp dụng cho process hiện tại (None = chưa gọi configure_runtime)
+RUNTIME = None
+_slot_file = None
+
+def available_cpus():
+    """CPU mà process được phép chạy (tôn trọng cgroup/taskset), sắp xếp tăng dần"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def claim_worker_slot(workers, key=None):
+    """
+    Giành slot 0..workers-1 cho worker hiện tại bằng flock trên file lock trong thư mục tạm.
+    Lock được giữ đến khi process thoát nên worker bị restart sẽ nhận lại slot vừa trống.
+    Trả về None nếu hết slot hoặc hệ điều hành không có fcntl (Windows).
+    """
+    global _slot_file
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    # Mỗi deployment (thư mục làm việc) có bộ slot riêng
+    key = key or hashlib.md5(os.getcwd().encode("utf-8")).hexdigest()[:8]
+    for slot in range(workers):
+        f = open(os.path.join(tempfile.gettempdir(), f"aichallenge-worker-{key}-{slot}.lock"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _slot_file = f
+        return slot
+    return None
+
+def configure_runtime(workers=None, threads=None, interop_threads=None, pin=None):
+    """
+    Chia core cho các worker cùng host và đặt số thread torch/FAISS/OpenMP/BLAS nhất quán cho process này.
+    Mặc định đọc env: API_WORKERS (hoặc WEB_CONCURRENCY của uvicorn), THREADS_PER_WORKER (mặc định cores / workers),
+    INTEROP_THREADS (mặc định 1), PIN_WORKERS=1 để pin mỗi worker vào một dải CPU riêng.
+    Nên gọi trước khi import numpy/faiss/torch để env có hiệu lực; thư viện đã load thì được set trực tiếp.
+    """
+    global RUNTIME
+    cpus = available_cpus()
+    workers = max(1, workers or int(os.environ.get("API_WORKERS") or os.environ.get("WEB_CONCURRENCY") or 1))
+    # OMP_NUM_THREADS do người dùng đặt sẵn vẫn được tôn trọng khi không chỉ định THREADS_PER_WORKER
+    threads = max(1, threads or int(os.environ.get("THREADS_PER_WORKER") or os.environ.get("OMP_NUM_THREADS") or 0) or len(cpus) // workers)
+    interop_threads = max(1, interop_threads or int(os.environ.get("INTEROP_THREADS", "1")))
+    if pin is None:
+        pin = os.environ.get("PIN_WORKERS", "0") == "1"
+
+    if workers * threads > len(cpus):
+        print(f"⚠️ {workers} workers x {threads} threads > {len(cpus)} CPUs, cores will be oversubscribed")
+
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+    slot, pinned = None, None
+    if pin and hasattr(os, "sched_setaffinity"):
+        slot = claim_worker_slot(workers)
+        if slot is not None:
+            start = (slot * threads) % len(cpus)
+            pinned = [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))]
+            os.sched_setaffinity(0, pinned)
+        else:
+            print(f"⚠️ No free worker slot out of {workers}, running unpinned")
+
+    RUNTIME = {"workers": workers, "threads": threads, "interop_threads": interop_threads, "slot": slot, "cpus": pinned}
+    if "faiss" in sys.modules:
+        apply_faiss_threads()
+    if "torch" in sys.modules:
+        apply_torch_threads()
+    return RUNTIME
+
+def runtime_threads():
+    """Số thread tính toán cho mỗi worker, None nếu chưa cấu hình (để thư viện tự chọn)"""
+    return RUNTIME["threads"] if RUNTIME else None
+
+def apply_faiss_threads():
+    if RUNTIME:
+        import faiss
+        faiss.omp_set_num_threads(RUNTIME["threads"])
+
+def apply_torch_threads():
+    """Gọi sau khi import torch (image_pipeline.load_clip); interop threads chỉ đặt được trước khi torch chạy song song lần đầu"""
+    if RUNTIME:
+        import torch
+        torch.set_num_threads(RUNTIME["threads"])
+        try:
+            torch.set_num_interop_threads(RUNTIME["interop_threads"])
+        except RuntimeError:
+            pass
+
+def get_stats():
+    return dict(RUNTIME) if RUNTIME else None
@@ -0,0 +1,45 @@
+from .runtime_config import configure_runtime, get_stats as runtime_stats
+# Mỗi shard server là một process riêng: đặt số thread FAISS/OpenMP/BLAS trước khi faiss được import
+RUNTIME = configure_runtime()
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+from typing import List
+from .sharded_search import LocalShard
+import os
+import logging
+import numpy as np
+
+# Shard server: giữ một shard của index (split bằng sharded_search.py) và trả (global id, distance) cho coordinator.
+# Chạy: SHARD_INDEX=data/shards/faiss_image.shard0.bin SHARD_META=data/shards/faiss_image.shard0.pkl uvicorn src.shard_server:app --port 9001
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHARD_INDEX = os.environ.get("SHARD_INDEX", "data/shards/faiss_image.shard0.bin")
+SHARD_META = os.environ.get("SHARD_META", os.path.splitext(SHARD_INDEX)[0] + ".pkl")
+SHARD_DIM = int(os.environ.get("SHARD_DIM", "512"))
+SEARCH_PARAMS = dict(nprobe=int(os.environ.get("FAISS_NPROBE", "0")) or None, ef_search=int(os.environ.get("FAISS_EF_SEARCH", "0")) or None,
+                     load_mode=os.environ.get("INDEX_LOAD_MODE", "mmap"))
+
+shard = LocalShard(SHARD_INDEX, SHARD_META, dim=SHARD_DIM, **SEARCH_PARAMS)
+logger.info(f"✅ Shard {shard.name} loaded ({shard.ntotal} vectors)")
+
+app = FastAPI(title="AI Challenge HCM FAISS shard", version="1.0.0")
+
+class ShardQuery(BaseModel):
+    embeddings: List[List[float]]
+    top_k: int = 10
+
+@app.post("/search")
+def search(req: ShardQuery):
+    """Top-k của shard cho cả batch query, chỉ trả các hit hợp lệ (global id, distance)"""
+    distances, gids = shard.search(np.array(req.embeddings, dtype=np.float32), req.top_k)
+    valid = gids >= 0
+    return {
+        "ids": [row[mask].tolist() for row, mask in zip(gids, valid)],
+        "distances": [row[mask].tolist() for row, mask in zip(distances, valid)]
+    }
+
+@app.get("/health")
+def health_check():
+    return {"status": "healthy", "shard": shard.name, "index_size": shard.ntotal, "stats": shard.searcher.get_stats(), "runtime": runtime_stats()}
@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import pickle
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+
+try:
+    from .faiss_pipeline import FaissMultiModalSearch, SearchResults, INDEX_TYPES, STORAGE_MODES, check_storage, reconstruct_vectors
+    from .meta_store import MetaStore, meta_store_path
+    from .snapshot import IndexConsistencyError, current_snapshot_dir, snapshot_files
+except ImportError:
+    from faiss_pipeline import FaissMultiModalSearch, SearchResults, INDEX_TYPES, STORAGE_MODES, check_storage, reconstruct_vectors
+    from meta_store import MetaStore, meta_store_path
+    from snapshot import IndexConsistencyError, current_snapshot_dir, snapshot_files
+
+SHARD_DIR = "data/shards"
+SHARD_TIMEOUT_MS = 1000
+
+def shards_manifest_path(index_path):
+    """Manifest mô tả các shard nằm cạnh file index gốc: data/faiss_image.bin -> data/faiss_image.shards.json"""
+    return os.path.splitext(index_path)[0] + ".shards.json"
+
+def shard_paths(out_dir, base, shard_no):
+    """(index_path, meta_path) của shard thứ shard_no"""
+    return os.path.join(out_dir, f"{base}.shard{shard_no}.bin"), os.path.join(out_dir, f"{base}.shard{shard_no}.pkl")
+
+def load_meta(meta_path, index_path=None):
+    """
+    Metadata toàn cục (theo global ID) cho coordinator: meta store dạng cột (mmap), fallback pickle cũ.
+    Index gốc có snapshot thì đọc metadata của snapshot CURRENT. Trả về (meta, snapshot version hoặc None).
+    """
+    snapshot_dir = current_snapshot_dir(index_path) if index_path else None
+    version = None
+    if snapshot_dir is not None:
+        meta_path = snapshot_files(snapshot_dir)[1]
+        version = os.path.basename(snapshot_dir)
+    store_path = meta_store_path(meta_path)
+    if os.path.exists(store_path):
+        return MetaStore.open(store_path), version
+    with open(meta_path, 'rb') as f:
+        return MetaStore(pickle.load(f)), version
+
+def shard_hits(results, top_k):
+    """
+    SearchResults của một shard -> (distances, global ids) dạng mảng (nq, top_k).
+    Metadata của shard chỉ có cột gid; ID đã bị remove/padding thành -1 với distance inf.
+    """
+    nq = len(results)
+    gids = np.full((nq, top_k), -1, dtype=np.int64)
+    distances = np.full((nq, top_k), np.inf, dtype=np.float32)
+    for q in range(nq):
+        for j, (idx, distance) in enumerate(results.hits(q)):
+            gids[q, j] = results.meta.get_value(idx, 'gid')
+            distances[q, j] = distance
+    return distances, gids
+
+def merge_shard_hits(parts, nq, top_k):
+    """Gộp top_k của các shard thành top_k toàn cục theo distance tăng dần (một lần argsort trên ma trận nq x (shards * top_k))"""
+    if not parts:
+        return np.full((nq, top_k), np.inf, dtype=np.float32), np.full((nq, top_k), -1, dtype=np.int64)
+    D = np.concatenate([distances for distances, _ in parts], axis=1)
+    I = np.concatenate([gids for _, gids in parts], axis=1)
+    order = np.argsort(D, axis=1, kind='stable')[:, :top_k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+class LocalShard:
+    """Shard load trong process hiện tại (mặc định mmap), search chạy trên thread pool của coordinator"""
+
+    def __init__(self, index_path, meta_path, dim=512, **search_params):
+        self.name = os.path.basename(index_path)
+        self.searcher = FaissMultiModalSearch(dim=dim, index_path=index_path, meta_path=meta_path, **search_params)
+        self.searcher.load()
+
+    @property
+    def ntotal(self):
+        return self.searcher.ntotal
+
+    def search(self, embs, top_k, timeout=None):
+        return shard_hits(self.searcher.search_batch(embs, top_k=top_k), top_k)
+
+class HttpShard:
+    """Shard chạy ở process/node khác sau shard_server.py, gọi qua HTTP POST /search"""
+
+    def __init__(self, url, count=0):
+        self.url = url.rstrip("/")
+        self.name = self.url
+        self.ntotal = count
+
+    def search(self, embs, top_k, timeout=None):
+        body = json.dumps({"embeddings": np.asarray(embs, dtype=np.float32).tolist(), "top_k": top_k}).encode("utf-8")
+        request = urllib.request.Request(f"{self.url}/search", data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            data = json.loads(resp.read())
+        # Server chỉ trả các hit hợp lệ, pad lại thành mảng (nq, top_k)
+        nq = len(embs)
+        gids = np.full((nq, top_k), -1, dtype=np.int64)
+        distances = np.full((nq, top_k), np.inf, dtype=np.float32)
+        for q, (ids, dists) in enumerate(zip(data["ids"], data["distances"])):
+            gids[q, :len(ids)] = ids[:top_k]
+            distances[q, :len(dists)] = dists[:top_k]
+        return distances, gids
+
+class ShardedSearch:
+    """
+    Scatter-gather trên nhiều shard: mỗi query batch được gửi song song tới mọi shard, mỗi shard trả top_k
+    (distance, global id) trong phần vector nó giữ, coordinator gộp thành top_k toàn cục và đọc metadata theo
+    global id từ meta store chung. Shard trả lời chậm hơn timeout hoặc lỗi bị bỏ qua (kết quả partial).
+    Cùng interface search_batch/meta/ntotal/get_stats với FaissMultiModalSearch nên API dùng thay thế trực tiếp.
+    """
+
+    def __init__(self, shards, meta, timeout_ms=SHARD_TIMEOUT_MS, max_workers=None, snapshot_version=None):
+        self.shards = shards
+        self.meta = meta
+        # Snapshot của index gốc mà các shard được chia từ đó (thumbnail store đi theo phiên bản này)
+        self.snapshot_version = snapshot_version
+        self.timeout = timeout_ms / 1000
+        self.index_type = "sharded"
+        # Đủ thread cho vài request đồng thời, shard bị timeout vẫn chiếm thread đến khi search xong
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or 4 * len(shards), thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._stats = {shard.name: {"searches": 0, "timeouts": 0, "errors": 0} for shard in shards}
+        self.partial_searches = 0
+
+    @classmethod
+    def from_manifest(cls, manifest_path, dim=512, timeout_ms=SHARD_TIMEOUT_MS, **search_params):
+        """
+        Shard có url trong manifest được gọi qua HTTP, còn lại load local từ file index/meta của shard.
+        Raise IndexConsistencyError nếu metadata (snapshot CURRENT của index gốc) không phải phiên bản các shard được chia từ đó,
+        hoặc số vector của metadata/shard không khớp manifest: global id sẽ trỏ sai metadata.
+        """
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["dim"] != dim:
+            raise ValueError(f"Shard dim {manifest['dim']} != {dim} ({manifest_path})")
+        meta, version = load_meta(manifest["meta"], manifest.get("source_index"))
+        if version != manifest.get("snapshot_version"):
+            raise IndexConsistencyError(f"Shards were split from snapshot {manifest.get('snapshot_version')}, "
+                                        f"metadata is {version} ({manifest_path}): run sharded_search.py again")
+        if meta.live_count() != manifest["total"]:
+            raise IndexConsistencyError(f"Metadata has {meta.live_count()} live rows, shard manifest says {manifest['total']} ({manifest_path})")
+        shards = []
+        for entry in manifest["shards"]:
+            if entry.get("url"):
+                shards.append(HttpShard(entry["url"], entry.get("count", 0)))
+                continue
+            shard = LocalShard(entry["index"], entry["meta"], dim=dim, **search_params)
+            if shard.ntotal != entry["count"]:
+                raise IndexConsistencyError(f"Shard {shard.name} has {shard.ntotal} vectors, manifest says {entry['count']}")
+            shards.append(shard)
+        return cls(shards, meta, timeout_ms=timeout_ms, snapshot_version=version)
+
+    @property
+    def ntotal(self):
+        return sum(shard.ntotal for shard in self.shards)
+
+    def _count(self, shard, key):
+        with self._lock:
+            self._stats[shard.name][key] += 1
+
+    def search_batch(self, embs, top_k=5):
+        embs = np.atleast_2d(np.array(embs, dtype='float32'))
+        start_time = time.time()
+        futures = {self._pool.submit(shard.search, embs, top_k, self.timeout): shard for shard in self.shards}
+        # Các shard chạy đồng thời nên một deadline chung = timeout của từng shard
+        done, _ = wait(futures, timeout=self.timeout)
+        parts = []
+        for future, shard in futures.items():
+            if future not in done:
+                future.cancel()
+                self._count(shard, "timeouts")
+                print(f"⚠️ Shard {shard.name} timed out after {self.timeout * 1000:.0f} ms")
+                continue
+            try:
+                parts.append(future.result())
+                self._count(shard, "searches")
+            except Exception as e:
+                self._count(shard, "errors")
+                print(f"⚠️ Shard {shard.name} failed: {e}")
+        if len(parts) < len(self.shards):
+            with self._lock:
+                self.partial_searches += 1
+        D, I = merge_shard_hits(parts, len(embs), top_k)
+        return SearchResults(I, D, self.meta, round((time.time() - start_time) * 1000, 2))
+
+    def get_stats(self):
+        with self._lock:
+            shards = [{"name": shard.name, "size": shard.ntotal, **self._stats[shard.name]} for shard in self.shards]
+        return {
+            "index_size": self.ntotal,
+            "meta_size": self.meta.live_count(),
+            "index_type": self.index_type,
+            "num_shards": len(self.shards),
+            "timeout_ms": self.timeout * 1000,
+            "partial_searches": self.partial_searches,
+            "snapshot": self.snapshot_version,
+            "shards": shards
+        }
+
+def split_index(index_path, meta_path, num_shards, out_dir=SHARD_DIR, dim=512, index_type="auto", storage="float32"):
+    """
+    Chia index đã build thành num_shards shard theo global id % num_shards, mỗi shard là một index độc lập
+    (loại index chọn theo số vector của shard) với metadata chỉ gồm gid. Metadata đầy đủ giữ nguyên ở meta_path.
+    Trả về đường dẫn manifest.
+    """
+    source = FaissMultiModalSearch(dim=dim, index_path=index_path, meta_path=meta_path, load_mode="memory")
+    source.load()
+    live = source.meta.live_ids()
+    if source.vectors is not None:
+        # Side store có vector float32 gốc theo ID: shard không mất độ chính xác dù index gốc nén
+        ids, vectors = live, np.asarray(source.vectors[live], dtype='float32')
+    else:
+        ids, vectors = reconstruct_vectors(source)
+        keep = np.isin(ids, live)
+        ids, vectors = ids[keep], vectors[keep]
+    print(f"🔄 Splitting {len(ids)} vectors from {index_path} into {num_shards} shards...")
+
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.splitext(os.path.basename(index_path))[0]
+    entries = []
+    for shard_no in range(num_shards):
+        shard_index, shard_meta = shard_paths(out_dir, base, shard_no)
+        selected = ids % num_shards == shard_no
+        shard = FaissMultiModalSearch(dim=dim, index_path=shard_index, meta_path=shard_meta, use_cosine=source.use_cosine,
+                                      index_type=index_type, num_vectors=int(selected.sum()), storage=storage)
+        if selected.any():
+            shard.train(vectors[selected])
+            shard.add_batch(vectors[selected], [{'gid': int(gid)} for gid in ids[selected]])
+        shard.save()
+        entries.append({"index": shard_index, "meta": shard_meta, "count": int(selected.sum()), "index_type": shard.index_type})
+
+    manifest = {
+        "dim": dim,
+        "metric": "cosine" if source.use_cosine else "L2",
+        "source_index": index_path,
+        "meta": meta_path,
+        "snapshot_version": source.snapshot_version,
+        "total": int(len(ids)),
+        "shards": entries
+    }
+    manifest_path = shards_manifest_path(index_path)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(f"✅ Saved shard manifest to {manifest_path}")
+    return manifest_path
+
+def verify_shards(manifest_path, index_path, meta_path, queries=200, top_k=10, dim=512, seed=0):
+    """So top_k của sharded search với index gốc trên các vector lấy ngẫu nhiên làm query"""
+    source = FaissMultiModalSearch(dim=dim, index_path=index_path, meta_path=meta_path, load_mode="memory")
+    source.load()
+    sharded = ShardedSearch.from_manifest(manifest_path, dim=dim, load_mode="memory")
+    ids, vectors = reconstruct_vectors(source)
+    sample = vectors[np.random.default_rng(seed).choice(len(vectors), size=min(queries, len(vectors)), replace=False)]
+    expected = source.search_batch(sample, top_k=top_k).ids
+    found = sharded.search_batch(sample, top_k=top_k).ids
+    overlap = [len(set(f[f >= 0]) & set(e[e >= 0])) / max(1, (e >= 0).sum()) for f, e in zip(found, expected)]
+    print(f"📊 Sharded vs single index top-{top_k} overlap on {len(sample)} queries: {np.mean(overlap):.4f}")
+    return float(np.mean(overlap))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chia FAISS index thành nhiều shard để search scatter-gather trên nhiều process/node")
+    parser.add_argument("--index", default="data/faiss_image.bin", help="File index (.bin) đã build")
+    parser.add_argument("--meta", default="data/faiss_image.pkl", help="File metadata tương ứng")
+    parser.add_argument("--shards", type=int, required=True, help="Số shard")
+    parser.add_argument("--out-dir", default=SHARD_DIR, help="Thư mục chứa file shard")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--index-type", default="auto", choices=("auto",) + INDEX_TYPES, help="Loại index của mỗi shard")
+    parser.add_argument("--storage", default="float32", choices=STORAGE_MODES)
+    parser.add_argument("--verify", type=int, default=0, help="Số query dùng để so kết quả sharded với index gốc (0 = bỏ qua)")
+    args = parser.parse_args()
+    try:
+        check_storage(args.index_type, args.storage)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+def main():
+    args = parse_args()
+    manifest_path = split_index(args.index, args.meta, args.shards, args.out_dir, args.dim, args.index_type, args.storage)
+    if args.verify:
+        verify_shards(manifest_path, args.index, args.meta, args.verify, dim=args.dim)
+
+if __name__ == "__main__":
+    main()
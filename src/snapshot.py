@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+# Snapshot có phiên bản của một index: data/faiss_image.snapshots/v000003/{index.bin, index.meta, index.vecs.npy, MANIFEST.json}
+# và file CURRENT trỏ tới phiên bản đang dùng. Snapshot được ghi vào thư mục tạm rồi rename (atomic), sau đó mới đổi CURRENT,
+# nên process đang đọc không bao giờ thấy một cặp index/metadata ghi dở.
+MANIFEST_NAME = "MANIFEST.json"
+CURRENT_NAME = "CURRENT"
+SNAPSHOT_FORMAT = 1
+DEFAULT_KEEP_SNAPSHOTS = 3
+VERSION_PATTERN = re.compile(r"^v(\d{6,})$")
+
+class IndexConsistencyError(RuntimeError):
+    """Index, metadata và manifest không khớp nhau (số vector, dim, model, checksum): không được load để phục vụ"""
+
+def snapshots_dir(index_path):
+    """data/faiss_image.bin -> data/faiss_image.snapshots"""
+    return os.path.splitext(index_path)[0] + ".snapshots"
+
+def current_path(index_path):
+    return os.path.join(snapshots_dir(index_path), CURRENT_NAME)
+
+def snapshot_files(snapshot_dir):
+    """(index_path, meta_path) bên trong thư mục snapshot (meta store nằm ở index.meta)"""
+    return os.path.join(snapshot_dir, "index.bin"), os.path.join(snapshot_dir, "index.pkl")
+
+def current_version(index_path):
+    """Phiên bản CURRENT của index, None nếu index chưa có snapshot"""
+    try:
+        with open(current_path(index_path), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_snapshot_dir(index_path):
+    """Thư mục của snapshot CURRENT, None nếu index chưa có snapshot"""
+    version = current_version(index_path)
+    return None if version is None else os.path.join(snapshots_dir(index_path), version)
+
+def list_versions(index_path):
+    root = snapshots_dir(index_path)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if VERSION_PATTERN.match(name))
+
+def read_manifest(index_path, version=None):
+    """
+    Mở nhanh chỉ đọc manifest (không đọc index/metadata): số vector, dim, model, checksum của snapshot.
+    version=None lấy phiên bản CURRENT.
+    """
+    version = version or current_version(index_path)
+    if version is None:
+        raise FileNotFoundError(f"No snapshot for {index_path}")
+    with open(os.path.join(snapshots_dir(index_path), version, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def file_sha256(path, chunk_size=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _fsync_dir(path):
+    # Ghi nhận rename vào thư mục; hệ điều hành không cho mở thư mục (Windows) thì bỏ qua
+    try:
+        _fsync(path)
+    except OSError:
+        pass
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def new_snapshot_dir(index_path):
+    """Thư mục tạm (cùng filesystem với snapshot) để ghi snapshot mới"""
+    root = snapshots_dir(index_path)
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = os.path.join(root, f".tmp-{os.getpid()}-{time.time_ns()}")
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+def commit_snapshot(index_path, tmp_dir, manifest, keep=DEFAULT_KEEP_SNAPSHOTS):
+    """
+    Ghi checksum từng file + manifest vào tmp_dir, fsync, rename thành phiên bản mới rồi mới đổi CURRENT.
+    Crash ở bất kỳ bước nào cũng chỉ để lại thư mục tạm, CURRENT vẫn trỏ tới snapshot cũ còn nguyên vẹn.
+    """
+    root = snapshots_dir(index_path)
+    files = {}
+    for name in sorted(os.listdir(tmp_dir)):
+        path = os.path.join(tmp_dir, name)
+        _fsync(path)
+        files[name] = {"size": os.path.getsize(path), "sha256": file_sha256(path)}
+    versions = list_versions(index_path)
+    version = f"v{(int(VERSION_PATTERN.match(versions[-1]).group(1)) + 1) if versions else 1:06d}"
+    manifest = dict(manifest, format=SNAPSHOT_FORMAT, version=version, created_at=time.time(), files=files)
+    _write_atomic(os.path.join(tmp_dir, MANIFEST_NAME), json.dumps(manifest, ensure_ascii=False, indent=2))
+    os.rename(tmp_dir, os.path.join(root, version))
+    _write_atomic(current_path(index_path), version)
+    _fsync_dir(root)
+    prune_snapshots(index_path, keep)
+    return version
+
+def verify_snapshot(snapshot_dir, manifest, checksums=False):
+    """
+    Kiểm tra file của snapshot khớp manifest: luôn kiểm tra có mặt + kích thước (rẻ),
+    checksums=True đọc lại toàn bộ file để so sha256. Raise IndexConsistencyError nếu không khớp.
+    """
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise IndexConsistencyError(f"Unsupported snapshot format {manifest.get('format')} in {snapshot_dir}")
+    for name, info in manifest["files"].items():
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.isfile(path):
+            raise IndexConsistencyError(f"Snapshot file missing: {path}")
+        size = os.path.getsize(path)
+        if size != info["size"]:
+            raise IndexConsistencyError(f"Snapshot file {path} has {size} bytes, manifest says {info['size']}")
+        if checksums and file_sha256(path) != info["sha256"]:
+            raise IndexConsistencyError(f"Checksum mismatch for {path}")
+
+def prune_snapshots(index_path, keep=DEFAULT_KEEP_SNAPSHOTS):
+    """Xóa snapshot cũ (giữ keep phiên bản mới nhất và CURRENT) và thư mục tạm của các lần ghi bị gián đoạn"""
+    root = snapshots_dir(index_path)
+    current = current_version(index_path)
+    versions = list_versions(index_path)
+    # Process đang mmap snapshot cũ vẫn đọc được sau khi file bị xóa (Linux giữ inode đến khi unmap)
+    for version in versions[:max(0, len(versions) - max(1, keep))]:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+    for name in os.listdir(root):
+        if name.startswith(".tmp-") and not _writer_alive(name):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def _writer_alive(tmp_name):
+    """Thư mục tạm .tmp-<pid>-<ns> còn process ghi (khác process hiện tại) hay không"""
+    try:
+        pid = int(tmp_name.split("-")[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Xem và kiểm tra snapshot có phiên bản của FAISS index")
+    parser.add_argument("--index", default="data/faiss_image.bin", help="File index logic (snapshot nằm ở <index>.snapshots)")
+    parser.add_argument("--version", default=None, help="Phiên bản cần xem (mặc định CURRENT)")
+    parser.add_argument("--verify", action="store_true", help="Đọc lại toàn bộ file và so sha256 với manifest")
+    parser.add_argument("--list", action="store_true", help="Liệt kê các phiên bản hiện có")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.list:
+        current = current_version(args.index)
+        for version in list_versions(args.index):
+            manifest = read_manifest(args.index, version)
+            print(f"{'*' if version == current else ' '} {version}  vectors={manifest['count']}  dim={manifest['dim']}  model={manifest.get('model_name')}")
+        return
+    manifest = read_manifest(args.index, args.version)
+    print(json.dumps({k: v for k, v in manifest.items() if k != "files"}, ensure_ascii=False, indent=2))
+    if args.verify:
+        try:
+            verify_snapshot(os.path.join(snapshots_dir(args.index), manifest["version"]), manifest, checksums=True)
+        except IndexConsistencyError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Snapshot {manifest['version']} matches its manifest ({len(manifest['files'])} files)")
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,123 @@
 import os
-from pyvi import ViTokenizer
-from sentence_transformers import SentenceTransformer
+import threading
+import multiprocessing
 import numpy as np
 
+try:
+    from .query_cache import LRUCache
+except ImportError:
+    from query_cache import LRUCache
+
 # Sửa đường dẫn để chạy từ thư mục src
 STOPWORDS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'vietnamese-stopwords-dash.txt'))
 
 try:
     with open(STOPWORDS_PATH, encoding='utf-8') as f:
-        STOPWORDS = set([line.strip() for line in f if line.strip()])
+        # Lowercase sẵn một lần, lookup chỉ cần lowercase token
+        STOPWORDS = frozenset(line.strip().lower() for line in f if line.strip())
     print(f"✅ Loaded {len(STOPWORDS)} stopwords from {STOPWORDS_PATH}")
 except Exception as e:
     print(f"❌ Error loading stopwords: {e}")
-    STOPWORDS = set()
+    STOPWORDS = frozenset()
 
-try:
-    EMBED_MODEL = SentenceTransformer('VoVanPhuc/sup-SimCSE-VietNamese-phobert-base')
-    print("✅ Text embedding model loaded successfully")
-except Exception as e:
-    print(f"❌ Error loading embedding model: {e}")
-    EMBED_MODEL = None
+# Memoize kết quả preprocess theo text gốc (corpus và query thường lặp lại nhiều câu giống nhau)
+PREPROCESS_CACHE_SIZE = int(os.environ.get("PREPROCESS_CACHE_SIZE", "100000"))
+_preprocess_cache = LRUCache(maxsize=PREPROCESS_CACHE_SIZE)
+
+DEFAULT_EMBED_BATCH_SIZE = 64
+# Dưới ngưỡng này tách từ tuần tự nhanh hơn chi phí khởi động pool
+MIN_PARALLEL_TEXTS = 2000
+
+EMBED_MODEL_NAME = 'VoVanPhuc/sup-SimCSE-VietNamese-phobert-base'
+
+# SimCSE (sentence_transformers) chỉ được load ở lần gọi get_embedding đầu tiên
+_embed_model = None
+_embed_model_loaded = False
+_embed_model_lock = threading.Lock()
+
+def load_embed_model():
+    """Load SimCSE một lần (thread-safe), trả về None nếu load lỗi"""
+    global _embed_model, _embed_model_loaded
+    if not _embed_model_loaded:
+        with _embed_model_lock:
+            if not _embed_model_loaded:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _embed_model = SentenceTransformer(EMBED_MODEL_NAME)
+                    print("✅ Text embedding model loaded successfully")
+                except Exception as e:
+                    print(f"❌ Error loading embedding model: {e}")
+                    _embed_model = None
+                _embed_model_loaded = True
+    return _embed_model
+
+def __getattr__(name):
+    # Giữ tương thích với code cũ dùng text_pipeline.EMBED_MODEL
+    if name == "EMBED_MODEL":
+        return load_embed_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def word_segment(text):
+    from pyvi import ViTokenizer
     return ViTokenizer.tokenize(text)
 
 def remove_stopwords(text):
+    # Lowercase cả câu một lần thay vì từng token
     words = text.split()
-    filtered = [w for w in words if w.lower() not in STOPWORDS]
+    filtered = [w for w, lw in zip(words, text.lower().split()) if lw not in STOPWORDS]
     return ' '.join(filtered)
 
+def _preprocess_uncached(text):
+    return remove_stopwords(word_segment(text))
+
 def preprocess(text):
-    seg = word_segment(text)
-    clean = remove_stopwords(seg)
+    clean = _preprocess_cache.get(text)
+    if clean is None:
+        clean = _preprocess_uncached(text)
+        _preprocess_cache.put(text, clean)
     return clean
 
+def preprocess_batch(texts, workers=0, chunksize=256):
+    """
+    Preprocess (tách từ pyvi + bỏ stopwords) cả list text, giữ nguyên thứ tự.
+    Text trùng nhau chỉ xử lý một lần; workers > 1 tách từ bằng multiprocessing pool khi đủ nhiều text.
+    """
+    results = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        clean = _preprocess_cache.get(text)
+        if clean is None:
+            missing.append(text)
+        else:
+            results[text] = clean
+    if missing:
+        if workers > 1 and len(missing) >= MIN_PARALLEL_TEXTS:
+            with multiprocessing.Pool(workers) as pool:
+                cleaned = pool.map(_preprocess_uncached, missing, chunksize=chunksize)
+        else:
+            cleaned = [_preprocess_uncached(text) for text in missing]
+        for text, clean in zip(missing, cleaned):
+            results[text] = clean
+            _preprocess_cache.put(text, clean)
+    return [results[text] for text in texts]
+
 def get_embedding(text):
-    if EMBED_MODEL is None:
+    model = load_embed_model()
+    if model is None:
+        raise RuntimeError("Embedding model not loaded")
+    return model.encode([text])[0]
+
+def get_embeddings_batch(texts, batch_size=DEFAULT_EMBED_BATCH_SIZE, preprocess_texts=True, workers=0):
+    """Embedding SimCSE cho cả list text: preprocess_batch rồi encode theo batch, trả về mảng (N, dim) float32"""
+    model = load_embed_model()
+    if model is None:
         raise RuntimeError("Embedding model not loaded")
-    return EMBED_MODEL.encode([text])[0]
+    texts = list(texts)
+    if preprocess_texts:
+        texts = preprocess_batch(texts, workers=workers)
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype="float32")
+    return np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False), dtype="float32")
 
 if __name__ == "__main__":
     raw_text = "Tôi yêu tiếng Việt và AI Challenge 2025."
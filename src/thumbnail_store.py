@@ -0,0 +1,213 @@
+import json
+import os
+import numpy as np
+
+THUMBNAILS_PATH = "data/faiss_image.thumbs"
+DEFAULT_THUMBNAIL_SIZE = 320
+DEFAULT_THUMBNAIL_QUALITY = 80
+THUMBNAIL_FORMATS = ("jpg", "webp")
+
+def thumbnail_index_path(path):
+    """File offsets đi kèm file thumbnail đóng gói: mảng int64 (N, 2) = (offset, length) theo vector ID"""
+    return f"{path}.idx.npy"
+
+def thumbnail_media_type(data):
+    """Content-Type của thumbnail theo magic bytes (JPEG hoặc WebP)"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+def encode_thumbnail(rgb, max_side=DEFAULT_THUMBNAIL_SIZE, fmt="jpg", quality=DEFAULT_THUMBNAIL_QUALITY):
+    """Thu nhỏ frame RGB (cạnh dài <= max_side) và encode JPEG/WebP, trả về bytes"""
+    import cv2
+    h, w = rgb.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1:
+        rgb = cv2.resize(rgb, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    params = [cv2.IMWRITE_WEBP_QUALITY, quality] if fmt == "webp" else [cv2.IMWRITE_JPEG_QUALITY, quality]
+    ok, buf = cv2.imencode(f".{fmt}", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), params)
+    if not ok:
+        raise ValueError(f"Cannot encode thumbnail as {fmt}")
+    return buf.tobytes()
+
+def thumbnail_manifest_path(path):
+    """Danh sách thumbnail theo phiên bản snapshot của image index: data/faiss_image.thumbs.json"""
+    return f"{path}.json"
+
+def read_thumbnail_manifest(path):
+    """{"versions": {version: {"blob", "offsets", "entries"}}}, rỗng nếu thumbnail chưa ghi theo snapshot"""
+    try:
+        with open(thumbnail_manifest_path(path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"versions": {}}
+
+def thumbnail_files(path, version=None):
+    """
+    (blob_path, offsets_path) của thumbnail khớp với snapshot version của image index.
+    version=None hoặc thumbnail build trước khi có manifest: file cũ không phiên bản (path, path.idx.npy);
+    None nếu manifest không có phiên bản này (index không có thumbnail tương ứng).
+    """
+    versions = read_thumbnail_manifest(path)["versions"]
+    if version is None or not versions:
+        return path, thumbnail_index_path(path)
+    entry = versions.get(version)
+    if entry is None:
+        return None
+    root = os.path.dirname(path)
+    return os.path.join(root, entry["blob"]), os.path.join(root, entry["offsets"])
+
+def _committed_end(offsets_paths):
+    """Byte cuối cùng của blob mà các file offsets đã commit trỏ tới; phần sau đó là rác của lần build bị gián đoạn"""
+    end = 0
+    for offsets_path in offsets_paths:
+        if os.path.exists(offsets_path):
+            offsets = np.load(offsets_path, mmap_mode="r")
+            if len(offsets):
+                end = max(end, int((offsets[:, 0] + offsets[:, 1]).max()))
+    return end
+
+class ThumbnailWriter:
+    """
+    Ghi thumbnail của các frame mới vào file đóng gói theo thứ tự add, commit(start_id) gán chúng cho
+    vector ID start_id, start_id+1, ... trong file offsets.
+    fresh=True (build lại từ đầu): ghi blob mới (chỉ chứa frame hiện tại, blob cũ bị xóa khi không còn phiên bản nào dùng);
+    ngược lại append vào cuối blob của base_version nên process đang đọc (API) không bị ảnh hưởng.
+    commit sau khi index đã save: với snapshot, offsets được ghi theo phiên bản (data/faiss_image.thumbs.v000003.idx.npy)
+    nên rollback/hot reload luôn đọc đúng thumbnail của snapshot đang phục vụ.
+    """
+
+    def __init__(self, path, fresh=True, base_version=None, max_side=DEFAULT_THUMBNAIL_SIZE, fmt="jpg", quality=DEFAULT_THUMBNAIL_QUALITY):
+        self.path = path
+        self.max_side = max_side
+        self.fmt = fmt
+        self.quality = quality
+        base = None if fresh else thumbnail_files(path, base_version)
+        self.fresh = base is None or not all(os.path.exists(p) for p in base)
+        self._base_offsets_path = None if self.fresh else base[1]
+        self._blob_path = f"{path}.tmp" if self.fresh else base[0]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not self.fresh:
+            # Bỏ phần đuôi không có offsets nào trỏ tới (build trước đó crash giữa chừng) trước khi append
+            referenced = [self._base_offsets_path] + [os.path.join(os.path.dirname(path), entry["offsets"])
+                                                      for entry in read_thumbnail_manifest(path)["versions"].values()
+                                                      if os.path.join(os.path.dirname(path), entry["blob"]) == self._blob_path]
+            end = _committed_end(referenced)
+            if os.path.getsize(self._blob_path) > end:
+                os.truncate(self._blob_path, end)
+        self._file = open(self._blob_path, "wb" if self.fresh else "ab")
+        self._start = 0 if self.fresh else os.path.getsize(self._blob_path)
+        self._position = self._start
+        self._entries = []
+        self._committed = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, data):
+        self._file.write(data)
+        self._entries.append((self._position, len(data)))
+        self._position += len(data)
+
+    def add_frame(self, rgb):
+        self.add(encode_thumbnail(rgb, self.max_side, self.fmt, self.quality))
+
+    def commit(self, start_id, version=None, keep_versions=None):
+        """
+        Ghi file offsets (tmp + os.replace) cho các thumbnail đã add, bắt đầu từ vector ID start_id.
+        Gọi sau khi index đã save; version = snapshot version của index (None: file cũ không phiên bản),
+        keep_versions: các snapshot còn giữ, thumbnail của phiên bản khác (và blob không còn dùng) bị xóa.
+        """
+        self._file.close()
+        old = np.zeros((0, 2), dtype=np.int64) if self.fresh else np.load(self._base_offsets_path)
+        offsets = np.zeros((max(len(old), start_id + len(self._entries)), 2), dtype=np.int64)
+        offsets[:len(old)] = old
+        if self._entries:
+            offsets[start_id:start_id + len(self._entries)] = self._entries
+        if version is None:
+            blob_path, index_path = self.path, thumbnail_index_path(self.path)
+        else:
+            blob_path = f"{self.path}.{version}" if self.fresh else self._blob_path
+            index_path = thumbnail_index_path(f"{self.path}.{version}")
+        tmp_index_path = f"{index_path}.tmp"
+        with open(tmp_index_path, "wb") as f:
+            np.save(f, offsets)
+        if self.fresh:
+            os.replace(self._blob_path, blob_path)
+        os.replace(tmp_index_path, index_path)
+        if version is not None:
+            manifest = read_thumbnail_manifest(self.path)
+            manifest["versions"][version] = {"blob": os.path.basename(blob_path), "offsets": os.path.basename(index_path), "entries": len(offsets)}
+            _write_manifest(self.path, manifest)
+        self._committed = True
+        if version is not None and keep_versions is not None:
+            prune_thumbnails(self.path, keep_versions)
+        print(f"✅ Saved {len(self._entries)} thumbnails to {blob_path} ({self._position / 1024 / 1024:.1f} MB)")
+
+    def abort(self):
+        """Bỏ các thumbnail chưa commit (build lỗi): xóa blob tạm hoặc cắt phần đã append"""
+        self._file.close()
+        if self._committed:
+            return
+        if self.fresh:
+            if os.path.exists(self._blob_path):
+                os.remove(self._blob_path)
+        elif os.path.getsize(self._blob_path) > self._start:
+            os.truncate(self._blob_path, self._start)
+
+def _write_manifest(path, manifest):
+    tmp_path = f"{thumbnail_manifest_path(path)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, thumbnail_manifest_path(path))
+
+def prune_thumbnails(path, keep_versions):
+    """Xóa thumbnail của các snapshot đã bị prune; blob chỉ bị xóa khi không còn phiên bản nào trỏ tới"""
+    manifest = read_thumbnail_manifest(path)
+    keep = set(keep_versions)
+    dropped = {v: e for v, e in manifest["versions"].items() if v not in keep}
+    if not dropped:
+        return
+    manifest["versions"] = {v: e for v, e in manifest["versions"].items() if v in keep}
+    _write_manifest(path, manifest)
+    # Process đang mmap blob cũ vẫn đọc được sau khi file bị xóa (Linux giữ inode đến khi unmap)
+    in_use = {name for entry in manifest["versions"].values() for name in (entry["blob"], entry["offsets"])}
+    root = os.path.dirname(path)
+    for entry in dropped.values():
+        for name in (entry["blob"], entry["offsets"]):
+            if name not in in_use and os.path.exists(os.path.join(root, name)):
+                os.remove(os.path.join(root, name))
+        # Blob cũ không phiên bản (build trước khi có manifest) bị xóa thì offsets đi kèm cũng vô dụng
+        if entry["blob"] == os.path.basename(path) and entry["blob"] not in in_use and os.path.exists(thumbnail_index_path(path)):
+            os.remove(thumbnail_index_path(path))
+
+class ThumbnailStore:
+    """Đọc thumbnail theo vector ID từ file đóng gói (memory-mapped), None nếu ID không có thumbnail"""
+
+    def __init__(self, path=THUMBNAILS_PATH, offsets_path=None):
+        self.path = path
+        self.offsets = np.load(offsets_path or thumbnail_index_path(path), mmap_mode="r")
+        self._blob = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get(self, vector_id):
+        if self._blob is not None and vector_id is not None and 0 <= vector_id < len(self.offsets):
+            offset, length = self.offsets[vector_id]
+            if length > 0 and offset + length <= len(self._blob):
+                self.hits += 1
+                return bytes(self._blob[offset:offset + length])
+        self.misses += 1
+        return None
+
+    def get_stats(self):
+        return {
+            "path": self.path,
+            "entries": len(self.offsets),
+            "size_mb": round(os.path.getsize(self.path) / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses
+        }
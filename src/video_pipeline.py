@@ -0,0 +1,213 @@
+import cv2
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+from multiprocessing import Manager
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+DEFAULT_FRAME_INTERVAL_SEC = 2.0
+# CLIP resize cạnh ngắn về 224 nên không cần giữ frame full-res trong memory / khi gửi giữa các process
+DEFAULT_FRAME_SHORT_SIDE = 224
+# Decode song song: worker gửi frame về theo chunk, mỗi video tối đa QUEUE_CHUNKS chunk chờ trong queue
+FRAMES_PER_CHUNK = 32
+QUEUE_CHUNKS = 2
+# Worker kiểm tra cờ cancel sau mỗi khoảng này khi queue đầy
+CANCEL_POLL_SEC = 0.5
+# Sau khi hủy, chờ tối đa chừng này để worker thoát trước khi đóng Manager (queue/event của worker nằm ở đó)
+CANCEL_GRACE_SEC = 5.0
+
+class _Cancelled(Exception):
+    """Process chính đã hủy (consumer lỗi hoặc bỏ dở iter_videos): worker dừng decode"""
+
+# Cờ cancel của các iter_videos đang chạy. Exception không bắt ở main giữ traceback (và generator) sống tới khi
+# interpreter thoát, lúc đó concurrent.futures chờ worker trước khi finally của generator kịp chạy:
+# hook này đăng ký sau hook của concurrent.futures nên chạy trước, báo worker dừng để process thoát được
+_active_cancels = set()
+
+def _set_cancel(cancel):
+    # Manager có thể đã đóng khi interpreter thoát (hook bên dưới đã set cờ trước đó)
+    try:
+        cancel.set()
+    except (OSError, EOFError):
+        pass
+
+def _cancel_active():
+    for cancel in list(_active_cancels):
+        _set_cancel(cancel)
+
+threading._register_atexit(_cancel_active)
+
+def probe_video(video_path):
+    """Lấy thông tin video (total_frames, fps, duration), trả về None nếu không mở được"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return {
+        "total_frames": total_frames,
+        "fps": fps,
+        "duration": total_frames / fps if fps > 0 else 0
+    }
+
+def resize_short_side(image, short_side):
+    """Thu nhỏ frame để cạnh ngắn bằng short_side (không phóng to)"""
+    if not short_side:
+        return image
+    h, w = image.shape[:2]
+    scale = short_side / min(h, w)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+def iter_video_frames(video_path, interval_sec=DEFAULT_FRAME_INTERVAL_SEC, max_frames=None, short_side=None):
+    """
+    Decode video tuần tự và yield (frame_number, frame_idx, frame_time, rgb) cho các frame được sample.
+    Frame không cần thì chỉ grab() (không decode sang BGR), tránh seek theo từng frame.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = max(1, int(fps * interval_sec))
+        frame_idx = 0
+        frame_count = 0
+        while max_frames is None or frame_count < max_frames:
+            if not cap.grab():
+                break
+            if frame_idx % frame_interval == 0:
+                success, image = cap.retrieve()
+                if success:
+                    frame_time = frame_idx / fps if fps > 0 else 0
+                    image = resize_short_side(image, short_side)
+                    yield frame_count, frame_idx, frame_time, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                    frame_count += 1
+            frame_idx += 1
+    finally:
+        cap.release()
+
+def _put(frame_queue, message, cancel=None):
+    # put có timeout: queue đầy mà process chính đã hủy thì dừng thay vì chặn mãi (và giữ pool không shutdown được)
+    if cancel is None:
+        frame_queue.put(message)
+        return
+    while not cancel.is_set():
+        try:
+            frame_queue.put(message, timeout=CANCEL_POLL_SEC)
+            return
+        except queue.Full:
+            pass
+    raise _Cancelled()
+
+def decode_video_to_queue(video_path, frame_queue, interval_sec=DEFAULT_FRAME_INTERVAL_SEC, max_frames=None, short_side=None,
+                          chunk_frames=FRAMES_PER_CHUNK, cancel=None):
+    """
+    Chạy trong worker process: decode video và gửi về process chính qua frame_queue (có giới hạn) theo từng chunk
+    chunk_frames frame. Queue đầy thì worker chờ, nên video dài không bị decode hết vào memory trước khi được dùng.
+    cancel (Event, tùy chọn): được set thì worker dừng ngay cả khi queue đầy và không còn ai đọc.
+    Thứ tự message: ("info", info), ("frames", [...]) x N, ("done", None) hoặc ("error", message).
+    """
+    try:
+        info = probe_video(video_path)
+        _put(frame_queue, ("info", info), cancel)
+        if info is not None:
+            chunk = []
+            for frame in iter_video_frames(video_path, interval_sec, max_frames, short_side):
+                chunk.append(frame)
+                if len(chunk) >= chunk_frames:
+                    _put(frame_queue, ("frames", chunk), cancel)
+                    chunk = []
+            if chunk:
+                _put(frame_queue, ("frames", chunk), cancel)
+        _put(frame_queue, ("done", None), cancel)
+    except _Cancelled:
+        return
+    except Exception as e:
+        try:
+            _put(frame_queue, ("error", f"{type(e).__name__}: {e}"), cancel)
+        except _Cancelled:
+            pass
+
+def _next_message(frame_queue, future, video_path):
+    # Worker chết giữa chừng (OOM, segfault của decoder) thì không bao giờ gửi "done": kiểm tra future thay vì chờ mãi
+    while True:
+        try:
+            kind, payload = frame_queue.get(timeout=1.0)
+        except queue.Empty:
+            if future.done():
+                future.result()
+                raise RuntimeError(f"Video worker exited without finishing {video_path}")
+            continue
+        if kind == "error":
+            raise RuntimeError(f"Cannot decode {video_path}: {payload}")
+        return kind, payload
+
+def _queued_frames(frame_queue, future, video_path):
+    while True:
+        kind, payload = _next_message(frame_queue, future, video_path)
+        if kind == "done":
+            return
+        yield from payload
+
+def iter_videos(video_paths, interval_sec=DEFAULT_FRAME_INTERVAL_SEC, max_frames=None, short_side=None, workers=0,
+                chunk_frames=FRAMES_PER_CHUNK, queue_chunks=QUEUE_CHUNKS):
+    """
+    Yield (video_path, info, frames) theo đúng thứ tự video_paths; frames là iterator, phải được đọc hết trước video tiếp theo.
+    workers > 0: decode nhiều video song song trong process pool, tối đa 2 * workers video đang xử lý;
+    kết quả vẫn trả theo thứ tự input nên metadata và index IDs không phụ thuộc vào scheduling.
+    Mỗi video chỉ giữ tối đa queue_chunks chunk x chunk_frames frame chờ trong queue (+ một chunk đang gửi),
+    nên memory đỉnh ~ 2 * workers * (queue_chunks + 1) * chunk_frames frame, không phụ thuộc độ dài video
+    hay --max-frames-per-video (frame 224px cạnh ngắn ~ 0.3 MB: 8 workers ~ 0.5 GB với giá trị mặc định).
+    """
+    if workers <= 0:
+        for video_path in video_paths:
+            info = probe_video(video_path)
+            frames = iter_video_frames(video_path, interval_sec, max_frames, short_side) if info else iter(())
+            yield video_path, info, frames
+        return
+
+    with Manager() as manager:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        cancel = manager.Event()
+        _active_cancels.add(cancel)
+        remaining = iter(video_paths)
+        pending = deque()
+        submitted = []
+        finished = False
+
+        def submit_next():
+            video_path = next(remaining, None)
+            if video_path is not None:
+                frame_queue = manager.Queue(maxsize=queue_chunks)
+                future = pool.submit(decode_video_to_queue, video_path, frame_queue, interval_sec, max_frames, short_side,
+                                     chunk_frames, cancel)
+                pending.append((video_path, frame_queue, future))
+                submitted.append(future)
+
+        try:
+            # Pool chạy task theo thứ tự submit nên video đang được đọc luôn có worker, worker của các video sau
+            # chỉ bị chặn khi queue của chúng đầy
+            for _ in range(2 * workers):
+                submit_next()
+            while pending:
+                video_path, frame_queue, future = pending.popleft()
+                submit_next()
+                _, info = _next_message(frame_queue, future, video_path)
+                frames = _queued_frames(frame_queue, future, video_path)
+                yield video_path, info, frames
+                # Caller bỏ dở video thì vẫn đọc nốt để worker kết thúc và giải phóng slot
+                for _ in frames:
+                    pass
+                future.result()
+            finished = True
+        finally:
+            # Consumer raise hoặc bỏ dở generator: worker đang chờ queue đầy sẽ không bao giờ được đọc tiếp,
+            # báo chúng dừng và chỉ chờ có giới hạn (không join pool) để exception gốc được raise ngay
+            _set_cancel(cancel)
+            _active_cancels.discard(cancel)
+            pool.shutdown(wait=finished, cancel_futures=True)
+            if not finished:
+                wait_futures(submitted, timeout=CANCEL_GRACE_SEC)
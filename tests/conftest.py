@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Test import module theo package src (src.meta_store, src.api, ...) như khi chạy uvicorn src.api:app từ thư mục gốc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
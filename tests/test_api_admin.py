@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+from src import api
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def fake_reload():
+        calls.append(1)
+        return True
+
+    monkeypatch.setattr(api, "reload_indexes", fake_reload)
+    client = TestClient(api.app)
+    client.reload_calls = calls
+    return client
+
+def test_reload_is_disabled_without_admin_token(client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "")
+    for headers in ({}, {"X-Admin-Token": ""}, {"X-Admin-Token": "anything"}):
+        response = client.post("/admin/reload?wait=true", headers=headers)
+        assert response.status_code == 403
+    assert client.reload_calls == []
+
+def test_reload_requires_matching_token(client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+    assert client.post("/admin/reload?wait=true").status_code == 403
+    assert client.post("/admin/reload?wait=true", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.reload_calls == []
+    response = client.post("/admin/reload?wait=true", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200 and response.json()["status"] == "reloaded"
+    assert client.reload_calls == [1]
@@ -0,0 +1,40 @@
+import threading
+from src import api
+
+class FakeSearcher:
+    def __init__(self, name):
+        self.name = name
+
+def test_search_during_reload_does_not_poison_hit_cache(monkeypatch):
+    old, new = FakeSearcher("old"), FakeSearcher("new")
+    started, release = threading.Event(), threading.Event()
+
+    def fake_batched_search(searcher, emb, top_k):
+        if searcher is old:
+            # Search trên index cũ còn đang chạy khi reload xảy ra
+            started.set()
+            release.wait(5)
+        return [{"file": searcher.name, "distance": 0.0}] * top_k
+
+    monkeypatch.setattr(api, "batched_search", fake_batched_search)
+    api.search_hit_cache.clear()
+    in_flight = threading.Thread(target=api.cached_search, args=("text", old, "AI  và ML", None, 3))
+    in_flight.start()
+    assert started.wait(5)
+    api.bump_index_generation()
+    release.set()
+    in_flight.join(5)
+
+    results = api.cached_search("text", new, "ai và ml", None, 3)
+    assert [r["file"] for r in results] == ["new"] * 3
+    # Lần sau đọc từ cache, vẫn là kết quả của index mới
+    assert [r["file"] for r in api.cached_search("text", new, "AI và ML", None, 2)] == ["new"] * 2
+
+def test_response_cache_is_bounded_by_bytes():
+    cache = api.LRUCache(maxsize=100, maxbytes=1000)
+    for i in range(5):
+        cache.put(i, {"matched_files": [{"image_base64": "x" * 300}]})
+    assert len(cache) < 5
+    assert cache.get(4) is not None and cache.get(0) is None
+    cache.put("huge", {"image_base64": "x" * 5000})
+    assert cache.get("huge") is None
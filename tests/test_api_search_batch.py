@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from src import api
+
+class StubResults:
+    def __init__(self, name, nq, top_k):
+        self.name = name
+        self.nq = nq
+        self.top_k = top_k
+
+    def to_dicts(self, q):
+        return [{"index": self.name, "query": q, "rank": r} for r in range(self.top_k)]
+
+class StubSearcher:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    def search_batch(self, embs, top_k=5):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} is broken")
+        return StubResults(self.name, len(embs), top_k)
+
+def test_groups_by_searcher_and_trims_each_top_k():
+    text, image = StubSearcher("text"), StubSearcher("image")
+    emb = np.zeros(4, dtype=np.float32)
+    results = api.run_search_batch([(text, emb, 2), (image, emb, 1), (text, emb, 3)])
+    assert text.calls == 1 and image.calls == 1
+    assert [[(r["index"], r["query"]) for r in result] for result in results] == [
+        [("text", 0)] * 2, [("image", 0)], [("text", 1)] * 3]
+
+def test_failing_searcher_only_fails_its_own_requests():
+    healthy, broken = StubSearcher("healthy"), StubSearcher("broken", fail=True)
+    emb = np.zeros(4, dtype=np.float32)
+    results = api.run_search_batch([(healthy, emb, 2), (broken, emb, 2), (healthy, emb, 1)])
+    assert isinstance(results[1], RuntimeError)
+    assert [r["index"] for r in results[0]] == ["healthy"] * 2
+    assert [r["index"] for r in results[2]] == ["healthy"]
+
+    # Qua search_batcher: request của index lỗi nhận exception, request của index khác vẫn có kết quả
+    futures = [api.search_batcher.submit((broken, emb, 2)), api.search_batcher.submit((healthy, emb, 2))]
+    with pytest.raises(RuntimeError, match="broken"):
+        futures[0].result(5)
+    assert len(futures[1].result(5)) == 2
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import pytest
+from src.bounded_executor import BoundedExecutor, ExecutorSaturated
+
+def test_rejects_when_workers_and_queue_are_full():
+    async def scenario():
+        executor = BoundedExecutor(max_workers=1, max_queue=1)
+        release = threading.Event()
+        running = [asyncio.ensure_future(executor.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(lambda: None)
+        assert executor.get_stats()["rejected"] == 1
+        release.set()
+        assert await asyncio.gather(*running) == [True, True]
+        # Slot được trả sau khi job xong: nhận request mới bình thường
+        assert await executor.run(lambda x: x * 2, 21) == 42
+        return executor.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["in_flight"] == 0 and stats["completed"] == 3
+
+def test_slot_is_held_until_job_finishes_even_if_caller_cancels():
+    async def scenario():
+        executor = BoundedExecutor(max_workers=1, max_queue=0)
+        release = threading.Event()
+        task = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.sleep(0.01)
+        # Thread vẫn đang chạy job: chưa được nhận thêm
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(lambda: None)
+        release.set()
+        for _ in range(100):
+            if executor.get_stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return await executor.run(lambda: "ok")
+
+    assert asyncio.run(scenario()) == "ok"
+
+def test_api_returns_503_when_search_executor_is_saturated(monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from src import api
+
+    async def ready():
+        return None
+
+    executor = BoundedExecutor(max_workers=1, max_queue=0)
+    release = threading.Event()
+    # Một search đang chạy chiếm thread duy nhất của executor
+    busy = threading.Thread(target=asyncio.run, args=(executor.run(release.wait, 5),))
+    busy.start()
+    while executor.get_stats()["in_flight"] == 0:
+        busy.join(0.01)
+    monkeypatch.setattr(api, "search_executor", executor)
+    monkeypatch.setattr(api, "ensure_indexes", ready)
+    monkeypatch.setattr(api, "text_searcher", object())
+    api.response_cache.clear()
+    try:
+        response = TestClient(api.app).post("/search_text", json={"query": "quá tải", "top_k": 3})
+    finally:
+        release.set()
+        busy.join(5)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {"detail": "Server busy, please retry"}
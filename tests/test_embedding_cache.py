@@ -0,0 +1,104 @@
+import numpy as np
+from src.embedding_cache import EmbeddingCache, content_key, encode_with_cache, text_hash
+
+def key(text, model="clip", prep="v1"):
+    return content_key(model, prep, text_hash(text))
+
+def test_key_depends_on_model_and_preprocessing():
+    assert key("mèo") == key("mèo")
+    assert len({key("mèo"), key("chó"), key("mèo", model="other"), key("mèo", prep="v2")}) == 4
+
+def test_put_get_and_persist(tmp_path):
+    cache_dir = str(tmp_path / "emb")
+    cache = EmbeddingCache(cache_dir, dim=4)
+    emb = np.array([0.1, 0.2, 0.3, 0.4], dtype=np.float32)
+    assert cache.get(key("a")) is None
+    cache.put(key("a"), emb)
+    got = cache.get(key("a"))
+    assert got.dtype == np.float32
+    np.testing.assert_allclose(got, emb, atol=1e-3)
+    assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 1
+    cache.save()
+
+    reopened = EmbeddingCache(cache_dir, dim=4, readonly=True)
+    assert len(reopened) == 1
+    np.testing.assert_allclose(reopened.get(key("a")), emb, atol=1e-3)
+    # Cache readonly không ghi
+    reopened.put(key("b"), emb)
+    assert reopened.get(key("b")) is None
+
+def test_dim_mismatch_ignores_existing_cache(tmp_path):
+    cache_dir = str(tmp_path / "emb")
+    cache = EmbeddingCache(cache_dir, dim=4)
+    cache.put(key("a"), np.ones(4))
+    cache.save()
+    assert len(EmbeddingCache(cache_dir, dim=8)) == 0
+
+def test_lru_eviction_and_growth(tmp_path):
+    # max_mb nhỏ: đúng 4 entry float32 dim=4 (16 byte/entry)
+    cache = EmbeddingCache(str(tmp_path / "emb"), dim=4, dtype="float32", max_mb=64 / 1024 / 1024)
+    assert cache.max_entries == 4
+    for i in range(4):
+        cache.put(key(str(i)), np.full(4, i))
+    cache.get(key("0"))
+    cache.put(key("4"), np.full(4, 4))
+    assert len(cache) == 4
+    assert cache.get(key("1")) is None
+    np.testing.assert_array_equal(cache.get(key("0")), np.zeros(4))
+    np.testing.assert_array_equal(cache.get(key("4")), np.full(4, 4))
+
+def test_encode_with_cache_only_encodes_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb"), dim=2, dtype="float32")
+    cache.put(key("b"), np.array([2.0, 2.0]))
+    encoded = []
+
+    def encode(items):
+        items = list(items)
+        encoded.extend(items)
+        return np.array([[len(item), 0.0] for item in items], dtype=np.float32)
+
+    out = encode_with_cache(cache, [(key(t), t) for t in ("a", "b", "ccc")], encode)
+    assert encoded == ["a", "ccc"]
+    np.testing.assert_array_equal(np.asarray(out), [[1, 0], [2, 2], [3, 0]])
+    assert cache.get(key("ccc")) is not None
+
+def test_readonly_reader_sees_entries_saved_after_it_opened(tmp_path):
+    cache_dir = str(tmp_path / "emb")
+    writer = EmbeddingCache(cache_dir, dim=4)
+    reader = EmbeddingCache(cache_dir, dim=4, readonly=True)
+    assert reader.get(key("a")) is None
+    writer.put(key("a"), np.ones(4))
+    # Chưa save: reader chưa thấy key index mới
+    assert reader.get(key("a")) is None
+    writer.save()
+    np.testing.assert_array_equal(reader.get(key("a")), np.ones(4))
+    assert len(reader) == 1
+
+def test_reader_never_returns_a_slot_rewritten_for_another_key(tmp_path):
+    cache_dir = str(tmp_path / "emb")
+    writer = EmbeddingCache(cache_dir, dim=4, dtype="float32", max_mb=32 / 1024 / 1024)
+    writer.put_many([(key("a"), np.full(4, 1.0)), (key("b"), np.full(4, 2.0))])
+    writer.save()
+    reader = EmbeddingCache(cache_dir, dim=4, dtype="float32", readonly=True)
+    # Writer evict "a" và ghi "c" vào slot của nó, key index của reader vẫn trỏ "a" vào slot đó
+    writer.put(key("c"), np.full(4, 3.0))
+    assert reader.get(key("a")) is None
+    np.testing.assert_array_equal(reader.get(key("b")), np.full(4, 2.0))
+
+def test_tag_changed_during_copy_is_a_miss(tmp_path):
+    cache_dir = str(tmp_path / "emb")
+    writer = EmbeddingCache(cache_dir, dim=4)
+    writer.put(key("a"), np.ones(4))
+    writer.save()
+    reader = EmbeddingCache(cache_dir, dim=4, readonly=True)
+    reader.tags = np.array(reader.tags)
+    vectors = reader.vectors
+
+    class RewrittenDuringCopy:
+        # Mô phỏng writer xóa tag của slot đúng lúc reader đang copy vector
+        def __getitem__(self, slot):
+            reader.tags[slot] = 0
+            return vectors[slot]
+
+    reader.vectors = RewrittenDuringCopy()
+    assert reader._lookup(key("a")) is None
@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+from src.faiss_pipeline import STORAGE_INDEX_TYPES, FaissMultiModalSearch, check_storage, choose_index_type
+from src.snapshot import IndexConsistencyError, current_version, list_versions, read_manifest
+
+DIM = 32
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+def metas(n):
+    return [{"file": f"f{i % 10}.txt", "line": i} for i in range(n)]
+
+def make_searcher(tmp_path, n=300, **kwargs):
+    kwargs.setdefault("index_type", "flat")
+    searcher = FaissMultiModalSearch(dim=DIM, index_path=str(tmp_path / "index.bin"), meta_path=str(tmp_path / "index.pkl"), **kwargs)
+    embs = vectors(n)
+    searcher.train(embs)
+    searcher.add_batch(embs, metas(n))
+    return searcher
+
+def test_search_batch_matches_per_query_search(tmp_path):
+    searcher = make_searcher(tmp_path)
+    queries = vectors(5, seed=1)
+    batch = searcher.search_batch(queries, top_k=7)
+    assert batch.ids.shape == (5, 7)
+    for q, emb in enumerate(queries):
+        single = searcher.search(emb, top_k=7)
+        assert [r["id"] for r in single] == [r["id"] for r in batch.to_dicts(q)]
+        np.testing.assert_allclose([r["distance"] for r in single], [r["distance"] for r in batch.to_dicts(q)], rtol=1e-5)
+        assert single[0]["file"] == f"f{single[0]['id'] % 10}.txt"
+    # Query dạng vector 1 chiều và distance cosine tăng dần
+    distances = [r["distance"] for r in searcher.search(queries[0], top_k=7)]
+    assert distances == sorted(distances)
+
+def reload(tmp_path, **kwargs):
+    searcher = FaissMultiModalSearch(dim=DIM, index_path=str(tmp_path / "index.bin"), meta_path=str(tmp_path / "index.pkl"), **kwargs)
+    searcher.load()
+    return searcher
+
+@pytest.mark.parametrize("index_type, param, value", [("ivf_flat", "nprobe", 7), ("hnsw", "ef_search", 123)])
+def test_search_param_saved_in_index_survives_reload(tmp_path, index_type, param, value):
+    searcher = make_searcher(tmp_path, index_type=index_type, nlist=10, **{param: value})
+    searcher.save()
+    # Không truyền tham số: dùng giá trị đã lưu trong file thay vì mặc định tính theo nlist
+    assert getattr(reload(tmp_path), param) == value
+    assert getattr(reload(tmp_path, **{param: 3}), param) == 3
+
+def test_new_ivf_index_gets_default_nprobe(tmp_path):
+    searcher = FaissMultiModalSearch(dim=DIM, index_path=str(tmp_path / "index.bin"), meta_path=str(tmp_path / "index.pkl"),
+                                     index_type="ivf_flat", nlist=100)
+    assert searcher.nprobe == 16
+
+def test_lookups_after_remove_ids_use_the_meta_store(tmp_path):
+    make_searcher(tmp_path, use_id_map=True).save()
+    searcher = reload(tmp_path)
+    removed = searcher.ids_by_file("f3.txt")
+    assert removed == list(range(3, 300, 10))
+    assert searcher.remove_ids(removed) == len(removed)
+    assert searcher.ids_by_file("f3.txt") == []
+    assert searcher.live_count() == searcher.ntotal == 270
+
+    # Vector của một row đã xóa không còn được trả về, metadata các row khác giữ nguyên ID
+    results = searcher.search(vectors(300)[3], top_k=20)
+    assert all(r["file"] != "f3.txt" for r in results)
+    assert all(r["line"] == r["id"] for r in results)
+
+    searcher.add_batch(vectors(1, seed=9), [{"file": "new.txt", "line": 300}])
+    searcher.save()
+    reloaded = reload(tmp_path)
+    assert reloaded.meta[3] is None
+    assert reloaded.ids_by_file("new.txt") == [300]
+    assert reloaded.live_count() == reloaded.ntotal == 271
+    assert reloaded.search(vectors(1, seed=9)[0], top_k=1)[0]["file"] == "new.txt"
+
+ROUND_TRIPS = [(index_type, storage) for storage, types in STORAGE_INDEX_TYPES.items() for index_type in types]
+
+@pytest.mark.parametrize("index_type, storage", ROUND_TRIPS, ids=[f"{t}-{s}" for t, s in ROUND_TRIPS])
+def test_index_type_and_storage_round_trip(tmp_path, index_type, storage):
+    searcher = make_searcher(tmp_path, n=600, index_type=index_type, storage=storage, nlist=8, pq_m=4, use_id_map=True)
+    searcher.save()
+    # Cặp được map: ivf_pq luôn lưu code PQ, IVF + OPQ là ivf_pq
+    expected = {("ivf_pq", "float32"): ("ivf_pq", "pq"), ("ivf_flat", "opq_pq"): ("ivf_pq", "opq_pq")}.get((index_type, storage), (index_type, storage))
+    assert (searcher.index_type, searcher.storage) == expected
+    for load_mode in ("memory", "mmap"):
+        loaded = reload(tmp_path, load_mode=load_mode)
+        assert (loaded.index_type, loaded.storage) == expected
+        assert loaded.ntotal == loaded.live_count() == 600
+        assert len(loaded.search(vectors(600)[5], top_k=5)) == 5
+
+@pytest.mark.parametrize("storage", ["sq8", "opq_pq"])
+def test_rerank_with_stored_vectors_returns_exact_distances(tmp_path, storage):
+    make_searcher(tmp_path, n=600, storage=storage, pq_m=4, store_vectors=True).save()
+    loaded = reload(tmp_path, rerank_factor=4)
+    assert loaded.vectors is not None and loaded.vectors.shape == (600, DIM)
+    query = vectors(600)[42]
+    results = loaded.search(query, top_k=5)
+    assert results[0]["id"] == 42
+    assert abs(results[0]["distance"]) < 1e-5
+    # Distance sau re-rank là cosine chính xác tính từ vector gốc
+    exact = vectors(600) / np.linalg.norm(vectors(600), axis=1, keepdims=True)
+    expected = 1.0 - exact[[r["id"] for r in results]] @ (query / np.linalg.norm(query))
+    np.testing.assert_allclose([r["distance"] for r in results], expected, atol=1e-5)
+
+@pytest.mark.parametrize("num_vectors", [100, 50_000, 500_000, 2_000_000])
+@pytest.mark.parametrize("storage", list(STORAGE_INDEX_TYPES))
+def test_auto_index_type_is_compatible_with_storage(num_vectors, storage):
+    index_type = choose_index_type(num_vectors, storage)
+    check_storage(index_type, storage)
+    if storage == "float32":
+        assert index_type == choose_index_type(num_vectors)
+
+def test_incompatible_pair_is_rejected():
+    with pytest.raises(ValueError, match="sq8"):
+        check_storage("ivf_pq", "sq8")
+    with pytest.raises(ValueError, match="hnsw"):
+        FaissMultiModalSearch(dim=DIM, index_type="hnsw", storage="pq")
+    check_storage("auto", "pq")
+
+def test_snapshot_round_trip_and_rollback(tmp_path):
+    searcher = make_searcher(tmp_path, use_id_map=True, snapshots=True, model_name="clip-a")
+    assert searcher.save_snapshot() == "v000001"
+    searcher.add_batch(vectors(1, seed=5), [{"file": "new.txt", "line": 300}])
+    searcher.save()
+    assert list_versions(searcher.index_path) == ["v000001", "v000002"]
+    assert reload(tmp_path, model_name="clip-a").ntotal == 301
+    old = FaissMultiModalSearch(dim=DIM, index_path=searcher.index_path, meta_path=searcher.meta_path)
+    old.load_snapshot("v000001")
+    assert old.ntotal == old.live_count() == 300 and old.snapshot_version == "v000001"
+
+@pytest.mark.parametrize("kwargs, message", [({"model_name": "clip-b"}, "built with clip-a"), ({"dim": 64}, "dim")])
+def test_load_snapshot_rejects_model_or_dim_mismatch(tmp_path, kwargs, message):
+    make_searcher(tmp_path, snapshots=True, model_name="clip-a").save()
+    options = dict(dim=DIM, index_path=str(tmp_path / "index.bin"), meta_path=str(tmp_path / "index.pkl"))
+    options.update(kwargs)
+    with pytest.raises(IndexConsistencyError, match=message):
+        FaissMultiModalSearch(**options).load()
+
+def test_load_snapshot_rejects_files_that_do_not_match_the_manifest(tmp_path):
+    searcher = make_searcher(tmp_path, snapshots=True)
+    searcher.save()
+    manifest = read_manifest(searcher.index_path)
+    index_file = tmp_path / "index.snapshots" / current_version(searcher.index_path) / "index.bin"
+    with open(index_file, "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(IndexConsistencyError, match=f"manifest says {manifest['files']['index.bin']['size']}"):
+        reload(tmp_path)
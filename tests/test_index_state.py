@@ -0,0 +1,36 @@
+import os
+from src.index_state import diff_sources, load_state, save_state
+
+def write(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data)
+    return str(path)
+
+def test_diff_sources(tmp_path):
+    paths = {"a": write(tmp_path / "a.txt", "aaa"), "b": write(tmp_path / "b.txt", "bbb")}
+    added, changed, removed, fingerprints = diff_sources(paths, None)
+    assert (added, changed, removed) == (["a", "b"], [], [])
+
+    # Chỉ đổi mtime, cùng nội dung: không tính là changed
+    st = os.stat(paths["a"])
+    os.utime(paths["a"], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    write(tmp_path / "b.txt", "bbbb")
+    paths["c"] = write(tmp_path / "c.txt", "ccc")
+    previous = dict(fingerprints, old={"size": 1, "mtime_ns": 0, "sha256": "x"})
+    added, changed, removed, fingerprints = diff_sources(paths, previous)
+    assert (added, changed, removed) == (["c"], ["b"], ["old"])
+    assert set(fingerprints) == {"a", "b", "c"}
+
+def test_unchanged_stat_reuses_previous_hash(tmp_path):
+    path = write(tmp_path / "a.txt", "aaa")
+    st = os.stat(path)
+    previous = {"a": {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": "cached"}}
+    added, changed, removed, fingerprints = diff_sources({"a": path}, previous)
+    assert fingerprints["a"]["sha256"] == "cached"
+    assert (added, changed, removed) == ([], [], [])
+
+def test_state_round_trip(tmp_path):
+    path = str(tmp_path / "state.json")
+    assert load_state(path) == {}
+    save_state({"sources": {"a": 1}, "note": "chỉ mục"}, path)
+    assert load_state(path) == {"sources": {"a": 1}, "note": "chỉ mục"}
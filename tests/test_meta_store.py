@@ -0,0 +1,52 @@
+import numpy as np
+from src.meta_store import MetaStore
+
+ROWS = [
+    {"file": "a.jpg", "frame_number": 1, "frame_time": 0.5},
+    {"file": "b.jpg", "frame_number": 2, "frame_time": 1.0},
+    {"file": "a.jpg", "frame_number": 3, "frame_time": 1.5, "text": "xin chào"},
+]
+
+def saved_store(tmp_path):
+    path = str(tmp_path / "index.meta")
+    MetaStore(ROWS).save(path)
+    return MetaStore.open(path), path
+
+def test_round_trip_keeps_rows_and_missing_fields(tmp_path):
+    store, _ = saved_store(tmp_path)
+    assert len(store) == 3
+    assert list(store) == ROWS
+    assert "text" not in store[0]
+    assert store.get_value(2, "text") == "xin chào"
+    assert store.get_value(0, "text", "-") == "-"
+
+def test_remove_and_tail_rows(tmp_path):
+    store, path = saved_store(tmp_path)
+    store[1] = None
+    store.append({"file": "c.jpg", "frame_number": 4, "frame_time": 2.0})
+    store.append(None)
+    assert store[1] is None
+    assert [store.is_alive(i) for i in range(-1, 6)] == [False, True, False, True, True, False, False]
+    assert store.get_value(1, "file") is None
+    assert store.live_count() == 3
+    assert store.live_ids().tolist() == [0, 2, 3]
+    assert store.find_rows("file", "a.jpg") == [0, 2]
+    assert store.find_rows("file", "b.jpg") == []
+    assert store.find_rows("frame_number", 4) == [3]
+
+    # Sau save/open, row đã remove vẫn là None và ID không đổi
+    store.save(path)
+    reopened = MetaStore.open(path)
+    assert len(reopened) == 5
+    assert reopened[1] is None and reopened[4] is None
+    assert reopened[3]["file"] == "c.jpg"
+    assert isinstance(reopened.live_ids(), np.ndarray)
+    assert reopened.live_ids().tolist() == [0, 2, 3]
+
+def test_mixed_int_float_column_becomes_float(tmp_path):
+    store, path = saved_store(tmp_path)
+    store.append({"file": "d.jpg", "frame_number": 5.5})
+    store.save(path)
+    reopened = MetaStore.open(path)
+    assert reopened[3]["frame_number"] == 5.5
+    assert reopened[0]["frame_number"] == 1
@@ -0,0 +1,78 @@
+import threading
+import pytest
+from src.micro_batcher import MicroBatcher
+
+def test_concurrent_requests_share_one_batch():
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def batch_fn(payloads):
+        calls.append(list(payloads))
+        started.set()
+        release.wait(5)
+        return [p * 10 for p in payloads]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=50)
+    first = batcher.submit(0)
+    # Batch đầu đang chạy: các request đến trong lúc đó được gom vào batch sau, tối đa max_batch_size
+    assert started.wait(5)
+    futures = [batcher.submit(i) for i in range(1, 6)]
+    release.set()
+    assert first.result(5) == 0
+    assert [f.result(5) for f in futures] == [10, 20, 30, 40, 50]
+    assert calls == [[0], [1, 2, 3, 4], [5]]
+    assert batcher.get_stats()["batches"] == 3 and batcher.get_stats()["items"] == 6
+
+def test_single_request_waits_at_most_max_wait():
+    batcher = MicroBatcher(lambda payloads: [p + 1 for p in payloads], max_batch_size=8, max_wait_ms=1)
+    assert batcher(1, timeout=5) == 2
+
+def test_batch_error_fails_every_request_and_batcher_keeps_running():
+    def batch_fn(payloads):
+        if "bad" in payloads:
+            raise ValueError("encode failed")
+        return payloads
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(p) for p in ("a", "bad", "c")]
+    for future in futures:
+        with pytest.raises(ValueError, match="encode failed"):
+            future.result(5)
+    assert batcher("ok", timeout=5) == "ok"
+
+def test_wrong_number_of_results_fails_the_batch():
+    batcher = MicroBatcher(lambda payloads: payloads[:-1], max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="2 results for 3 inputs"):
+            future.result(5)
+
+def test_cancelled_request_is_not_sent_to_batch_fn():
+    seen = []
+    started, release = threading.Event(), threading.Event()
+
+    def batch_fn(payloads):
+        seen.extend(payloads)
+        started.set()
+        release.wait(5)
+        return payloads
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=1)
+    blocker = batcher.submit("first")
+    assert started.wait(5)
+    cancelled = batcher.submit("cancelled")
+    assert cancelled.cancel()
+    kept = batcher.submit("kept")
+    release.set()
+    assert blocker.result(5) == "first" and kept.result(5) == "kept"
+    assert seen == ["first", "kept"]
+
+def test_exception_result_fails_only_its_request():
+    def batch_fn(payloads):
+        return [ValueError(p) if p.startswith("bad") else p for p in payloads]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+    ok, bad = batcher.submit("ok"), batcher.submit("bad index")
+    assert ok.result(5) == "ok"
+    with pytest.raises(ValueError, match="bad index"):
+        bad.result(5)
@@ -0,0 +1,21 @@
+from src.multi_search import merge_results
+
+def hits(*distances):
+    return [{"id": i, "distance": d} for i, d in enumerate(distances)]
+
+def test_merge_orders_by_distance_with_source_priority_on_ties():
+    merged = merge_results([("text", hits(0.1, 0.5)), ("image", hits(0.1, 0.3))])
+    assert [(name, r["distance"]) for name, r in merged] == [("text", 0.1), ("image", 0.1), ("image", 0.3), ("text", 0.5)]
+
+def test_merge_top_k_quotas_and_dedup():
+    lists = [("text", hits(0.1, 0.2, 0.3)), ("image", hits(0.15, 0.25))]
+    assert len(merge_results(lists, top_k=2)) == 2
+    merged = merge_results(lists, quotas={"text": 1})
+    assert [name for name, _ in merged] == ["text", "image", "image"]
+    # Cùng id ở hai nguồn chỉ giữ kết quả gần nhất
+    merged = merge_results(lists, dedup_key=lambda name, r: r["id"])
+    assert [(name, r["id"]) for name, r in merged] == [("text", 0), ("text", 1), ("text", 2)]
+
+def test_missing_distance_sorts_last():
+    merged = merge_results([("a", [{"distance": None}]), ("b", hits(0.9))])
+    assert [name for name, _ in merged] == ["b", "a"]
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from src.image_pipeline import TorchClipEncoder, load_clip
+from src.onnx_backend import (ONNX_DIR, PARITY_TEXTS, PARITY_THRESHOLD, OnnxClipEncoder, _cosine, _embed,
+                              onnx_model_paths)
+
+def fixed_images():
+    # Input cố định, không phụ thuộc data/images: ảnh ngẫu nhiên theo seed + ảnh gradient + ảnh đen
+    rng = np.random.default_rng(0)
+    gradient = np.broadcast_to(np.linspace(0, 255, 224, dtype=np.uint8)[None, :, None], (224, 224, 3)).copy()
+    return [rng.integers(0, 256, size=(256, 320, 3), dtype=np.uint8), gradient, np.zeros((224, 224, 3), dtype=np.uint8)]
+
+@pytest.fixture(scope="module")
+def torch_embeddings():
+    return _embed(TorchClipEncoder(load_clip()[0]), PARITY_TEXTS, fixed_images())
+
+@pytest.fixture(params=[False, True], ids=["fp32", "int8"])
+def onnx_encoder(request):
+    # Skip trước khi load CLIP torch nếu chưa export model
+    if not all(os.path.exists(path) for path in onnx_model_paths(ONNX_DIR, request.param)):
+        pytest.skip(f"No exported ONNX model in {ONNX_DIR}, run: python src/onnx_backend.py export --quantize")
+    return OnnxClipEncoder(ONNX_DIR, request.param)
+
+def test_onnx_matches_torch(onnx_encoder, torch_embeddings):
+    onnx_text, onnx_image = _embed(onnx_encoder, PARITY_TEXTS, fixed_images())
+    torch_text, torch_image = torch_embeddings
+    assert _cosine(torch_text, onnx_text).min() >= PARITY_THRESHOLD
+    assert _cosine(torch_image, onnx_image).min() >= PARITY_THRESHOLD
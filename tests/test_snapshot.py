@@ -0,0 +1,55 @@
+import os
+import pytest
+from src.snapshot import (IndexConsistencyError, commit_snapshot, current_snapshot_dir, current_version, list_versions,
+                          new_snapshot_dir, read_manifest, snapshot_files, verify_snapshot)
+
+def write_snapshot(index_path, payload, keep=3):
+    tmp_dir = new_snapshot_dir(index_path)
+    index_file, meta_file = snapshot_files(tmp_dir)
+    with open(index_file, "wb") as f:
+        f.write(payload)
+    with open(meta_file, "wb") as f:
+        f.write(b"meta")
+    return commit_snapshot(index_path, tmp_dir, {"count": 1, "dim": 4}, keep=keep)
+
+def test_commit_moves_current_and_prunes(tmp_path):
+    index_path = str(tmp_path / "faiss_image.bin")
+    assert current_version(index_path) is None
+    assert write_snapshot(index_path, b"v1") == "v000001"
+    for payload in (b"v2", b"v3"):
+        write_snapshot(index_path, payload, keep=2)
+    assert current_version(index_path) == "v000003"
+    assert list_versions(index_path) == ["v000002", "v000003"]
+    manifest = read_manifest(index_path)
+    assert manifest["count"] == 1 and manifest["version"] == "v000003"
+    assert set(manifest["files"]) == {"index.bin", "index.pkl"}
+    # Không còn thư mục tạm sau khi commit
+    assert not [name for name in os.listdir(os.path.dirname(current_snapshot_dir(index_path))) if name.startswith(".tmp-")]
+    verify_snapshot(current_snapshot_dir(index_path), manifest, checksums=True)
+
+def test_verify_detects_size_checksum_and_missing_file(tmp_path):
+    index_path = str(tmp_path / "faiss_image.bin")
+    write_snapshot(index_path, b"abcd")
+    snapshot_dir, manifest = current_snapshot_dir(index_path), read_manifest(index_path)
+    index_file, meta_file = snapshot_files(snapshot_dir)
+
+    # Cùng kích thước nhưng khác nội dung: chỉ checksums=True mới phát hiện
+    with open(index_file, "wb") as f:
+        f.write(b"abce")
+    verify_snapshot(snapshot_dir, manifest)
+    with pytest.raises(IndexConsistencyError, match="Checksum"):
+        verify_snapshot(snapshot_dir, manifest, checksums=True)
+
+    with open(index_file, "ab") as f:
+        f.write(b"x")
+    with pytest.raises(IndexConsistencyError, match="bytes"):
+        verify_snapshot(snapshot_dir, manifest)
+
+    with open(index_file, "wb") as f:
+        f.write(b"abcd")
+    os.remove(meta_file)
+    with pytest.raises(IndexConsistencyError, match="missing"):
+        verify_snapshot(snapshot_dir, manifest)
+
+    with pytest.raises(IndexConsistencyError, match="format"):
+        verify_snapshot(snapshot_dir, dict(manifest, format=99))
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+from src.thumbnail_store import (ThumbnailStore, ThumbnailWriter, encode_thumbnail, read_thumbnail_manifest, thumbnail_files,
+                                 thumbnail_media_type)
+
+def write(path, items, start_id=0, fresh=True, **commit_kwargs):
+    writer = ThumbnailWriter(path, fresh=fresh, base_version=commit_kwargs.pop("base_version", None))
+    for data in items:
+        writer.add(data)
+    writer.commit(start_id, **commit_kwargs)
+
+def store(path, version=None):
+    files = thumbnail_files(path, version)
+    return None if files is None else ThumbnailStore(files[0], files[1])
+
+def test_unversioned_commit_and_incremental_append(tmp_path):
+    path = str(tmp_path / "faiss_image.thumbs")
+    write(path, [b"a0", b"a1", b"a2"])
+    write(path, [b"b3", b"b4"], start_id=3, fresh=False)
+    thumbs = store(path)
+    assert [thumbs.get(i) for i in range(5)] == [b"a0", b"a1", b"a2", b"b3", b"b4"]
+    assert thumbs.get(5) is None and thumbs.get(-1) is None and thumbs.get(None) is None
+    assert thumbs.get_stats()["hits"] == 5 and thumbs.get_stats()["misses"] == 3
+
+def test_versions_follow_index_snapshots_and_are_pruned(tmp_path):
+    path = str(tmp_path / "faiss_image.thumbs")
+    write(path, [b"v1-0", b"v1-1"], version="v000001", keep_versions=["v000001"])
+    write(path, [b"v2-2"], start_id=2, fresh=False, base_version="v000001", version="v000002",
+          keep_versions=["v000001", "v000002"])
+    # Rollback về v000001 chỉ thấy thumbnail của snapshot đó, dù blob dùng chung
+    assert len(store(path, "v000001")) == 2 and store(path, "v000001").get(2) is None
+    assert store(path, "v000002").get(2) == b"v2-2"
+    assert store(path, "v000002").get(0) == b"v1-0"
+    assert store(path, "v000009") is None
+
+    v1_offsets = thumbnail_files(path, "v000001")[1]
+    write(path, [b"v3-0"], version="v000003", keep_versions=["v000002", "v000003"])
+    assert set(read_thumbnail_manifest(path)["versions"]) == {"v000002", "v000003"}
+    assert not os.path.exists(v1_offsets)
+    shared_blob = thumbnail_files(path, "v000002")[0]
+    assert os.path.exists(shared_blob)
+    write(path, [b"v4-0"], version="v000004", keep_versions=["v000003", "v000004"])
+    # Blob không còn phiên bản nào trỏ tới thì bị xóa
+    assert not os.path.exists(shared_blob)
+    assert store(path, "v000004").get(0) == b"v4-0"
+
+def test_abort_discards_uncommitted_thumbnails(tmp_path):
+    path = str(tmp_path / "faiss_image.thumbs")
+    writer = ThumbnailWriter(path, fresh=True)
+    writer.add(b"x")
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+    write(path, [b"a0"])
+    size = os.path.getsize(path)
+    writer = ThumbnailWriter(path, fresh=False)
+    writer.add(b"never committed")
+    writer.abort()
+    assert os.path.getsize(path) == size
+    assert store(path).get(0) == b"a0"
+
+def test_new_writer_trims_bytes_left_by_a_crashed_build(tmp_path):
+    path = str(tmp_path / "faiss_image.thumbs")
+    write(path, [b"a0"])
+    crashed = ThumbnailWriter(path, fresh=False)
+    crashed.add(b"orphan bytes")
+    crashed._file.close()
+    assert os.path.getsize(path) > 2
+    write(path, [b"b1"], start_id=1, fresh=False)
+    assert os.path.getsize(path) == 4
+    assert [store(path).get(i) for i in range(2)] == [b"a0", b"b1"]
+
+def test_encode_thumbnail_limits_size_and_detects_format():
+    cv2 = pytest.importorskip("cv2")
+    rgb = np.random.default_rng(0).integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+    jpg = encode_thumbnail(rgb, max_side=160)
+    assert thumbnail_media_type(jpg) == "image/jpeg"
+    assert cv2.imdecode(np.frombuffer(jpg, np.uint8), cv2.IMREAD_COLOR).shape == (120, 160, 3)
+    assert thumbnail_media_type(encode_thumbnail(rgb, fmt="webp")) == "image/webp"
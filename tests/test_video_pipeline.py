@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+from src.video_pipeline import iter_videos
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="module")
+def videos(tmp_path_factory):
+    # 3 video ngắn 10 fps: 30, 20, 10 frame, mỗi frame có màu khác nhau để kiểm tra thứ tự
+    root = tmp_path_factory.mktemp("videos")
+    paths = []
+    for n, frames in enumerate((30, 20, 10)):
+        path = str(root / f"v{n}.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+        for i in range(frames):
+            writer.write(np.full((48, 64, 3), (n * 80 + i * 2) % 256, dtype=np.uint8))
+        writer.release()
+        paths.append(path)
+    return paths
+
+def collect(paths, **kwargs):
+    return [(path, info["total_frames"], [(f[0], f[1], round(f[2], 3), f[3].shape) for f in frames])
+            for path, info, frames in iter_videos(paths, interval_sec=0.5, **kwargs)]
+
+def test_workers_match_sequential_order(videos):
+    sequential = collect(videos)
+    assert [len(frames) for _, _, frames in sequential] == [6, 4, 2]
+    assert collect(videos, workers=2, chunk_frames=1, queue_chunks=1) == sequential
+
+def test_caller_may_skip_frames(videos):
+    # Không đọc frames của video đầu: video sau vẫn đúng
+    results = []
+    for n, (path, info, frames) in enumerate(iter_videos(videos, interval_sec=0.5, workers=1, chunk_frames=1, queue_chunks=1)):
+        if n:
+            results.append((path, sum(1 for _ in frames)))
+    assert results == [(videos[1], 4), (videos[2], 2)]
+
+@pytest.mark.parametrize("mode", ["raise", "close"])
+def test_abandoned_consumer_does_not_hang(videos, mode):
+    # Chạy trong subprocess có timeout (như build trong main()): lỗi cũ là treo mãi vì worker chặn trên queue đầy
+    script = f"""
+from src.video_pipeline import iter_videos
+
+def main():
+    gen = iter_videos({videos!r}, interval_sec=0.1, workers=1, chunk_frames=1, queue_chunks=1)
+    for path, info, frames in gen:
+        next(frames)
+        if {mode!r} == "close":
+            gen.close()
+            print("closed")
+            return
+        raise ValueError("encode failed")
+
+main()
+"""
+    proc = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    if mode == "close":
+        assert proc.returncode == 0, proc.stderr
+        assert proc.stdout.strip() == "closed"
+        assert not proc.stderr
+    else:
+        assert proc.returncode == 1
+        assert "ValueError: encode failed" in proc.stderr
+        # Worker dừng sạch, không có traceback nào khác ngoài exception gốc
+        assert proc.stderr.count("Traceback") == 1